@@ -1,15 +1,28 @@
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from .config import Config
-from .extensions import db, cors
+from .extensions import db, cors, visual_index, embedding_store, password_hasher, limiter, compressor
 
 
 
-def create_app():
+def create_app(config_overrides=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if config_overrides:
+        app.config.update(config_overrides)
+
+    # client addresses (rate limits) from X-Forwarded-For when behind trusted proxies
+    if app.config["PROXY_FIX_X_FOR"]:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_X_FOR"])
 
     # init extensions
+    from . import database
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", database.engine_options(app.config))
     db.init_app(app)
+    database.init_app(app)
+    password_hasher.init_app(app)
+    limiter.init_app(app)
+    compressor.init_app(app)
 
     cors.init_app(
         app,
@@ -48,10 +61,36 @@ def create_app():
     app.register_blueprint(admin_bp)
     app.register_blueprint(payments_bp)
 
+    # request/DB metrics and /metrics, Server-Timing and opt-in profiles, query budgets
+    from . import monitoring, profiling, query_guard
+    monitoring.init_app(app)
+    profiling.init_app(app)
+    query_guard.init_app(app)
+
 
 
     # create tables
-    with app.app_context():
+    with app.app_context(), database.schema_lock(db.engine):
         db.create_all()
+        from .migrations import upgrade_schema
+        upgrade_schema()
+
+    # memory-map the visual similarity index (built by the first upload/delete if missing)
+    visual_index.init_app(app)
+    embedding_store.init_app(app)
+
+    from .commands import register_commands
+    register_commands(app)
+
+    # background maintenance
+    from .jobs import schedule_daily, schedule_interval
+    from .recommendation_store import rebuild_all
+    schedule_daily(app, "rebuild-recommendations", app.config["RECOMMENDATION_REBUILD_HOUR"], rebuild_all)
+    from .reservations import expire_stale
+    schedule_interval(app, "expire-reservations", app.config["RESERVATION_SWEEP_INTERVAL"], expire_stale)
+    from .payment_events import apply_payment_events
+    schedule_interval(app, "apply-payment-events", app.config["PAYMENT_EVENTS_INTERVAL"], apply_payment_events)
+    if database.uses_sqlite(app.config) and app.config["SQLITE_TUNED"]:
+        schedule_interval(app, "checkpoint-wal", app.config["SQLITE_CHECKPOINT_INTERVAL"], database.checkpoint_wal)
 
     return app
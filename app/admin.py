@@ -1,9 +1,11 @@
 import os
 from flask import Blueprint, request, jsonify, render_template_string
 
+from .extensions import limiter
 from .models import Artwork
 from .auth import login_required, get_current_user
 from .config import basedir
+from .query_guard import query_budget
 
 admin_bp = Blueprint("admin", __name__)
 
@@ -46,6 +48,7 @@ def _artworks_query_for_user(user):
 # /admin/populate
 # ---------------------------
 @admin_bp.route("/admin/populate", methods=["GET", "POST"])
+@limiter.limit("populate", methods=("POST",))
 def populate_gallery():
     if request.method == "GET":
         # Count existing artworks and images in data folder
@@ -239,6 +242,7 @@ def populate_gallery():
 # /database
 # ---------------------------
 @admin_bp.route("/database")
+@query_budget(2)
 def view_database():
     artworks = Artwork.query.all()
     return render_template_string(
@@ -290,6 +294,7 @@ def view_database():
 # /admin
 # ---------------------------
 @admin_bp.route("/admin")
+@query_budget(3)
 @login_required
 def admin_page():
     user = get_current_user()
@@ -0,0 +1,305 @@
+"""
+Approximate nearest-neighbour index over per-artwork visual feature vectors.
+
+Each artwork is represented by its normalised 64x64 RGB histogram. Vectors are
+hashed with random-projection LSH (several tables of sign bits) so a query only
+touches the artworks that share a bucket with it, instead of the whole catalog.
+The shortlist is re-ranked with the exact histogram intersection, and the
+recommendation scorer re-ranks that again with its weighted signals.
+
+The index, including its bucket tables and id map, is published through
+`feature_store.SharedArrays`, so every worker maps the same read-only pages and
+nothing is rebuilt per worker.
+"""
+
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+from .feature_store import SharedArrays, build_id_map, row_for, rows_for
+from .profiling import timed
+
+HISTOGRAM_SIZE = (64, 64)
+FEATURE_DIM = 768  # 3 channels x 256 bins
+
+
+@timed("decode")
+def visual_feature_vector(image_bytes, size=HISTOGRAM_SIZE):
+    """Normalised RGB histogram of an image as a float32 vector (sums to 1)."""
+    try:
+        img = Image.open(io.BytesIO(image_bytes)).convert("RGB").resize(size)
+    except Exception:
+        return None
+    vec = np.asarray(img.histogram(), dtype=np.float32)
+    total = vec.sum()
+    if total <= 0:
+        return None
+    return vec / total
+
+
+def histogram_similarity(query, vectors):
+    """Histogram intersection of `query` against one vector or a matrix of rows."""
+    return np.minimum(vectors, query).sum(axis=-1)
+
+
+class RandomProjectionLSH:
+    """Multi-table sign-random-projection index held entirely in NumPy arrays."""
+
+    # Stored arrays; bucket_order/bucket_codes/id_sorted/id_order are derived by
+    # the writer so readers only ever map them.
+    ARRAYS = ("ids", "vectors", "codes", "planes", "mean",
+              "bucket_order", "bucket_codes", "id_sorted", "id_order")
+
+    def __init__(self, dim=FEATURE_DIM, num_tables=8, num_bits=12, seed=0):
+        if num_bits > 62:
+            raise ValueError("num_bits must fit in a signed 64-bit bucket code")
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((num_tables, num_bits, dim)).astype(np.float32)
+        self.mean = np.full(dim, 1.0 / dim, dtype=np.float32)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.codes = np.empty((0, num_tables), dtype=np.int64)
+        self._finalize()
+
+    @property
+    def num_tables(self):
+        return self.planes.shape[0]
+
+    @property
+    def num_bits(self):
+        return self.planes.shape[1]
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ---- hashing ----
+    def _projections(self, vectors):
+        centered = np.atleast_2d(vectors) - self.mean
+        # (n, tables, bits)
+        return np.einsum("nd,tbd->ntb", centered, self.planes, optimize=True)
+
+    def _pack(self, bits):
+        weights = (1 << np.arange(self.num_bits, dtype=np.int64))
+        return (bits.astype(np.int64) * weights).sum(axis=-1)
+
+    def hash(self, vectors):
+        return self._pack(self._projections(vectors) > 0)
+
+    def _finalize(self):
+        # Per table: row positions sorted by bucket code, so a bucket is a
+        # contiguous slice found with searchsorted (no Python dicts per worker).
+        self.bucket_order = np.argsort(self.codes, axis=0, kind="stable").T
+        self.bucket_codes = np.take_along_axis(self.codes, self.bucket_order.T, axis=0).T
+        self.id_sorted, self.id_order = build_id_map(self.ids)
+
+    # ---- building / mutation ----
+    def fit(self, ids, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.planes.shape[2])
+        if len(vectors):
+            self.mean = vectors.mean(axis=0).astype(np.float32)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vectors = vectors
+        self.codes = self.hash(vectors) if len(vectors) else self.codes[:0]
+        self._finalize()
+        return self
+
+    def add(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        keep = ~np.isin(self.ids, ids)
+        self.ids = np.concatenate([self.ids[keep], ids])
+        self.vectors = np.concatenate([self.vectors[keep], vectors])
+        self.codes = np.concatenate([self.codes[keep], self.hash(vectors)])
+        self._finalize()
+
+    def remove(self, ids):
+        keep = ~np.isin(self.ids, np.asarray(ids, dtype=np.int64).ravel())
+        if keep.all():
+            return False
+        self.ids = self.ids[keep]
+        self.vectors = self.vectors[keep]
+        self.codes = self.codes[keep]
+        self._finalize()
+        return True
+
+    def vector_for(self, artwork_id):
+        row = row_for(self.id_sorted, self.id_order, artwork_id)
+        return None if row is None else self.vectors[row]
+
+    def similarities(self, query, artwork_ids):
+        """Histogram intersection of `query` with each artwork (0 for unindexed ids)."""
+        rows, found = rows_for(self.id_sorted, self.id_order, artwork_ids)
+        sims = np.zeros(len(rows), dtype=np.float32)
+        if found.any():
+            sims[found] = histogram_similarity(query, self.vectors[rows[found]])
+        return sims
+
+    # ---- querying ----
+    def _probe_codes(self, query, num_probes):
+        proj = self._projections(query)[0]                      # (tables, bits)
+        base = self._pack(proj > 0)                              # (tables,)
+        if num_probes <= 0:
+            return base[:, None]
+        # Multi-probe: also visit the buckets reached by flipping the bits whose
+        # projections were closest to the hyperplane.
+        flips = np.argsort(np.abs(proj), axis=1)[:, :num_probes]
+        probes = base[:, None] ^ (np.int64(1) << flips.astype(np.int64))
+        return np.concatenate([base[:, None], probes], axis=1)
+
+    def candidates(self, query, num_probes=2):
+        rows = []
+        for t, codes in enumerate(self._probe_codes(query, num_probes)):
+            sorted_codes = self.bucket_codes[t]
+            lo = np.searchsorted(sorted_codes, codes, side="left")
+            hi = np.searchsorted(sorted_codes, codes, side="right")
+            for a, b in zip(lo, hi):
+                if b > a:
+                    rows.append(self.bucket_order[t, a:b])
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(rows))
+
+    def query(self, query, k=10, num_probes=2, exclude=None):
+        """Return [(artwork_id, similarity)] for the k best shortlisted rows."""
+        query = np.asarray(query, dtype=np.float32)
+        rows = self.candidates(query, num_probes=num_probes)
+        if exclude is not None:
+            rows = rows[self.ids[rows] != exclude]
+        if len(rows) == 0:
+            return []
+        sims = histogram_similarity(query, self.vectors[rows])
+        k = min(k, len(rows))
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top], kind="stable")]
+        return [(int(self.ids[rows[i]]), float(sims[i])) for i in top]
+
+    # ---- persistence ----
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    @classmethod
+    def from_arrays(cls, arrays, copy=False):
+        index = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(index, name, np.array(arrays[name]) if copy else arrays[name])
+        return index
+
+
+class VisualIndex:
+    """Flask extension owning the process-wide, disk-backed LSH index."""
+
+    def __init__(self, app=None):
+        self.store = None
+        self.config = {}
+        self._index = None
+        self._version = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("ANN_INDEX_DIR", os.path.join(app.instance_path, "ann_index"))
+        app.config.setdefault("ANN_NUM_TABLES", 8)
+        app.config.setdefault("ANN_NUM_BITS", 12)
+        app.config.setdefault("ANN_NUM_PROBES", 2)
+        app.config.setdefault("ANN_SHORTLIST_SIZE", 200)
+        app.config.setdefault("ANN_MIN_CATALOG_SIZE", 1000)
+        app.config.setdefault("FEATURE_RELOAD_INTERVAL", 2.0)
+        self.store = SharedArrays(app.config["ANN_INDEX_DIR"], app.config["FEATURE_RELOAD_INTERVAL"])
+        self.config = app.config
+        app.extensions["visual_index"] = self
+        self.store.current(force=True)
+
+    @property
+    def directory(self):
+        return self.store.directory
+
+    @property
+    def index(self):
+        arrays = self.store.current()
+        if arrays is None:
+            return None
+        if self.store.version != self._version:
+            self._index, self._version = RandomProjectionLSH.from_arrays(arrays), self.store.version
+        return self._index
+
+    def _mutate(self, fn):
+        """
+        Apply `fn(index)` to a private copy of the latest version and publish it.
+        With no index on disk yet (a fresh deploy), the first mutation builds it
+        from the database, under the writer lock so only one worker does.
+        """
+        with self.store.writer() as arrays:
+            if arrays is None:
+                print(f"No visual index in {self.directory}; building it from the database")
+                index = self._build()
+            else:
+                index = RandomProjectionLSH.from_arrays(arrays, copy=True)
+            if fn(index) is False:
+                return False
+            self.store.publish(index.to_arrays())
+            return True
+
+    def _build(self, batch_size=200):
+        """A fresh index over every artwork image in the database."""
+        from .models import Artwork
+        from .query_guard import allow_blobs
+
+        ids, vectors = [], []
+        with allow_blobs():
+            rows = Artwork.query.with_entities(Artwork.id, Artwork.image_data).yield_per(batch_size)
+            for artwork_id, image_data in rows:
+                vec = visual_feature_vector(image_data) if image_data else None
+                if vec is not None:
+                    ids.append(artwork_id)
+                    vectors.append(vec)
+
+        return RandomProjectionLSH(
+            num_tables=self.config.get("ANN_NUM_TABLES", 8),
+            num_bits=self.config.get("ANN_NUM_BITS", 12),
+        ).fit(ids, np.asarray(vectors, dtype=np.float32).reshape(-1, FEATURE_DIM))
+
+    # ---- public API ----
+    def rebuild(self, batch_size=200):
+        """Rebuild the whole index from the artwork images in the database."""
+        index = self._build(batch_size)
+        with self.store.writer():
+            self.store.publish(index.to_arrays())
+        return len(index)
+
+    def add_artwork(self, artwork_id, image_bytes):
+        vec = visual_feature_vector(image_bytes) if image_bytes else None
+        if vec is None:
+            return False
+        return self._mutate(lambda index: index.add([artwork_id], vec[None, :]))
+
+    def remove_artwork(self, artwork_id):
+        return self._mutate(lambda index: index.remove([artwork_id]))
+
+    def vector_for(self, artwork_id):
+        index = self.index
+        return None if index is None else index.vector_for(artwork_id)
+
+    def similarities(self, vector, artwork_ids):
+        index = self.index
+        if index is None or vector is None:
+            return np.zeros(len(artwork_ids), dtype=np.float32)
+        return index.similarities(vector, artwork_ids)
+
+    def shortlist(self, vector, exclude=None, limit=None):
+        """
+        Return {artwork_id: visual similarity} for the approximate neighbours of
+        `vector`, or None when the catalog is small enough that brute force is
+        cheaper (or no index has been built yet).
+        """
+        index = self.index
+        if index is None or vector is None or len(index) < self.config.get("ANN_MIN_CATALOG_SIZE", 1000):
+            return None
+        hits = index.query(
+            vector,
+            k=limit or self.config.get("ANN_SHORTLIST_SIZE", 200),
+            num_probes=self.config.get("ANN_NUM_PROBES", 2),
+            exclude=exclude,
+        )
+        return dict(hits)
@@ -1,17 +1,28 @@
 import io
+import time
 import numpy as np
 import trimesh
 from PIL import Image
-from flask import Blueprint, request, send_file, abort, Response, jsonify
+from flask import Blueprint, request, send_file, abort, Response, jsonify, current_app
 from datetime import datetime
+from sqlalchemy.orm import defer
 
 from .auth import get_current_user
-from .extensions import db
+from .extensions import db, visual_index, limiter
+from .metrics import counter, histogram
+from .profiling import timed
+from .query_guard import query_budget
 from .models import Artwork
-from .recommendations import recommend_similar_artworks
+from .recommendations import recommend_for_seeds
+from . import recommendation_store
+
+glb_generation_seconds = histogram("glb_generation_seconds", "Time to build a GLB model from an uploaded image")
+blob_bytes_served = counter("blob_bytes_served_total", "Image/GLB bytes sent to clients", ("type",))
+recommendation_seconds = histogram("recommendation_seconds", "Time to answer a recommendation request", ("kind",))
 
 artworks_bp = Blueprint("artworks", __name__)
 
+@timed("glb")
 def create_glb_from_image(file_like, width_m=0.6, thickness_m=0.01):
     try:
         img = Image.open(file_like).convert("RGB")
@@ -74,6 +85,7 @@ def health_check():
     return Response(f"OK - Mobile: {is_mobile}", status=200, mimetype="text/plain")
 
 @artworks_bp.route("/make-glb", methods=["POST", "OPTIONS"])
+@limiter.limit("make_glb")
 def make_glb():
     if request.method == "OPTIONS":
         response = Response(status=200)
@@ -137,7 +149,9 @@ def make_glb():
         year_created = int(year_created_str) if year_created_str else None
 
         image_data = f.read()
+        started = time.perf_counter()
         glb_bytes = create_glb_from_image(io.BytesIO(image_data))
+        glb_generation_seconds.observe(time.perf_counter() - started)
 
         if not glb_bytes:
             return Response(
@@ -165,6 +179,13 @@ def make_glb():
         db.session.add(artwork)
         db.session.commit()
 
+        try:
+            visual_index.add_artwork(artwork.id, image_data)
+            recommendation_store.on_artwork_saved(artwork)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Recommendation update failed for artwork {artwork.id}: {str(e)}")
+
         return Response(
             f'{{"success": true, "artwork_id": {artwork.id}}}',
             mimetype="application/json",
@@ -180,23 +201,30 @@ def make_glb():
         )
 
 
+def _send_blob(artwork_id, column, kind, mimetype, download_name, missing):
+    # Load just this blob column, then close the session so the pooled connection
+    # is free again before the (possibly very slow) client download starts.
+    row = db.session.query(column).filter(Artwork.id == artwork_id).first()
+    db.session.close()
+    if row is None:
+        abort(404)
+    if not row[0]:
+        abort(404, missing)
+    blob_bytes_served.inc(len(row[0]), type=kind)
+    return send_file(io.BytesIO(row[0]), mimetype=mimetype, download_name=download_name)
+
 @artworks_bp.route("/artwork/<int:artwork_id>/image")
+@query_budget(1, blobs=True)
 def artwork_image(artwork_id):
-    art = Artwork.query.get_or_404(artwork_id)
-    img_bytes = getattr(art, "image_data", None) or getattr(art, "image", None)
-    if not img_bytes:
-        abort(404, "Image not found")
-    return send_file(io.BytesIO(img_bytes), mimetype="image/png", download_name=f"artwork-{artwork_id}.png")
+    return _send_blob(artwork_id, Artwork.image_data, "image", "image/png", f"artwork-{artwork_id}.png", "Image not found")
 
 @artworks_bp.route("/artwork/<int:artwork_id>/glb")
+@query_budget(1, blobs=True)
 def artwork_glb(artwork_id):
-    art = Artwork.query.get_or_404(artwork_id)
-    glb_bytes = getattr(art, "glb_data", None) or getattr(art, "glb", None)
-    if not glb_bytes:
-        abort(404, "GLB not found")
-    return send_file(io.BytesIO(glb_bytes), mimetype="model/gltf-binary", download_name=f"artwork-{artwork_id}.glb")
+    return _send_blob(artwork_id, Artwork.glb_data, "glb", "model/gltf-binary", f"artwork-{artwork_id}.glb", "GLB not found")
 
 @artworks_bp.route("/api/artwork/<int:artwork_id>", methods=["GET"])
+@query_budget(2)
 def get_artwork_api(artwork_id):
     artwork = Artwork.query.get_or_404(artwork_id)
     return jsonify({
@@ -215,6 +243,7 @@ def get_artwork_api(artwork_id):
     })
 
 @artworks_bp.route("/artworks", methods=["GET"])
+@query_budget(2)
 def list_artworks():
     artworks = Artwork.query.filter(Artwork.is_sold == 0).order_by(Artwork.created_at.desc()).all()
     data = []
@@ -238,6 +267,7 @@ def list_artworks():
     return jsonify(data)
     
 @artworks_bp.route("/seller/artworks", methods=["GET"])
+@query_budget(3)
 def seller_artworks():
     user = get_current_user()
     if not user:
@@ -269,6 +299,10 @@ def seller_artworks():
 
 
 @artworks_bp.route("/api/artwork/<int:artwork_id>", methods=["PUT"])
+# Re-scores the artwork, then patches and invalidates neighbour lists in a fixed number
+# of statements however many lists it touches (see recommendation_store.on_artwork_saved).
+# Measured worst case: 20 (benchmarks/query_budget_check.py, 60-300 same-artist artworks).
+@query_budget(24)
 def update_artwork(artwork_id):
     try:
         artwork = Artwork.query.get_or_404(artwork_id)
@@ -295,6 +329,12 @@ def update_artwork(artwork_id):
 
         db.session.commit()
 
+        try:
+            recommendation_store.on_artwork_saved(artwork)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Recommendation update failed for artwork {artwork_id}: {str(e)}")
+
         return jsonify({
             "success": True,
             "message": "Artwork updated successfully",
@@ -324,9 +364,17 @@ def delete_artwork(artwork_id):
         artwork = Artwork.query.get_or_404(artwork_id)
         artwork_name = artwork.name
 
+        affected = recommendation_store.on_artwork_deleted(artwork_id)
         db.session.delete(artwork)
         db.session.commit()
 
+        try:
+            visual_index.remove_artwork(artwork_id)
+            recommendation_store.refill_lists(affected)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Recommendation update failed for artwork {artwork_id}: {str(e)}")
+
         return jsonify({
             "success": True,
             "message": f'Artwork "{artwork_name}" deleted successfully'
@@ -337,7 +385,42 @@ def delete_artwork(artwork_id):
         return jsonify({"success": False, "error": str(e)}), 500
 
 @artworks_bp.route("/api/artwork/<int:artwork_id>/recommendations", methods=["GET"])
+@query_budget(14)
 def artwork_recommendations(artwork_id):
+    started = time.perf_counter()
     art = Artwork.query.get_or_404(artwork_id)
-    recs = recommend_similar_artworks(art, top_n=6)
-    return jsonify({"artwork_id": artwork_id, "recommendations": recs})
+    recs, tier = recommendation_store.get_recommendations(
+        art, top_n=6, budget_ms=current_app.config["RECOMMENDATION_BUDGET_MS"]
+    )
+    recommendation_seconds.observe(time.perf_counter() - started, kind="artwork")
+    return jsonify({"artwork_id": artwork_id, "recommendations": recs, "tier": tier})
+
+@artworks_bp.route("/api/recommendations", methods=["GET"])
+@query_budget(6)
+def cart_recommendations():
+    """More like a set of seed artworks, e.g. ?seeds=3,8,12 for the buyer's cart."""
+    started = time.perf_counter()
+    raw = request.args.get("seeds", "")
+    try:
+        seed_ids = list(dict.fromkeys(int(s) for s in raw.split(",") if s.strip()))
+    except ValueError:
+        return jsonify({"error": "seeds must be a comma-separated list of artwork ids"}), 400
+    if not seed_ids:
+        return jsonify({"error": "at least one seed id is required"}), 400
+    seed_ids = seed_ids[:current_app.config["RECOMMENDATION_MAX_SEEDS"]]
+
+    seeds = (
+        Artwork.query
+        .options(defer(Artwork.image_data), defer(Artwork.glb_data))
+        .filter(Artwork.id.in_(seed_ids))
+        .all()
+    )
+    if not seeds:
+        return jsonify({"error": "no matching artworks"}), 404
+    try:
+        top_n = min(max(int(request.args.get("limit", 6)), 1), 50)
+    except ValueError:
+        top_n = 6
+    recs = recommend_for_seeds(seeds, top_n=top_n)
+    recommendation_seconds.observe(time.perf_counter() - started, kind="cart")
+    return jsonify({"seeds": [a.id for a in seeds], "recommendations": recs})
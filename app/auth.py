@@ -1,29 +1,136 @@
-from flask import Blueprint, request, Response, redirect, url_for, session, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+import time
+import threading
+from flask import Blueprint, request, Response, redirect, url_for, session, jsonify, g, current_app
 from functools import wraps
 
-from .extensions import db
+from .extensions import db, password_hasher, limiter
 from .models import User
+from .passwords import HashingBusy
 
 auth_bp = Blueprint("auth", __name__)
 
 # ---- Auth helpers ----
-def get_current_user():
-    user_id = session.get("user_id")
-    if not user_id:
+# The signed session carries the non-sensitive identity (id, name, email) plus
+# the user's session_version, so most requests never touch the users table.
+# Revocation (password change, "log out everywhere") bumps session_version; each
+# worker re-reads a user's version at most every SESSION_REVALIDATE_SECONDS.
+# Expired entries are swept at most once per that interval, so the cache only
+# holds users seen recently.
+_versions = {}
+_versions_lock = threading.Lock()
+_versions_swept = time.monotonic()
+
+def _revalidate_seconds():
+    return current_app.config.get("SESSION_REVALIDATE_SECONDS", 30)
+
+def _remember_version(user_id, version):
+    global _versions_swept
+    now, ttl = time.monotonic(), _revalidate_seconds()
+    with _versions_lock:
+        _versions[user_id] = (version, now)
+        if now - _versions_swept >= ttl:
+            for stale in [u for u, (_, seen) in _versions.items() if now - seen >= ttl]:
+                del _versions[stale]
+            _versions_swept = now
+
+def _current_version(user_id):
+    with _versions_lock:
+        cached = _versions.get(user_id)
+    if cached is not None and time.monotonic() - cached[1] < _revalidate_seconds():
+        return cached[0]
+    row = db.session.query(User.session_version).filter(User.id == user_id).first()
+    version = None if row is None else (row[0] or 0)
+    _remember_version(user_id, version)
+    return version
+
+def start_session(user):
+    session.clear()
+    session["user_id"] = user.id
+    session["user_name"] = user.name
+    session["user_email"] = user.email
+    session["session_version"] = user.session_version or 0
+    _remember_version(user.id, user.session_version or 0)
+    g.current_user = user
+    g.current_identity = {"id": user.id, "name": user.name, "email": user.email}
+
+def revoke_sessions(user):
+    """Invalidate every existing session of `user` (caller commits)."""
+    user.session_version = (user.session_version or 0) + 1
+    _remember_version(user.id, user.session_version)
+
+def set_password(user, password):
+    user.password_hash = password_hasher.hash(password)
+    if user.id is not None:
+        revoke_sessions(user)
+
+def authenticate(email, password):
+    """The user for these credentials, or None; upgrades an outdated hash in place."""
+    user = User.query.filter_by(email=email).first()
+    if not user or not password_hasher.verify(user.password_hash, password):
         return None
-    return User.query.get(user_id)
+    if password_hasher.needs_rehash(user.password_hash):
+        try:
+            # Same password, so existing sessions stay valid (no set_password).
+            user.password_hash = password_hasher.hash(password)
+            db.session.commit()
+        except HashingBusy:
+            db.session.rollback()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Could not rehash password for user {user.id}: {e}")
+    return user
+
+def current_identity():
+    """{"id", "name", "email"} of the logged-in user from the session, or None."""
+    if "current_identity" in g:
+        return g.current_identity
+    identity = None
+    user_id = session.get("user_id")
+    if user_id and "session_version" not in session:
+        # Session from before identity was stored: load the user once and upgrade it.
+        user = User.query.get(user_id)
+        if user is None:
+            session.clear()
+        else:
+            start_session(user)
+            return g.current_identity
+    if user_id and "session_version" in session:
+        if _current_version(user_id) == session["session_version"]:
+            identity = {"id": user_id, "name": session.get("user_name"), "email": session.get("user_email")}
+        else:
+            session.clear()
+    g.current_identity = identity
+    return identity
+
+def get_current_user():
+    """The logged-in User, loaded at most once per request."""
+    if "current_user" not in g:
+        identity = current_identity()
+        g.current_user = User.query.get(identity["id"]) if identity else None
+    return g.current_user
 
 def login_required(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
-        if not get_current_user():
+        if not current_identity():
             return redirect(url_for("spa.start"))
         return func(*args, **kwargs)
     return wrapper
 
+@auth_bp.errorhandler(HashingBusy)
+def hashing_busy(e):
+    # Shed login/signup load rather than tie up worker threads behind the hash pool.
+    if request.path.startswith("/api/"):
+        response = jsonify({"error": "Too many sign-ins right now, please retry shortly."})
+    else:
+        response = Response("Too many sign-ins right now, please retry shortly.")
+    response.status_code = 503
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
 # ---- Start/Login/Signup (FORM) ----
 @auth_bp.route("/signup", methods=["POST"])
+@limiter.limit("signup")
 def signup():
     try:
         name = (request.form.get("name") or "").strip()
@@ -36,61 +143,83 @@ def signup():
         if User.query.filter_by(email=email).first():
             return Response("Account already exists. Please login.", status=400)
 
-        user = User(name=name, email=email, password_hash=generate_password_hash(password))
+        user = User(name=name, email=email, session_version=0)
+        set_password(user, password)
         db.session.add(user)
         db.session.commit()
 
-        session["user_id"] = user.id
+        start_session(user)
         return redirect(url_for("spa.select_role"))
 
+    except HashingBusy:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return Response(f"Signup error: {str(e)}", status=500)
 
 @auth_bp.route("/login", methods=["POST"])
+@limiter.limit("login")
 def login():
     email = (request.form.get("email") or "").strip().lower()
     password = request.form.get("password") or ""
 
-    user = User.query.filter_by(email=email).first()
-    if not user or not check_password_hash(user.password_hash, password):
+    user = authenticate(email, password)
+    if not user:
         return Response("Invalid email or password", status=401)
 
-    session["user_id"] = user.id
+    start_session(user)
     return redirect(url_for("spa.select_role"))
 
 @auth_bp.route("/logout")
 def logout():
+    """End this browser's session only; the user's other devices stay signed in."""
     session.clear()
+    g.current_user = g.current_identity = None
+    return redirect(url_for("spa.start"))
+
+@auth_bp.route("/logout/everywhere")
+def logout_everywhere():
+    """End every session of the current user, on all devices."""
+    user = get_current_user()
+    if user is not None:
+        try:
+            revoke_sessions(user)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Could not revoke sessions for user {user.id}: {e}")
+    session.clear()
+    g.current_user = g.current_identity = None
     return redirect(url_for("spa.start"))
 
 # ---- Auth API for React SPA ----
 @auth_bp.route("/api/me", methods=["GET"])
 def api_me():
-    user = get_current_user()
-    if not user:
+    identity = current_identity()
+    if not identity:
         return jsonify({"error": "Not authenticated"}), 401
 
-    return jsonify({
-        "user": {"id": user.id, "name": user.name, "email": user.email}
-    })
+    return jsonify({"user": identity})
 
 @auth_bp.route("/api/login", methods=["POST"])
+@limiter.limit("login")
 def api_login():
     data = request.get_json() or {}
     email = (data.get("email") or "").strip().lower()
     password = data.get("password") or ""
 
-    user = User.query.filter_by(email=email).first()
-    if not user or not check_password_hash(user.password_hash, password):
+    user = authenticate(email, password)
+    if not user:
         return jsonify({"error": "Invalid email or password"}), 401
 
-    session["user_id"] = user.id
+    start_session(user)
     return jsonify({
         "user": {"id": user.id, "name": user.name, "email": user.email}
     })
 
 @auth_bp.route("/api/signup", methods=["POST"])
+@limiter.limit("signup")
 def api_signup():
     try:
         data = request.get_json() or {}
@@ -104,15 +233,19 @@ def api_signup():
         if User.query.filter_by(email=email).first():
             return jsonify({"error": "Account already exists. Please login."}), 400
 
-        user = User(name=name, email=email, password_hash=generate_password_hash(password))
+        user = User(name=name, email=email, session_version=0)
+        set_password(user, password)
         db.session.add(user)
         db.session.commit()
 
-        session["user_id"] = user.id
+        start_session(user)
         return jsonify({
             "user": {"id": user.id, "name": user.name, "email": user.email}
         })
 
+    except HashingBusy:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"Signup error: {str(e)}"}), 500
@@ -0,0 +1,94 @@
+"""
+Candidate generation for recommendations.
+
+Artist, style, medium and type matches dominate the score, so instead of loading
+the whole catalog the scorer only sees artworks that share at least one of those
+values. The indexed artist/style/medium/artwork_type columns act as posting lists
+(value -> artwork ids); one query unions them, ranks by the categorical score and
+stops at a configurable cap. Visual ANN neighbours are added on top, and popular
+artworks pad the set when the categorical matches are too few.
+"""
+
+from flask import current_app
+from sqlalchemy import case, desc, func, or_
+
+from .extensions import db
+from .models import Artwork, Recommendation
+
+CATEGORICAL_WEIGHTS = (
+    ("artist", 3.0),
+    ("style", 2.0),
+    ("medium", 1.5),
+    ("artwork_type", 1.0),
+)
+
+
+def categorical_candidates(artwork, limit):
+    """Ids of unsold artworks sharing a categorical value, best categorical score first."""
+    matches = [
+        (getattr(Artwork, field), getattr(artwork, field), weight)
+        for field, weight in CATEGORICAL_WEIGHTS
+        if getattr(artwork, field)
+    ]
+    if not matches:
+        return []
+
+    score = sum(case((column == value, weight), else_=0.0) for column, value, weight in matches)
+    rows = (
+        db.session.query(Artwork.id)
+        .filter(or_(*[column == value for column, value, _ in matches]))
+        .filter(Artwork.id != artwork.id, Artwork.is_sold.isnot(True))
+        .order_by(desc(score), desc(Artwork.id))
+        .limit(limit)
+        .all()
+    )
+    return [artwork_id for (artwork_id,) in rows]
+
+
+def popular_artwork_ids(limit, exclude=()):
+    """
+    Unsold artworks that appear in the most stored recommendation lists, topped up
+    with the newest listings (there is no view or sales signal to rank by).
+    """
+    exclude = set(exclude)
+    in_degree = (
+        db.session.query(Recommendation.neighbour_id)
+        .join(Artwork, Artwork.id == Recommendation.neighbour_id)
+        .filter(Artwork.is_sold.isnot(True))
+        .group_by(Recommendation.neighbour_id)
+        .order_by(desc(func.count(Recommendation.id)))
+        .limit(limit + len(exclude))
+        .all()
+    )
+    ids = [i for (i,) in in_degree if i not in exclude][:limit]
+    if len(ids) < limit:
+        newest = (
+            db.session.query(Artwork.id)
+            .filter(Artwork.is_sold.isnot(True))
+            .order_by(Artwork.created_at.desc())
+            .limit(limit + len(exclude) + len(ids))
+            .all()
+        )
+        seen = exclude | set(ids)
+        ids += [i for (i,) in newest if i not in seen][:limit - len(ids)]
+    return ids
+
+
+def candidate_ids(artwork, shortlist=None):
+    """
+    Bounded set of artwork ids worth scoring against `artwork`, or None when the
+    catalog is small enough that scoring all of it is cheaper and exact.
+    """
+    cap = current_app.config.get("RECOMMENDATION_CANDIDATE_CAP", 500)
+    minimum = current_app.config.get("RECOMMENDATION_MIN_CANDIDATES", 50)
+
+    if shortlist is None and db.session.query(func.count(Artwork.id)).scalar() <= cap + 1:
+        return None
+
+    ids = set(categorical_candidates(artwork, cap))
+    if shortlist:
+        ids.update(shortlist)
+    ids.discard(artwork.id)
+    if len(ids) < minimum:
+        ids.update(popular_artwork_ids(minimum - len(ids), exclude=ids | {artwork.id}))
+    return ids
@@ -0,0 +1,55 @@
+import click
+
+from flask import current_app
+
+from .extensions import db, visual_index, embedding_store
+from .recommendation_store import rebuild_all
+
+
+def register_commands(app):
+    @app.cli.command("build-visual-index")
+    def build_visual_index():
+        """Rebuild the visual similarity index from all artwork images."""
+        count = visual_index.rebuild()
+        click.echo(f"✅ Indexed {count} artwork image(s) into {visual_index.directory}")
+
+    @app.cli.command("rebuild-recommendations")
+    def rebuild_recommendations():
+        """Recompute the materialized recommendation lists for every artwork."""
+        count = rebuild_all()
+        click.echo(f"✅ Rebuilt recommendations for {count} artwork(s)")
+
+    @app.cli.command("precompress-assets")
+    def precompress_assets():
+        """Write .br/.gz siblings for the built frontend bundles (run after npm run build)."""
+        from .spa import spa_assets
+        from .compression import precompress_directory
+
+        count = precompress_directory(spa_assets.root)
+        click.echo(f"✅ Wrote {count} precompressed file(s) under {spa_assets.root}")
+
+    @app.cli.command("embed-artworks")
+    @click.option("--full", is_flag=True, help="Re-embed every artwork instead of only new ones.")
+    @click.option("--batch-size", default=32, show_default=True)
+    @click.option("--workers", default=2, show_default=True, help="DataLoader decode processes.")
+    @click.option("--threads", default=None, type=int, help="torch intra-op threads for inference.")
+    @click.option("--weights", default=None, help="Local ResNet-18 state_dict instead of downloading.")
+    def embed_artworks(full, batch_size, workers, threads, weights):
+        """Compute CNN embeddings for artwork images (incremental by default)."""
+        from .embeddings import run_pipeline
+        from .models import Artwork
+
+        ids = [i for (i,) in db.session.query(Artwork.id).all()]
+        count, seconds = run_pipeline(
+            embedding_store,
+            current_app.config["SQLALCHEMY_DATABASE_URI"],
+            ids,
+            full=full,
+            batch_size=batch_size,
+            num_workers=workers,
+            threads=threads,
+            weights_path=weights,
+        )
+        rate = count / seconds if seconds else 0.0
+        click.echo(f"✅ Embedded {count} new image(s) in {seconds:.1f}s ({rate:.1f} images/sec); "
+                   f"{len(embedding_store)} stored in {embedding_store.directory}")
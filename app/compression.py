@@ -0,0 +1,383 @@
+"""
+Precompressed responses with no filesystem work per request.
+
+`PrecompressedFile` keeps one file (the SPA's index.html) in memory together
+with gzip and, when the `brotli` package is installed, brotli variants, each
+with its own strong ETag. The variants come from up-to-date `.br`/`.gz` siblings
+on disk when there are any, and are only compressed in memory otherwise. It is
+read at startup and re-read only when its mtime changes. The mtime is checked at
+most every `check_interval` seconds, so a request normally never touches the
+filesystem.
+
+`AssetDirectory` indexes a build directory (Vite's hashed bundles) in memory
+once: for every file its size, ETag, content type and any `.br`/`.gz` sibling
+(written by `flask precompress-assets` after a build, or at startup by the first
+worker to take the "precompress-assets" job lock while the others wait). A
+request is a dict lookup plus one open() of the chosen variant. Hashed filenames
+are sent as immutable for a year.
+
+Both negotiate Accept-Encoding and answer If-None-Match with 304.
+
+`ResponseCompressor` is an after_request hook for dynamic responses (JSON,
+HTML): it compresses bodies above `COMPRESSION_MIN_SIZE` whose type is worth
+compressing, at a cheap level, skips media, streams and anything already
+encoded, and can reuse the compressed bytes of endpoints whose body repeats (the
+catalog). Bytes in/out, CPU time and cache hits are counted per route.
+"""
+
+import os
+import re
+import gzip
+import time
+import hashlib
+import mimetypes
+import threading
+from collections import namedtuple, OrderedDict
+
+from flask import request, Response
+from werkzeug.wsgi import wrap_file
+
+from .metrics import counter
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Preferred first when the client accepts them equally.
+ENCODINGS = ("br", "gzip", "identity")
+# Precompressed sibling suffix per encoding, e.g. index-B2x9_kQa.js.br
+SIBLINGS = {"br": ".br", "gzip": ".gz"}
+# Worth compressing; images, fonts and video are compressed already.
+COMPRESSIBLE = (".js", ".mjs", ".css", ".html", ".svg", ".json", ".map", ".txt", ".xml", ".wasm", ".gltf", ".glb")
+# Vite's "[name]-[hash]": 8 url-safe base64 characters with at least one digit
+# or capital, so plain words such as "-longword.js" aren't mistaken for hashes
+# (an all-lowercase hash just misses the long cache lifetime).
+HASHED_NAME = re.compile(r"-(?=[A-Za-z0-9_-]{0,7}[0-9A-Z])[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Dynamic responses worth compressing; images, GLB models etc. are left alone.
+COMPRESSIBLE_MIMETYPES = frozenset((
+    "application/json", "text/html", "text/plain", "text/css", "text/javascript",
+    "application/javascript", "image/svg+xml", "text/csv", "application/xml",
+))
+
+bytes_in_total = counter("compression_bytes_in_total", "Response bytes before compression", ("route", "encoding"))
+bytes_out_total = counter("compression_bytes_out_total", "Response bytes after compression", ("route", "encoding"))
+cpu_seconds_total = counter("compression_cpu_seconds_total", "Thread CPU time spent compressing", ("route", "encoding"))
+cache_hits_total = counter("compression_cache_hits_total", "Compressed bodies reused from the cache", ("route", "encoding"))
+
+
+def compress(body, encoding, level=None):
+    """`body` compressed with `encoding`; the highest level unless `level` is given."""
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if level is None else level)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=9 if level is None else level, mtime=0)
+    return body
+
+
+def build_variants(body, precompressed=None):
+    """{encoding: bytes} for `body`; a compressed form is kept only if it is smaller."""
+    variants = {"identity": body}
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        packed = (precompressed or {}).get(encoding) or compress(body, encoding)
+        if len(packed) < len(body):
+            variants[encoding] = packed
+    return variants
+
+
+def negotiate(available):
+    """Best encoding in `available` for this request's Accept-Encoding (identity if none)."""
+    accepted = request.accept_encodings
+    best, best_q = "identity", 0.0
+    for encoding in ENCODINGS:
+        if encoding in available:
+            q = accepted.quality(encoding)
+            if q > best_q:
+                best, best_q = encoding, q
+    return best
+
+
+def read_siblings(path, mtime_ns):
+    """{encoding: bytes} of the `.br`/`.gz` siblings of `path` written since `mtime_ns`."""
+    siblings = {}
+    for encoding, suffix in SIBLINGS.items():
+        try:
+            with open(path + suffix, "rb") as f:
+                if os.fstat(f.fileno()).st_mtime_ns >= mtime_ns:
+                    siblings[encoding] = f.read()
+        except OSError:
+            pass
+    return siblings
+
+
+class PrecompressedFile:
+    """An on-disk file held in memory with compressed variants; see module docstring."""
+
+    def __init__(self, path, mimetype, check_interval=2.0, cache_control="no-cache"):
+        self.path = path
+        self.mimetype = mimetype
+        self.check_interval = check_interval
+        self.cache_control = cache_control
+        self._snapshot = None   # (mtime, {encoding: (body, etag)}) or None if missing
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """(Re)read the file if its mtime changed; returns the current snapshot."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            self._snapshot = None
+            return None
+        if self._snapshot is not None and self._snapshot[0] == mtime:
+            return self._snapshot
+        with self._lock:
+            if self._snapshot is not None and self._snapshot[0] == mtime:
+                return self._snapshot
+            with open(self.path, "rb") as f:
+                body = f.read()
+            digest = hashlib.sha256(body).hexdigest()[:20]
+            variants = {
+                encoding: (data, f'"{digest}-{encoding}"' if encoding != "identity" else f'"{digest}"')
+                for encoding, data in build_variants(body, read_siblings(self.path, mtime)).items()
+            }
+            self._snapshot = (mtime, variants)
+            return self._snapshot
+
+    def current(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            return self.load()
+        return self._snapshot
+
+    def response(self):
+        """A response for this request, or None if the file doesn't exist."""
+        snapshot = self.current()
+        if snapshot is None:
+            return None
+        variants = snapshot[1]
+        encoding = negotiate(variants)
+        body, etag = variants[encoding]
+
+        if request.if_none_match and request.if_none_match.contains_weak(etag.strip('"')):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype=self.mimetype)
+            if encoding != "identity":
+                response.headers["Content-Encoding"] = encoding
+        response.headers["ETag"] = etag
+        response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = self.cache_control
+        return response
+
+
+def precompress_directory(root, min_size=1024):
+    """
+    Write `.br`/`.gz` siblings for compressible files under `root` that lack an
+    up-to-date one; returns how many were written. Safe to run from several
+    workers at once (each sibling is written to a temp file and renamed), but
+    workers should hold a job lock so only one of them pays for the compression.
+    """
+    written = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(dirpath, name)
+            st = os.stat(path)
+            if st.st_size < min_size:
+                continue
+            body = None
+            for encoding, suffix in SIBLINGS.items():
+                if encoding == "br" and brotli is None:
+                    continue
+                try:
+                    if os.stat(path + suffix).st_mtime_ns >= st.st_mtime_ns:
+                        continue
+                except FileNotFoundError:
+                    pass
+                if body is None:
+                    with open(path, "rb") as f:
+                        body = f.read()
+                packed = compress(body, encoding)
+                if len(packed) >= len(body):
+                    continue
+                tmp = f"{path}{suffix}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(packed)
+                os.replace(tmp, path + suffix)
+                written += 1
+    return written
+
+
+# variants: {encoding: (path, size)}
+AssetEntry = namedtuple("AssetEntry", "mimetype cache_control etag variants")
+
+
+class AssetDirectory:
+    """Files under `root` served by relative path from an in-memory index; see module docstring."""
+
+    def __init__(self, root, rescan_interval=10.0, cache_control="no-cache"):
+        self.root = root
+        self.rescan_interval = rescan_interval
+        self.cache_control = cache_control   # for files without a content hash in the name
+        self._index = {}
+        self._scanned_at = None
+        self._lock = threading.Lock()
+
+    def scan(self):
+        """Rebuild the index from disk; returns the number of files indexed."""
+        index = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            names = set(filenames)
+            for name in filenames:
+                if name.endswith(".tmp") or (name[-3:] in (".br", ".gz") and name[:-3] in names):
+                    continue
+                path = os.path.join(dirpath, name)
+                st = os.stat(path)
+                variants = {"identity": (path, st.st_size)}
+                for encoding, suffix in SIBLINGS.items():
+                    if name + suffix in names:
+                        sibling = os.stat(path + suffix)
+                        if sibling.st_mtime_ns >= st.st_mtime_ns:   # ignore siblings of an older build
+                            variants[encoding] = (path + suffix, sibling.st_size)
+                mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                cache_control = IMMUTABLE if HASHED_NAME.search(name) else self.cache_control
+                relpath = os.path.relpath(path, self.root).replace(os.sep, "/")
+                index[relpath] = AssetEntry(mimetype, cache_control, f"{st.st_mtime_ns:x}-{st.st_size:x}", variants)
+        self._index = index
+        self._scanned_at = time.monotonic()
+        return len(index)
+
+    def lookup(self, relpath):
+        entry = self._index.get(relpath)
+        if entry is None and (self._scanned_at is None
+                              or time.monotonic() - self._scanned_at >= self.rescan_interval):
+            # Unknown path: maybe a new build. Rescan, but at most every rescan_interval.
+            with self._lock:
+                if self._scanned_at is None or time.monotonic() - self._scanned_at >= self.rescan_interval:
+                    self.scan()
+            entry = self._index.get(relpath)
+        return entry
+
+    def response(self, relpath):
+        """A response for `relpath`, or None if there is no such file."""
+        entry = self.lookup(relpath)
+        if entry is None:
+            return None
+        encoding = negotiate(entry.variants)
+        path, size = entry.variants[encoding]
+        etag = f'"{entry.etag}-{encoding}"' if encoding != "identity" else f'"{entry.etag}"'
+
+        if request.if_none_match and request.if_none_match.contains_weak(etag.strip('"')):
+            response = Response(status=304)
+        else:
+            try:
+                f = open(path, "rb")
+            except OSError:
+                # Removed by a new build; the next unknown path triggers a rescan.
+                self._scanned_at = None
+                return None
+            response = Response(wrap_file(request.environ, f), mimetype=entry.mimetype, direct_passthrough=True)
+            response.content_length = size
+            if encoding != "identity":
+                response.headers["Content-Encoding"] = encoding
+        response.headers["ETag"] = etag
+        if len(entry.variants) > 1:
+            response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = entry.cache_control
+        return response
+
+
+class ResponseCompressor:
+    """Flask extension compressing dynamic responses; see module docstring."""
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.min_size = 1024
+        self.levels = {}
+        self.cached_endpoints = frozenset()
+        self.cache_bytes = 0
+        self._cache = OrderedDict()   # (encoding, body digest) -> compressed bytes
+        self._cached_size = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("COMPRESSION_ENABLED", True)
+        app.config.setdefault("COMPRESSION_MIN_SIZE", 1024)
+        app.config.setdefault("COMPRESSION_GZIP_LEVEL", 6)
+        app.config.setdefault("COMPRESSION_BROTLI_QUALITY", 4)
+        app.config.setdefault("COMPRESSION_CACHE_ENDPOINTS", ())
+        app.config.setdefault("COMPRESSION_CACHE_BYTES", 8 * 1024 * 1024)
+        self.enabled = app.config["COMPRESSION_ENABLED"]
+        self.min_size = app.config["COMPRESSION_MIN_SIZE"]
+        self.levels = {"gzip": app.config["COMPRESSION_GZIP_LEVEL"], "br": app.config["COMPRESSION_BROTLI_QUALITY"]}
+        self.cached_endpoints = frozenset(app.config["COMPRESSION_CACHE_ENDPOINTS"])
+        self.cache_bytes = app.config["COMPRESSION_CACHE_BYTES"]
+        app.after_request(self.after_request)
+        app.extensions["response_compressor"] = self
+
+    def _compressible(self, response):
+        return (
+            200 <= response.status_code < 300 and response.status_code not in (204, 206)
+            and not response.direct_passthrough
+            and not response.is_streamed
+            and "Content-Encoding" not in response.headers
+            and response.mimetype in COMPRESSIBLE_MIMETYPES
+            and "no-transform" not in response.headers.get("Cache-Control", "")
+        )
+
+    def after_request(self, response):
+        if not self.enabled or not self._compressible(response):
+            return response
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate(("br", "gzip") if brotli is not None else ("gzip",))
+        if encoding == "identity":
+            return response
+
+        route = request.endpoint or "unmatched"
+        started = time.thread_time()
+        if route in self.cached_endpoints:
+            packed, hit = self._cached_compress(body, encoding)
+            if hit:
+                cache_hits_total.inc(route=route, encoding=encoding)
+        else:
+            packed = compress(body, encoding, self.levels[encoding])
+        cpu_seconds_total.inc(time.thread_time() - started, route=route, encoding=encoding)
+        bytes_in_total.inc(len(body), route=route, encoding=encoding)
+        bytes_out_total.inc(len(packed), route=route, encoding=encoding)
+
+        response.set_data(packed)
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(f"{etag}-{encoding}")
+        return response
+
+    def _cached_compress(self, body, encoding):
+        """(compressed body, whether it came from the cache); the key is a digest of `body`."""
+        key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+        with self._lock:
+            packed = self._cache.get(key)
+            if packed is not None:
+                self._cache.move_to_end(key)
+                return packed, True
+        packed = compress(body, encoding, self.levels[encoding])
+        if len(packed) <= self.cache_bytes:
+            with self._lock:
+                if key not in self._cache:
+                    self._cache[key] = packed
+                    self._cached_size += len(packed)
+                    while self._cached_size > self.cache_bytes:
+                        _, dropped = self._cache.popitem(last=False)
+                        self._cached_size -= len(dropped)
+        return packed, False
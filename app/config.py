@@ -2,12 +2,169 @@ import os
 
 basedir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 
+
+def _database_url():
+    url = os.environ.get("DATABASE_URL")
+    if not url:
+        return "sqlite:///" + os.path.join(basedir, "artwork.db")
+    # Hosting providers hand out postgres:// URLs; SQLAlchemy only accepts postgresql://
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-change-me")
-    SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(basedir, "artwork.db")
+    SQLALCHEMY_DATABASE_URI = _database_url()
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Connection pool per worker process for a server database (see app/database.py):
+    # DB_POOL_SIZE + DB_MAX_OVERFLOW should cover GUNICORN_THREADS plus background jobs,
+    # and WEB_CONCURRENCY times that must fit the server's max_connections
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 5))
+    DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 10))
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 30000))
+
+    # SQLite profile applied to every connection (app/database.py): WAL, synchronous=NORMAL,
+    # writers wait SQLITE_BUSY_TIMEOUT_MS for the lock, mmap and page cache sizes. Every
+    # SQLITE_CHECKPOINT_INTERVAL seconds the WAL is checkpointed, and truncated once it
+    # is over SQLITE_WAL_MAX_BYTES
+    SQLITE_TUNED = os.environ.get("SQLITE_TUNED", "true").lower() in ("1", "true", "yes")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 15000))
+    SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", 64 * 1024))
+    SQLITE_CHECKPOINT_INTERVAL = int(os.environ.get("SQLITE_CHECKPOINT_INTERVAL", 60))
+    SQLITE_WAL_MAX_BYTES = int(os.environ.get("SQLITE_WAL_MAX_BYTES", 64 * 1024 * 1024))
+
+    # Seconds a worker trusts its cached session_version for a user before
+    # re-reading it, i.e. how long a revoked session can linger on other workers
+    SESSION_REVALIDATE_SECONDS = int(os.environ.get("SESSION_REVALIDATE_SECONDS", 30))
+
+    # Password hashing: werkzeug method string (its cost is the iteration count);
+    # stored hashes using another method are upgraded on the next login
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "pbkdf2:sha256:260000")
+    # Hashing threads per process, and how many requests may wait on them before
+    # logins are answered with 503 + Retry-After
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", 8))
+    PASSWORD_HASH_RETRY_AFTER = 1
+
+    # Token-bucket rate limits per route rule: "N/second|minute|hour|day" per client
+    # IP and/or per logged-in user. Buckets are per process ("memory") or shared by
+    # the workers on a host ("sqlite", stored at RATELIMIT_SQLITE_PATH).
+    RATELIMIT_ENABLED = os.environ.get("RATELIMIT_ENABLED", "true").lower() not in ("0", "false", "no")
+    RATELIMIT_STORAGE = os.environ.get("RATELIMIT_STORAGE", "memory")
+    RATELIMIT_SQLITE_PATH = os.path.join(basedir, "instance", "ratelimit.sqlite")
+    # Reverse proxies/load balancers in front of the app: X-Forwarded-For is trusted for
+    # this many hops to find the client address (0 = use the socket peer address)
+    PROXY_FIX_X_FOR = int(os.environ.get("PROXY_FIX_X_FOR", 0))
+    RATELIMITS = {
+        "login": {"ip": "20/minute"},
+        "signup": {"ip": "5/minute"},
+        "make_glb": {"ip": "60/hour", "user": "30/hour"},
+        "populate": {"ip": "5/hour", "user": "5/hour"},
+    }
+
     RAZORPAY_KEY_ID = os.environ.get("RAZORPAY_KEY_ID")
     RAZORPAY_KEY_SECRET = os.environ.get("RAZORPAY_KEY_SECRET")
+    # Gateway base URL (e.g. a local stub: python benchmarks/razorpay_stub.py), HTTP
+    # timeouts in seconds, retries on connection errors, and keep-alive pool size
+    RAZORPAY_BASE_URL = os.environ.get("RAZORPAY_BASE_URL")
+    RAZORPAY_CONNECT_TIMEOUT = float(os.environ.get("RAZORPAY_CONNECT_TIMEOUT", 3.05))
+    RAZORPAY_READ_TIMEOUT = float(os.environ.get("RAZORPAY_READ_TIMEOUT", 10))
+    RAZORPAY_MAX_RETRIES = int(os.environ.get("RAZORPAY_MAX_RETRIES", 2))
+    RAZORPAY_POOL_SIZE = int(os.environ.get("RAZORPAY_POOL_SIZE", 10))
+    # Seconds an artwork stays held for a buyer after checkout starts, and how often
+    # lapsed holds are swept
+    RESERVATION_TTL = int(os.environ.get("RESERVATION_TTL", 600))
+    RESERVATION_SWEEP_INTERVAL = 60
+    # Webhook signing secret, and the consumer that applies queued webhook events:
+    # seconds between runs, events per batch, attempts before an event is given up, and
+    # seconds an event for an unknown order is retried (its order row may not be committed yet)
+    RAZORPAY_WEBHOOK_SECRET = os.environ.get("RAZORPAY_WEBHOOK_SECRET")
+    PAYMENT_EVENTS_INTERVAL = int(os.environ.get("PAYMENT_EVENTS_INTERVAL", 5))
+    PAYMENT_EVENTS_BATCH_SIZE = 200
+    PAYMENT_EVENTS_MAX_ATTEMPTS = 5
+    PAYMENT_EVENTS_ORDER_WAIT = int(os.environ.get("PAYMENT_EVENTS_ORDER_WAIT", 3600))
+    # Most artworks in one cart checkout (one gateway order)
+    CART_MAX_ITEMS = 20
     # Keep for SPA paths
     BASEDIR = basedir
+    # The SPA's index.html is served from memory; seconds between checks of its
+    # mtime for a new build
+    SPA_SHELL_CHECK_INTERVAL = float(os.environ.get("SPA_SHELL_CHECK_INTERVAL", 2))
+    # Built bundles are indexed in memory at startup; write missing .br/.gz siblings
+    # then, one worker at a time (or run `flask precompress-assets` after `npm run build`),
+    # and seconds between rescans when an unknown asset is requested
+    ASSETS_PRECOMPRESS_ON_STARTUP = os.environ.get("ASSETS_PRECOMPRESS_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+    ASSETS_RESCAN_INTERVAL = 10
+    # Dynamic JSON/HTML responses larger than COMPRESSION_MIN_SIZE bytes are gzip or
+    # brotli compressed at a cheap level. The compressed bodies of the endpoints in
+    # COMPRESSION_CACHE_ENDPOINTS (the catalog, which repeats until it changes) are
+    # reused from an LRU of COMPRESSION_CACHE_BYTES.
+    COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+    COMPRESSION_MIN_SIZE = 1024
+    COMPRESSION_GZIP_LEVEL = 6
+    COMPRESSION_BROTLI_QUALITY = 4
+    COMPRESSION_CACHE_ENDPOINTS = ("artworks.list_artworks", "artworks.artwork_recommendations")
+    COMPRESSION_CACHE_BYTES = 8 * 1024 * 1024
+
+    # Feature matrices are memory-mapped from versioned files shared by all workers;
+    # seconds between checks for a version published by another worker
+    FEATURE_RELOAD_INTERVAL = 2.0
+
+    # Visual similarity index (random-projection LSH over colour histograms)
+    ANN_INDEX_DIR = os.environ.get("ANN_INDEX_DIR", os.path.join(basedir, "instance", "ann_index"))
+    ANN_NUM_TABLES = 8
+    ANN_NUM_BITS = 12
+    ANN_NUM_PROBES = 2
+    ANN_SHORTLIST_SIZE = 200
+    # Below this many indexed artworks brute force is cheaper than the index
+    ANN_MIN_CATALOG_SIZE = int(os.environ.get("ANN_MIN_CATALOG_SIZE", 1000))
+
+    # Visual signal for recommendations: "histogram" or "embedding" (CNN vectors
+    # from `flask embed-artworks`; falls back to histograms for missing artworks)
+    RECOMMENDATION_VISUAL_SIGNAL = os.environ.get("RECOMMENDATION_VISUAL_SIGNAL", "histogram")
+    EMBEDDINGS_DIR = os.environ.get("EMBEDDINGS_DIR", os.path.join(basedir, "instance", "embeddings"))
+
+    # Candidate generation: cap on categorical matches scored per request, and the
+    # minimum candidate count below which popular artworks pad the set
+    RECOMMENDATION_CANDIDATE_CAP = int(os.environ.get("RECOMMENDATION_CANDIDATE_CAP", 500))
+    RECOMMENDATION_MIN_CANDIDATES = 50
+
+    # Time budget for computing recommendations on a cache miss before falling back
+    # to metadata-only scores, then to popular artworks
+    RECOMMENDATION_BUDGET_MS = int(os.environ.get("RECOMMENDATION_BUDGET_MS", 150))
+
+    # Cart ("more like these") recommendations: most seed artworks combined per query
+    RECOMMENDATION_MAX_SEEDS = 50
+
+    # Materialized recommendations: neighbours stored per artwork, rebuilt nightly
+    RECOMMENDATION_STORE_SIZE = 12
+    RECOMMENDATION_REBUILD_HOUR = int(os.environ.get("RECOMMENDATION_REBUILD_HOUR", 3))
+
+    # Metrics: each worker writes a snapshot to METRICS_DIR every METRICS_FLUSH_INTERVAL
+    # seconds so /metrics can merge them; METRICS_TOKEN (optional) protects /metrics
+    METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(basedir, "instance", "metrics"))
+    METRICS_FLUSH_INTERVAL = 5.0
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+    # Server-Timing header (SQL count/time, hot-path spans): on every response if enabled,
+    # else only for requests sent with "X-Profile: <PROFILE_TOKEN>"; requests slower than
+    # PROFILE_SLOW_REQUEST_MS are logged with their slowest statement.
+    # cProfile a PROFILE_SAMPLE_RATE fraction of requests, or the X-Profile ones, into PROFILE_DIR
+    SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED", "false").lower() in ("1", "true", "yes")
+    PROFILE_SLOW_REQUEST_MS = int(os.environ.get("PROFILE_SLOW_REQUEST_MS", 1000))
+    PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")
+    PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(basedir, "instance", "profiles"))
+
+    # Per-view query budgets (app/query_guard.py): "warn" logs requests that go over
+    # budget or SELECT blob columns outside the blob routes, "raise" fails them (tests)
+    QUERY_GUARD = os.environ.get("QUERY_GUARD", "off").lower()
+    QUERY_GUARD_DEFAULT_BUDGET = 20
+
+    # Periodic maintenance threads (one worker runs each job, see app/jobs.py)
+    BACKGROUND_JOBS_ENABLED = os.environ.get("BACKGROUND_JOBS_ENABLED", "true").lower() in ("1", "true", "yes")
@@ -0,0 +1,224 @@
+"""
+Deep visual embeddings for recommendations.
+
+An offline CPU pipeline runs a small pretrained CNN (ResNet-18 without its
+classifier head) over every artwork image and writes L2-normalised float16
+vectors to a compact on-disk matrix. Runs are incremental: only artworks missing
+from the matrix are embedded, and deleted artworks are dropped.
+
+The pipeline runs only from the CLI (`flask embed-artworks`, e.g. from cron),
+never inside a web worker: torch, torchvision and the model weights add a few
+hundred MB to whichever process loads them. The web workers only need NumPy
+to map the matrix (see feature_store).
+"""
+
+import io
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from .feature_store import SharedArrays, build_id_map, row_for, rows_for
+
+EMBEDDING_DIM = 512
+IMAGE_SIZE = 224
+_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def _preprocess(image_bytes):
+    """Decode, resize and normalise one image into a CHW float32 array (None if unreadable)."""
+    try:
+        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    except Exception:
+        return None
+    img = img.resize((IMAGE_SIZE, IMAGE_SIZE), Image.BILINEAR)
+    arr = (np.asarray(img, dtype=np.float32) / 255.0 - _MEAN) / _STD
+    return arr.transpose(2, 0, 1)
+
+
+# ---- dataset (decoding runs inside DataLoader workers) ----
+class DatabaseImages:
+    """
+    Fetches images by primary key through a per-worker engine. The DataLoader
+    calls `__getitems__` with a whole batch of indices, so each batch costs one
+    `IN (...)` query rather than one query per image.
+    """
+
+    def __init__(self, ids, db_url):
+        self.ids = list(ids)
+        self.db_url = db_url
+        self._engine = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitems__(self, indices):
+        from sqlalchemy import bindparam, create_engine, text
+
+        if self._engine is None:
+            self._engine = create_engine(self.db_url)
+        ids = [self.ids[i] for i in indices]
+        query = text("SELECT id, image_data FROM artwork WHERE id IN :ids").bindparams(bindparam("ids", expanding=True))
+        with self._engine.connect() as conn:
+            blobs = dict(conn.execute(query, {"ids": ids}).all())
+        return [(i, _preprocess(blobs[i]) if blobs.get(i) else None) for i in ids]
+
+    def __getitem__(self, i):
+        return self.__getitems__([i])[0]
+
+
+def _collate(batch):
+    import torch
+
+    batch = [(i, arr) for i, arr in batch if arr is not None]
+    if not batch:
+        return [], None
+    ids, arrays = zip(*batch)
+    return list(ids), torch.from_numpy(np.stack(arrays))
+
+
+def _worker_init(_):
+    import torch
+
+    # one intra-op thread per loader process; the main process owns the rest
+    torch.set_num_threads(1)
+
+
+def load_model(weights_path=None):
+    import torch
+    from torchvision.models import resnet18, ResNet18_Weights
+
+    if weights_path:
+        model = resnet18()
+        model.load_state_dict(torch.load(weights_path, map_location="cpu"))
+    else:
+        model = resnet18(weights=ResNet18_Weights.DEFAULT)
+    model.fc = torch.nn.Identity()
+    return model.eval()
+
+
+def embed_dataset(model, dataset, batch_size=32, num_workers=2, threads=None):
+    """Yield (ids, float32 L2-normalised embeddings) batches for `dataset` on CPU."""
+    import torch
+    from torch.utils.data import DataLoader
+
+    if threads:
+        torch.set_num_threads(threads)
+    loader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        num_workers=num_workers,
+        collate_fn=_collate,
+        worker_init_fn=_worker_init if num_workers else None,
+        persistent_workers=False,
+        prefetch_factor=4 if num_workers else None,
+    )
+    with torch.inference_mode():
+        for ids, pixels in loader:
+            if not ids:
+                continue
+            out = model(pixels).numpy().astype(np.float32)
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+            yield ids, out
+
+
+# ---- on-disk matrix ----
+class EmbeddingStore:
+    """(ids, float16 embeddings) published via SharedArrays and mapped read-only by all workers."""
+
+    def __init__(self, app=None):
+        self.store = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("EMBEDDINGS_DIR", os.path.join(app.instance_path, "embeddings"))
+        app.config.setdefault("FEATURE_RELOAD_INTERVAL", 2.0)
+        self.store = SharedArrays(app.config["EMBEDDINGS_DIR"], app.config["FEATURE_RELOAD_INTERVAL"])
+        app.extensions["embedding_store"] = self
+        self.store.current(force=True)
+
+    @property
+    def directory(self):
+        return self.store.directory
+
+    def arrays(self, force=False):
+        arrays = self.store.current(force=force)
+        if arrays is None:
+            return {
+                "ids": np.empty(0, dtype=np.int64),
+                "matrix": np.empty((0, EMBEDDING_DIM), dtype=np.float16),
+            }
+        return arrays
+
+    def save(self, ids, matrix):
+        id_sorted, id_order = build_id_map(ids)
+        with self.store.writer():
+            self.store.publish({
+                "ids": np.asarray(ids, dtype=np.int64),
+                "matrix": np.asarray(matrix, dtype=np.float16),
+                "id_sorted": id_sorted,
+                "id_order": id_order,
+            })
+
+    def __len__(self):
+        return len(self.arrays()["ids"])
+
+    def vector_for(self, artwork_id):
+        arrays = self.store.current()
+        if arrays is None:
+            return None
+        row = row_for(arrays["id_sorted"], arrays["id_order"], artwork_id)
+        return None if row is None else np.asarray(arrays["matrix"][row], dtype=np.float32)
+
+    def similarities(self, query, artwork_ids):
+        """Clipped cosine similarity of `query` with each artwork; NaN where not embedded."""
+        sims = np.full(len(artwork_ids), np.nan, dtype=np.float32)
+        arrays = self.store.current()
+        if arrays is None or query is None:
+            return sims
+        rows, found = rows_for(arrays["id_sorted"], arrays["id_order"], artwork_ids)
+        if found.any():
+            dots = np.asarray(arrays["matrix"][rows[found]], dtype=np.float32) @ query
+            sims[found] = np.clip(dots, 0.0, 1.0)
+        return sims
+
+
+def embedding_similarity(a, b):
+    """Cosine similarity of two normalised embeddings, clipped to [0, 1]."""
+    return float(min(max(np.dot(a, b), 0.0), 1.0))
+
+
+def run_pipeline(store, db_url, all_ids, full=False, batch_size=32, num_workers=2, threads=None,
+                 weights_path=None):
+    """
+    Embed every id in `all_ids` that the store doesn't have yet (or all of them
+    with `full=True`), drop ids no longer present, and save. Returns
+    (embedded_count, seconds).
+    """
+    all_ids = set(int(i) for i in all_ids)
+    current = store.arrays(force=True)
+    if full:
+        keep_ids = np.empty(0, dtype=np.int64)
+        keep = np.empty((0, EMBEDDING_DIM), dtype=np.float16)
+    else:
+        mask = np.isin(current["ids"], list(all_ids))
+        keep_ids = np.asarray(current["ids"])[mask]
+        keep = np.asarray(current["matrix"])[mask]
+    todo = sorted(all_ids - set(keep_ids.tolist()))
+
+    new_ids, new_vecs = [], []
+    started = time.perf_counter()
+    if todo:
+        model = load_model(weights_path)
+        for ids, vecs in embed_dataset(model, DatabaseImages(todo, db_url), batch_size, num_workers, threads):
+            new_ids.extend(ids)
+            new_vecs.append(vecs.astype(np.float16))
+    elapsed = time.perf_counter() - started
+
+    if new_ids or len(keep_ids) != len(current["ids"]):
+        matrix = np.concatenate([keep] + new_vecs) if new_vecs else keep
+        store.save(np.concatenate([keep_ids, np.asarray(new_ids, dtype=np.int64)]), matrix)
+    return len(new_ids), elapsed
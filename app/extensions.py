@@ -1,8 +1,19 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 
+from .ann_index import VisualIndex
+from .compression import ResponseCompressor
+from .embeddings import EmbeddingStore
+from .passwords import PasswordHasher
+from .ratelimit import RateLimiter
+
 
 
 
 db = SQLAlchemy()
 cors = CORS()
+visual_index = VisualIndex()
+embedding_store = EmbeddingStore()
+password_hasher = PasswordHasher()
+limiter = RateLimiter()
+compressor = ResponseCompressor()
@@ -0,0 +1,125 @@
+"""
+Versioned, memory-mapped NumPy arrays shared by every gunicorn worker.
+
+Feature matrices (histograms, embeddings), LSH tables and id maps are written
+once as plain .npy files into an immutable version directory, then published by
+atomically replacing a small CURRENT pointer. Workers map the arrays read-only,
+so the pages live once in the OS page cache no matter how many workers there
+are, and a restarted worker maps the latest version instead of rebuilding it.
+"""
+
+import os
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from . import locks
+
+
+def build_id_map(ids):
+    """Sorted ids plus the row permutation, so id -> row is a binary search."""
+    ids = np.asarray(ids, dtype=np.int64)
+    order = np.argsort(ids, kind="stable")
+    return ids[order], order
+
+
+def row_for(id_sorted, id_order, artwork_id):
+    pos = int(np.searchsorted(id_sorted, artwork_id))
+    if pos < len(id_sorted) and id_sorted[pos] == artwork_id:
+        return int(id_order[pos])
+    return None
+
+
+def rows_for(id_sorted, id_order, artwork_ids):
+    """Vectorised row lookup; returns (rows, found_mask) aligned with `artwork_ids`."""
+    artwork_ids = np.asarray(artwork_ids, dtype=np.int64)
+    if len(id_sorted) == 0:
+        return np.zeros(len(artwork_ids), dtype=np.int64), np.zeros(len(artwork_ids), dtype=bool)
+    pos = np.minimum(np.searchsorted(id_sorted, artwork_ids), len(id_sorted) - 1)
+    found = id_sorted[pos] == artwork_ids
+    return np.asarray(id_order)[pos], found
+
+
+class SharedArrays:
+    """A named set of arrays published as immutable versions under `directory`."""
+
+    def __init__(self, directory, reload_interval=2.0):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.version = None
+        self.arrays = None
+        self._checked_at = 0.0
+        self._lock = threading.RLock()
+
+    def _pointer_path(self):
+        return os.path.join(self.directory, "CURRENT")
+
+    def _read_pointer(self):
+        try:
+            with open(self._pointer_path()) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _map(self, version):
+        folder = os.path.join(self.directory, version)
+        return {
+            name[:-4]: np.load(os.path.join(folder, name), mmap_mode="r")
+            for name in os.listdir(folder)
+            if name.endswith(".npy")
+        }
+
+    def current(self, force=False):
+        """Latest published arrays (mapped read-only), or None if nothing was published."""
+        now = time.monotonic()
+        if force or now - self._checked_at >= self.reload_interval:
+            self._checked_at = now
+            version = self._read_pointer()
+            if version is not None and version != self.version:
+                try:
+                    arrays = self._map(version)
+                except (OSError, ValueError) as e:
+                    print(f"Could not map {self.directory}/{version}: {e}")
+                else:
+                    with self._lock:
+                        self.arrays, self.version = arrays, version
+        return self.arrays
+
+    @contextmanager
+    def writer(self):
+        """Serialise writers across processes; yields the latest arrays (or None)."""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(os.path.join(self.directory, ".lock"), "a") as lock_file:
+            locks.acquire(lock_file)
+            try:
+                yield self.current(force=True)
+            finally:
+                locks.release(lock_file)
+
+    def publish(self, arrays):
+        """Write `arrays` as a new version and swap it in. Call inside `writer()`."""
+        version = f"v{time.time_ns()}"
+        tmp = os.path.join(self.directory, "." + version)
+        os.makedirs(tmp)
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(arr))
+        os.replace(tmp, os.path.join(self.directory, version))
+
+        pointer_tmp = self._pointer_path() + ".tmp"
+        with open(pointer_tmp, "w") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, self._pointer_path())
+
+        # Unlinking a mapped file is safe on POSIX: workers still reading the
+        # previous version keep their mapping until they pick up the new one.
+        previous = self.version
+        for name in os.listdir(self.directory):
+            if name.startswith("v") and name not in (version, previous):
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        self.current(force=True)
+        return version
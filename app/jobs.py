@@ -0,0 +1,93 @@
+"""
+Tiny in-process scheduler for periodic maintenance jobs.
+
+Every gunicorn worker starts the same daemon threads; a non-blocking file lock
+plus a "last run" stamp in the instance folder make sure only one worker
+actually runs each job per period.
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from . import locks
+from .extensions import db
+
+_started = set()
+
+
+def _job_paths(app, name):
+    folder = os.path.join(app.instance_path, "jobs")
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{name}.lock"), os.path.join(folder, f"{name}.last")
+
+
+def run_job(app, name, func, min_gap=0):
+    """Run `func` in an app context unless another worker holds (or just ran) the job."""
+    lock_path, stamp_path = _job_paths(app, name)
+    with open(lock_path, "a") as lock_file:
+        if not locks.acquire(lock_file, blocking=False):
+            return False
+        try:
+            if min_gap and os.path.exists(stamp_path) and time.time() - os.path.getmtime(stamp_path) < min_gap:
+                return False
+            with app.app_context():
+                try:
+                    func()
+                finally:
+                    db.session.remove()
+            with open(stamp_path, "w") as f:
+                f.write(datetime.utcnow().isoformat())
+            return True
+        except Exception as e:
+            print(f"Background job {name} failed: {str(e)}")
+            return False
+        finally:
+            locks.release(lock_file)
+
+
+@contextmanager
+def job_lock(app, name):
+    """Hold job `name`'s file lock for the block, waiting while another worker has it."""
+    lock_path, _ = _job_paths(app, name)
+    with open(lock_path, "a") as lock_file:
+        locks.acquire(lock_file)
+        try:
+            yield
+        finally:
+            locks.release(lock_file)
+
+
+def _loop(app, name, next_delay, func, min_gap):
+    while True:
+        time.sleep(next_delay())
+        run_job(app, name, func, min_gap=min_gap)
+
+
+def _start(app, name, next_delay, func, min_gap):
+    if not app.config.get("BACKGROUND_JOBS_ENABLED", True) or (id(app), name) in _started:
+        return
+    _started.add((id(app), name))
+    thread = threading.Thread(
+        target=_loop, args=(app, name, next_delay, func, min_gap), name=f"job-{name}", daemon=True
+    )
+    thread.start()
+
+
+def schedule_interval(app, name, seconds, func):
+    """Run `func` every `seconds`."""
+    _start(app, name, lambda: seconds, func, min_gap=seconds * 0.5)
+
+
+def schedule_daily(app, name, hour, func):
+    """Run `func` once a day at `hour` (server local time)."""
+    def next_delay():
+        now = datetime.now()
+        run_at = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+        if run_at <= now:
+            run_at += timedelta(days=1)
+        return (run_at - now).total_seconds()
+
+    _start(app, name, next_delay, func, min_gap=12 * 3600)
@@ -0,0 +1,44 @@
+"""
+Cross-process file locks for worker coordination: the job scheduler, metrics
+snapshots and the shared feature matrices.
+
+On Linux and macOS these are fcntl locks. Windows has no fcntl, so there the
+first byte of the lock file is locked with msvcrt instead, polling while
+another process holds it. Lock files are opened in append mode, so taking a
+lock never truncates a file another process has locked.
+"""
+
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def acquire(lock_file, blocking=True):
+    """Lock `lock_file` exclusively; with blocking=False, returns False if another process holds it."""
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+    lock_file.seek(0)
+    while True:
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.05)
+
+
+def release(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,298 @@
+"""
+In-process metrics registry.
+
+Metrics are created once at import time with `counter(...)`, `gauge(...)` or
+`histogram(...)` and updated from request code; values are kept per label
+combination behind a single lock.
+
+Gunicorn runs several worker processes, each with its own registry. When
+`configure(directory)` has been called, every process writes a snapshot of its
+values to `<directory>/<pid>.json` every few seconds (and at exit), and
+`collect()` merges the live values of the scraping process with the other
+workers' snapshots: counters and histograms are summed, gauges are summed over
+live processes only. A dead worker's counters and histograms are folded into
+`archive.json` so totals never go backwards. Other workers' values are
+therefore up to one flush interval old.
+"""
+
+import os
+import json
+import math
+import time
+import atexit
+import threading
+
+from . import locks
+
+_lock = threading.Lock()
+REGISTRY = {}
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with _lock:
+            return [(dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """A value that goes up and down, e.g. requests in flight."""
+    kind = "gauge"
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = float(value)
+
+
+class Histogram(Counter):
+    """Observations counted into cumulative `le` buckets, plus their sum and count."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            # Per-bucket (non-cumulative) counts; the last slot is +Inf.
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            else:
+                entry[0][-1] += 1
+            entry[1] += value
+
+    def samples(self):
+        with _lock:
+            return [(dict(zip(self.labelnames, key)), [list(v[0]), v[1]]) for key, v in self._values.items()]
+
+
+def _register(cls, name, documentation, labelnames, **kwargs):
+    with _lock:
+        metric = REGISTRY.get(name)
+        if metric is None:
+            metric = REGISTRY[name] = cls(name, documentation, labelnames, **kwargs)
+    return metric
+
+
+def counter(name, documentation, labelnames=()):
+    """Return the registered counter `name`, creating it on first use."""
+    return _register(Counter, name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=()):
+    """Return the registered gauge `name`, creating it on first use."""
+    return _register(Gauge, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """Return the registered histogram `name`, creating it on first use."""
+    return _register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+# ---------------------------------------------------------------------------
+# Aggregation across worker processes
+
+_directory = None
+_flush_interval = 5.0
+_flusher_pid = None
+
+
+def snapshot():
+    """This process's values: {name: {"kind", "doc", "labelnames", "buckets", "samples"}}."""
+    return {
+        name: {
+            "kind": metric.kind,
+            "doc": metric.documentation,
+            "labelnames": list(metric.labelnames),
+            "buckets": list(getattr(metric, "buckets", ())),
+            "samples": [[[labels.get(n, "") for n in metric.labelnames], value] for labels, value in metric.samples()],
+        }
+        for name, metric in list(REGISTRY.items())
+    }
+
+
+def configure(directory, flush_interval=5.0):
+    """Share this process's metrics through `directory`; call once per app."""
+    global _directory, _flush_interval
+    os.makedirs(directory, exist_ok=True)
+    _directory, _flush_interval = directory, flush_interval
+    ensure_flusher()
+
+
+def ensure_flusher():
+    """Start this process's snapshot thread (again after a fork); cheap to call per request."""
+    global _flusher_pid
+    if _directory is None or _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(_flush_interval)
+        flush()
+
+
+def flush():
+    """Write this process's snapshot (atomically) for the other workers to merge."""
+    if _directory is None:
+        return
+    path = os.path.join(_directory, f"{os.getpid()}.json")
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(snapshot(), f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Metrics snapshot failed: {str(e)}")
+
+
+atexit.register(flush)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(into, data, with_gauges=True):
+    for name, metric in data.items():
+        if metric["kind"] == "gauge" and not with_gauges:
+            continue
+        target = into.setdefault(name, {**metric, "samples": {}})
+        for labels, value in metric["samples"]:
+            key = tuple(labels)
+            current = target["samples"].get(key)
+            if metric["kind"] == "histogram":
+                if current is None or len(current[0]) != len(value[0]):
+                    current = target["samples"][key] = [[0] * len(value[0]), 0.0]
+                current[0] = [a + b for a, b in zip(current[0], value[0])]
+                current[1] += value[1]
+            else:
+                target["samples"][key] = (current or 0.0) + value
+
+
+def _as_snapshot(merged):
+    return {name: {**m, "samples": [[list(k), v] for k, v in m["samples"].items()]} for name, m in merged.items()}
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def collect():
+    """All metrics merged across worker processes: {name: {..., "samples": {labels tuple: value}}}."""
+    merged = {}
+    _merge(merged, snapshot())
+    if _directory is None:
+        return merged
+    with open(os.path.join(_directory, "archive.lock"), "a") as lock_file:
+        locks.acquire(lock_file)
+        try:
+            archive_path = os.path.join(_directory, "archive.json")
+            archive = {}
+            _merge(archive, _read(archive_path), with_gauges=False)
+            archived = False
+            for entry in os.listdir(_directory):
+                pid, ext = os.path.splitext(entry)
+                if ext != ".json" or not pid.isdigit() or int(pid) == os.getpid():
+                    continue
+                path = os.path.join(_directory, entry)
+                data = _read(path)
+                if _alive(int(pid)):
+                    _merge(merged, data)
+                else:
+                    _merge(archive, data, with_gauges=False)
+                    os.remove(path)
+                    archived = True
+            archive = _as_snapshot(archive)
+            if archived:
+                tmp = archive_path + ".tmp"
+                with open(tmp, "w") as f:
+                    json.dump(archive, f)
+                os.replace(tmp, archive_path)
+            _merge(merged, archive)
+        finally:
+            locks.release(lock_file)
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render(metrics=None):
+    """Prometheus text exposition (format 0.0.4) of `metrics` (default: `collect()`)."""
+    metrics = collect() if metrics is None else metrics
+    lines = []
+    for name in sorted(metrics):
+        metric = metrics[name]
+        lines.append(f"# HELP {name} {metric['doc']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        names = metric["labelnames"]
+        for key, value in sorted(metric["samples"].items()):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_labels(names, key)} {_number(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(list(metric["buckets"]) + [math.inf], counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(names, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, key)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(names, key)} {cumulative}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,43 @@
+"""
+Additive schema upgrades for databases created before a model change.
+
+`db.create_all()` only creates missing tables, so indexes and columns (nullable,
+or with a server default) added to existing models are applied here,
+idempotently, at startup.
+"""
+
+from sqlalchemy import inspect, text
+
+from .extensions import db
+
+
+def _ensure_indexes(engine, table):
+    existing = {ix["name"] for ix in inspect(engine).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _ensure_columns(engine, table):
+    existing = {col["name"] for col in inspect(engine).get_columns(table.name)}
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        if not column.nullable and column.server_default is None:
+            raise RuntimeError(f"{table.name}.{column.name} needs a server_default to be added in place")
+        quote = engine.dialect.identifier_preparer.quote
+        ddl = f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(engine.dialect)}"
+        if column.server_default is not None:
+            ddl += f" DEFAULT {column.server_default.arg}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+        with engine.begin() as conn:
+            conn.execute(text(ddl))
+
+
+def upgrade_schema():
+    engine = db.engine
+    for table in db.metadata.sorted_tables:
+        if inspect(engine).has_table(table.name):
+            _ensure_columns(engine, table)
+            _ensure_indexes(engine, table)
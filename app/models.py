@@ -10,18 +10,25 @@ class Artwork(db.Model):
     name = db.Column(db.String(200), nullable=False, default="Untitled Artwork")
     description = db.Column(db.Text, nullable=True)
     price = db.Column(db.Float, nullable=True)
-    artwork_type = db.Column(db.String(50), nullable=True)
-    artist = db.Column(db.String(200), nullable=True)
+    artwork_type = db.Column(db.String(50), nullable=True, index=True)
+    artist = db.Column(db.String(200), nullable=True, index=True)
     year_created = db.Column(db.Integer, nullable=True)
     dimensions = db.Column(db.String(100), nullable=True)
-    medium = db.Column(db.String(100), nullable=True)
-    style = db.Column(db.String(100), nullable=True)
-    image_data = db.Column(db.LargeBinary, nullable=False)
-    glb_data = db.Column(db.LargeBinary, nullable=True)
+    medium = db.Column(db.String(100), nullable=True, index=True)
+    style = db.Column(db.String(100), nullable=True, index=True)
+    # Blobs are deferred: listing/detail queries never pull them; read them by
+    # selecting the column explicitly (see artworks._send_blob)
+    image_data = db.deferred(db.Column(db.LargeBinary, nullable=False))
+    glb_data = db.deferred(db.Column(db.LargeBinary, nullable=True))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     filename = db.Column(db.String(200), nullable=False)
 
     is_sold = db.Column(db.Boolean, default=False)
+    # Checkout hold (see reservations.py): buyer id and UTC expiry
+    reserved_by = db.Column(db.Integer, nullable=True)
+    reserved_until = db.Column(db.DateTime, nullable=True, index=True)
+    # When recommendation_store last computed this artwork's list (which may be empty)
+    recommendations_computed_at = db.Column(db.DateTime, nullable=True)
 
 
    
@@ -35,7 +42,76 @@ class User(db.Model):
     name = db.Column(db.String(120), nullable=False)
     email = db.Column(db.String(255), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
+    # Bumped on password change / "log out everywhere"; sessions carrying an older value are rejected.
+    session_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
         return f"<User {self.name} ({self.email})>"
+
+class Recommendation(db.Model):
+    """Materialized top-N neighbours of an artwork, refreshed incrementally."""
+    __table_args__ = (
+        db.Index("ix_recommendation_artwork_rank", "artwork_id", "rank"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    artwork_id = db.Column(db.Integer, db.ForeignKey("artwork.id"), nullable=False)
+    neighbour_id = db.Column(db.Integer, db.ForeignKey("artwork.id"), nullable=False, index=True)
+    rank = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Recommendation {self.artwork_id} -> {self.neighbour_id} #{self.rank}>"
+
+class Order(db.Model):
+    """A gateway order and its payment state; one row per Razorpay order."""
+    __table_args__ = (
+        # Purchase history: a buyer's orders, newest first, read straight off the index.
+        db.Index("ix_order_buyer_id_id", "buyer_id", "id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    razorpay_order_id = db.Column(db.String(64), unique=True, nullable=False)
+    buyer_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    # Single-artwork orders only; cart orders list their pieces in OrderItem.
+    artwork_id = db.Column(db.Integer, db.ForeignKey("artwork.id"), nullable=True, index=True)
+    amount = db.Column(db.Integer, nullable=False)  # paise
+    currency = db.Column(db.String(8), nullable=False, default="INR")
+    status = db.Column(db.String(16), nullable=False, default="created")  # created | paid | failed
+    razorpay_payment_id = db.Column(db.String(64), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    paid_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<Order {self.razorpay_order_id} {self.status}>"
+
+class OrderItem(db.Model):
+    """One artwork in an order, with the price charged for it."""
+    __table_args__ = (
+        db.UniqueConstraint("order_id", "artwork_id", name="uq_order_item_order_artwork"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey("order.id"), nullable=False, index=True)
+    artwork_id = db.Column(db.Integer, db.ForeignKey("artwork.id"), nullable=False, index=True)
+    amount = db.Column(db.Integer, nullable=False)  # paise
+
+    def __repr__(self):
+        return f"<OrderItem order={self.order_id} artwork={self.artwork_id}>"
+
+class PaymentEvent(db.Model):
+    """A verified gateway webhook, queued durably until the consumer applies it."""
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(128), unique=True, nullable=False)  # idempotency key
+    event = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True, index=True)
+    outcome = db.Column(db.String(32), nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    error = db.Column(db.Text, nullable=True)
+
+    def __repr__(self):
+        return f"<PaymentEvent {self.event_id} {self.event}>"
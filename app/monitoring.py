@@ -0,0 +1,98 @@
+"""
+Request and database metrics, and the Prometheus `/metrics` endpoint.
+
+Every request is counted by route (the blueprint endpoint, e.g.
+"artworks.list_artworks"), method and status, its latency goes into a
+histogram, and requests in flight are tracked per route. SQL statements are
+counted through a SQLAlchemy engine event, per route (or "background" outside a
+request), and per request in a histogram. `/metrics` serves the values merged
+across gunicorn workers (see app/metrics.py); set METRICS_TOKEN to require
+`Authorization: Bearer <token>`.
+"""
+
+import os
+import hmac
+import time
+
+from flask import Blueprint, Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import metrics
+from .metrics import counter, gauge, histogram
+
+monitoring_bp = Blueprint("monitoring", __name__)
+
+requests_total = counter("http_requests_total", "HTTP requests by route, method and status",
+                         ("route", "method", "status"))
+request_seconds = histogram("http_request_duration_seconds", "Time to produce the response", ("route", "method"))
+requests_in_flight = gauge("http_requests_in_flight", "Requests being handled right now", ("route",))
+db_queries_total = counter("db_queries_total", "SQL statements executed", ("route",))
+request_db_queries = histogram("http_request_db_queries", "SQL statements per request", ("route",),
+                               buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250))
+
+_listening = False
+
+
+def _route():
+    return request.endpoint or "unmatched"
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g._db_queries = g.get("_db_queries", 0) + 1
+        db_queries_total.inc(route=_route())
+    else:
+        db_queries_total.inc(route="background")
+
+
+def _start_request():
+    metrics.ensure_flusher()
+    g._metrics_started = time.perf_counter()
+    g._metrics_route = _route()
+    requests_in_flight.inc(route=g._metrics_route)
+
+
+def _record(status):
+    if g.get("_metrics_recorded") or "_metrics_started" not in g:
+        return
+    g._metrics_recorded = True
+    route = g._metrics_route
+    request_seconds.observe(time.perf_counter() - g._metrics_started, route=route, method=request.method)
+    requests_total.inc(route=route, method=request.method, status=status)
+    request_db_queries.observe(g.get("_db_queries", 0), route=route)
+
+
+def _after_request(response):
+    _record(response.status_code)
+    return response
+
+
+def _teardown_request(exc):
+    if "_metrics_started" in g:
+        _record(500)  # only if after_request never ran (unhandled exception)
+        requests_in_flight.dec(route=g._metrics_route)
+
+
+def init_app(app):
+    global _listening
+    app.config.setdefault("METRICS_DIR", os.path.join(app.instance_path, "metrics"))
+    app.config.setdefault("METRICS_FLUSH_INTERVAL", 5.0)
+    app.config.setdefault("METRICS_TOKEN", None)
+    metrics.configure(app.config["METRICS_DIR"], app.config["METRICS_FLUSH_INTERVAL"])
+    if not _listening:
+        event.listen(Engine, "before_cursor_execute", _count_query)
+        _listening = True
+    app.before_request(_start_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.register_blueprint(monitoring_bp)
+
+
+@monitoring_bp.route("/metrics")
+def metrics_endpoint():
+    token = current_app.config["METRICS_TOKEN"]
+    # Bytes, since compare_digest raises TypeError on non-ASCII str input.
+    if token and not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+        return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
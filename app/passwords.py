@@ -0,0 +1,100 @@
+"""
+Password hashing off the request thread, with back-pressure.
+
+Key derivation is deliberately slow, so a burst of logins could otherwise pin
+every worker thread and stall catalog and image traffic. Hashes run on a small
+per-process thread pool (hashlib releases the GIL while deriving), and at most
+`PASSWORD_HASH_MAX_PENDING` requests may wait on it: beyond that `HashingBusy`
+is raised and the caller answers 503 with Retry-After instead of queueing.
+
+The request thread still blocks until its hash is done; what the pool buys is a
+cap of `PASSWORD_HASH_WORKERS` hashes at a time across a worker's threads. That
+only matters with threaded (gthread) workers, as in gunicorn.conf.py. A sync
+worker serves one request at a time, so there it just adds a thread hop.
+
+The hash method (and so its cost) comes from `PASSWORD_HASH_METHOD`; stored
+hashes made with another method are upgraded on the next successful login.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+
+class HashingBusy(Exception):
+    """Raised when too many password hashes are already queued in this process."""
+
+    def __init__(self, retry_after=1):
+        super().__init__("password hashing is saturated")
+        self.retry_after = retry_after
+
+
+def _full_method(method):
+    """The method string werkzeug records in the hash, e.g. "pbkdf2:sha256" -> "pbkdf2:sha256:260000"."""
+    if not method.startswith("pbkdf2:"):
+        return method
+    args = method[7:].split(":")
+    # A missing or empty iteration count ("pbkdf2:sha256:") means werkzeug's default.
+    iterations = args[1] if len(args) > 1 and args[1] else DEFAULT_PBKDF2_ITERATIONS
+    return f"pbkdf2:{args[0]}:{int(iterations)}"
+
+
+class PasswordHasher:
+    """Flask extension owning the process-wide hashing pool."""
+
+    def __init__(self, app=None):
+        self.method = "pbkdf2:sha256:260000"
+        self.workers = 2
+        self.max_pending = 8
+        self.retry_after = 1
+        self._executor = None
+        self._pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("PASSWORD_HASH_METHOD", self.method)
+        app.config.setdefault("PASSWORD_HASH_WORKERS", self.workers)
+        app.config.setdefault("PASSWORD_HASH_MAX_PENDING", self.max_pending)
+        app.config.setdefault("PASSWORD_HASH_RETRY_AFTER", self.retry_after)
+        # werkzeug itself would hash "pbkdf2:sha256:" with 0 iterations (and fail).
+        self.method = _full_method(app.config["PASSWORD_HASH_METHOD"])
+        self.workers = app.config["PASSWORD_HASH_WORKERS"]
+        self.max_pending = max(app.config["PASSWORD_HASH_MAX_PENDING"], self.workers)
+        self.retry_after = app.config["PASSWORD_HASH_RETRY_AFTER"]
+        app.extensions["password_hasher"] = self
+
+    def _pool(self):
+        # Created lazily (and again after a fork) so a preloading master
+        # never hands its threads to worker processes.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pwhash")
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+                self._pid = os.getpid()
+            return self._executor, self._slots
+
+    def _run(self, fn, *args):
+        executor, slots = self._pool()
+        if not slots.acquire(blocking=False):
+            raise HashingBusy(self.retry_after)
+        try:
+            return executor.submit(fn, *args).result()
+        finally:
+            slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        if not stored_hash:
+            return False
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        """True when `stored_hash` was made with a method other than the configured one."""
+        return _full_method((stored_hash or "").split("$", 1)[0]) != self.method
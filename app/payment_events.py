@@ -0,0 +1,149 @@
+"""
+Durable queue of Razorpay webhook events.
+
+The webhook only verifies the signature and appends the event to the
+`payment_event` table (the event id is unique, so redeliveries are dropped),
+then answers at once. A background job drains the queue in batches: events for
+the same order in a burst (payment.captured and order.paid usually arrive
+together) are applied once through `settle_order`, which is itself idempotent,
+and the whole batch is then marked processed with bulk UPDATEs.
+
+A webhook can arrive before the order row it refers to has been committed, so
+an event for an unknown order stays pending, with its attempts counted, and is
+only dead-lettered as "unknown_order" once it is PAYMENT_EVENTS_ORDER_WAIT
+seconds old. Retried events are taken after fresh ones, so they can't crowd new
+events out of a batch.
+"""
+
+import json
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db
+from .models import Order, PaymentEvent
+
+# Events that confirm a payment for an order; anything else is recorded and skipped.
+SETTLING_EVENTS = ("payment.captured", "order.paid")
+
+
+def enqueue(event_id, event, payload):
+    """Append a verified event; returns False if this event id was already queued."""
+    db.session.add(PaymentEvent(event_id=event_id, event=event or "", payload=payload))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+
+def _entity(body, key):
+    value = body.get(key) if isinstance(body, dict) else None
+    entity = value.get("entity") if isinstance(value, dict) else None
+    return entity if isinstance(entity, dict) else {}
+
+
+def _payment_refs(payload):
+    """(razorpay order id, payment id) carried by a payment/order event, or (None, None)."""
+    body = payload.get("payload") if isinstance(payload, dict) else None
+    payment, order = _entity(body, "payment"), _entity(body, "order")
+    order_ref = payment.get("order_id") or order.get("id")
+    payment_id = payment.get("id")
+    if not isinstance(order_ref, str) or not isinstance(payment_id, str):
+        return None, None
+    return order_ref, payment_id
+
+
+def _mark(ids, **values):
+    if ids:
+        db.session.execute(
+            update(PaymentEvent)
+            .where(PaymentEvent.id.in_(ids))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def process_batch(batch_size=None):
+    """Apply up to `batch_size` pending events; returns how many were taken off the queue."""
+    from .payments import settle_order
+
+    batch_size = batch_size or current_app.config["PAYMENT_EVENTS_BATCH_SIZE"]
+    max_attempts = current_app.config["PAYMENT_EVENTS_MAX_ATTEMPTS"]
+    rows = (
+        db.session.query(
+            PaymentEvent.id, PaymentEvent.event, PaymentEvent.payload, PaymentEvent.attempts, PaymentEvent.received_at
+        )
+        .filter(PaymentEvent.processed_at.is_(None))
+        .order_by(PaymentEvent.attempts, PaymentEvent.id)
+        .limit(batch_size)
+        .all()
+    )
+    if not rows:
+        return 0
+
+    outcomes = {}                       # outcome -> [event row ids]
+    by_payment = {}                     # (order id, payment id) -> [event row ids]
+    for row in rows:
+        try:
+            order_ref, payment_id = _payment_refs(json.loads(row.payload))
+        except (ValueError, TypeError, AttributeError):
+            # Dead-letter it: an event that can't be parsed must not hold up the queue.
+            outcomes.setdefault("malformed", []).append(row.id)
+            continue
+        if row.event not in SETTLING_EVENTS or not order_ref or not payment_id:
+            outcomes.setdefault("ignored", []).append(row.id)
+        else:
+            by_payment.setdefault((order_ref, payment_id), []).append(row.id)
+
+    order_ids = dict(
+        db.session.query(Order.razorpay_order_id, Order.id)
+        .filter(Order.razorpay_order_id.in_({ref for ref, _ in by_payment}))
+    )
+    now = datetime.utcnow()
+    wait_until = now - timedelta(seconds=current_app.config["PAYMENT_EVENTS_ORDER_WAIT"])
+    attempts = {row.id: row.attempts for row in rows}
+    received = {row.id: row.received_at for row in rows}
+    failed = {}
+    waiting = []                        # unknown order, still within PAYMENT_EVENTS_ORDER_WAIT
+    for (order_ref, payment_id), ids in by_payment.items():
+        if order_ref not in order_ids:
+            for event_row in ids:
+                if received[event_row] is not None and received[event_row] < wait_until:
+                    outcomes.setdefault("unknown_order", []).append(event_row)
+                else:
+                    waiting.append(event_row)
+            continue
+        try:
+            outcome, _, _ = settle_order(order_ids[order_ref], payment_id)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Payment event for {order_ref} failed: {str(e)}")
+            for event_row in ids:
+                failed[event_row] = str(e)
+            continue
+        outcomes.setdefault(outcome, []).extend(ids)
+
+    for outcome, ids in outcomes.items():
+        _mark(ids, processed_at=now, outcome=outcome)
+    for event_row, error in failed.items():
+        done = attempts[event_row] + 1 >= max_attempts
+        _mark([event_row], attempts=attempts[event_row] + 1, error=error,
+              processed_at=now if done else None, outcome="error" if done else None)
+    _mark(waiting, attempts=PaymentEvent.attempts + 1, error="order not found yet")
+    db.session.commit()
+    retrying = sum(1 for event_row in failed if attempts[event_row] + 1 < max_attempts) + len(waiting)
+    return len(rows) - retrying
+
+
+def apply_payment_events():
+    """Drain the queue (background job); returns the number of events processed."""
+    total = 0
+    while True:
+        taken = process_batch()
+        total += taken
+        if taken < current_app.config["PAYMENT_EVENTS_BATCH_SIZE"]:
+            return total
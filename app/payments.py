@@ -1,23 +1,77 @@
 import os
 import hmac
+import json
 import hashlib
+import threading
+from datetime import datetime
 import razorpay
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from sqlalchemy import update
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from .extensions import db
-from .models import Artwork
-from .auth import get_current_user   # 👈 important
+from .models import Artwork, Order, OrderItem
+from .auth import get_current_user, current_identity   # 👈 important
+from . import payment_events, recommendation_store, reservations
+from .query_guard import query_budget
 
 payments_bp = Blueprint("payments", __name__)
 
+class TimeoutSession(requests.Session):
+    """requests.Session that applies a default (connect, read) timeout to every call."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+def _build_session(config):
+    # Connection errors are retried for every method (nothing reached the
+    # gateway); 429/5xx only for idempotent GETs so an order is never created twice.
+    retry = Retry(
+        total=config["RAZORPAY_MAX_RETRIES"],
+        connect=config["RAZORPAY_MAX_RETRIES"],
+        read=0,
+        status=config["RAZORPAY_MAX_RETRIES"],
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        backoff_factor=0.2,
+        backoff_jitter=0.2,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config["RAZORPAY_POOL_SIZE"], max_retries=retry)
+    session = TimeoutSession((config["RAZORPAY_CONNECT_TIMEOUT"], config["RAZORPAY_READ_TIMEOUT"]))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
 def get_razorpay_client():
-    key_id = os.environ.get("RAZORPAY_KEY_ID")
-    key_secret = os.environ.get("RAZORPAY_KEY_SECRET")
+    """Process-wide Razorpay client; its pooled session keeps connections to the gateway alive."""
+    global _client, _client_pid
+    config = current_app.config
+    key_id = config.get("RAZORPAY_KEY_ID")
+    key_secret = config.get("RAZORPAY_KEY_SECRET")
 
     if not key_id or not key_secret:
         raise Exception("Razorpay keys missing. Add RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET in .env")
 
-    return razorpay.Client(auth=(key_id, key_secret))
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid() or _client.auth != (key_id, key_secret):
+            options = {}
+            if config.get("RAZORPAY_BASE_URL"):
+                options["base_url"] = config["RAZORPAY_BASE_URL"]
+            _client = razorpay.Client(session=_build_session(config), auth=(key_id, key_secret), **options)
+            _client_pid = os.getpid()
+        return _client
 
 # ✅ 1) Create Order
 # ✅ 1) Create Order (single artwork)
@@ -45,71 +99,300 @@ def create_order():
 
     amount_in_paise = int(float(artwork.price) * 100)
 
-    client = razorpay.Client(auth=(
-        os.environ.get("RAZORPAY_KEY_ID"),
-        os.environ.get("RAZORPAY_KEY_SECRET")
-    ))
-
-    order = client.order.create({
-        "amount": amount_in_paise,
-        "currency": "INR",
-        "payment_capture": 1,
-        "notes": {
-            "buyer_id": str(user.id),
-            "artwork_id": str(artwork.id),
-        }
+    # Hold the piece for this buyer before going to the gateway, so two
+    # checkouts can't both end up paying for it.
+    reserved_until = reservations.reserve(artwork.id, user.id)
+    if reserved_until is None:
+        return jsonify({"success": False, "error": "Artwork is being purchased by another buyer"}), 409
+
+    return _start_checkout(user.id, [(artwork.id, amount_in_paise)], reserved_until, {
+        "buyer_id": str(user.id),
+        "artwork_id": str(artwork.id),
+    })
+
+# ✅ 1b) Create Order (whole cart)
+@payments_bp.route("/api/create-cart-order", methods=["POST"])
+def create_cart_order():
+    identity = current_identity()
+    if not identity:
+        return jsonify({"success": False, "error": "Not authenticated"}), 401
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"success": False, "error": "Body must be a JSON object"}), 400
+    raw_ids = data.get("artwork_ids")
+    if not raw_ids:
+        return jsonify({"success": False, "error": "artwork_ids is required"}), 400
+    # bool is an int subclass, but true/false are not artwork ids.
+    if not isinstance(raw_ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in raw_ids):
+        return jsonify({"success": False, "error": "artwork_ids must be a list of artwork ids"}), 400
+    artwork_ids = list(dict.fromkeys(raw_ids))
+    if len(artwork_ids) > current_app.config["CART_MAX_ITEMS"]:
+        return jsonify({"success": False, "error": f"At most {current_app.config['CART_MAX_ITEMS']} items per order"}), 400
+
+    user_id = identity["id"]
+    problems = reservations.unavailable(artwork_ids, user_id)
+    reserved_until = None if problems else reservations.reserve_many(artwork_ids, user_id)
+    if reserved_until is None:
+        problems = problems or reservations.unavailable(artwork_ids, user_id)
+        return jsonify({
+            "success": False,
+            "error": "Some items are no longer available",
+            "items": {str(i): reason for i, reason in problems.items()},
+        }), 409
+
+    prices = dict(db.session.query(Artwork.id, Artwork.price).filter(Artwork.id.in_(artwork_ids)))
+    items = [(i, int(float(prices[i]) * 100)) for i in artwork_ids]
+    return _start_checkout(user_id, items, reserved_until, {
+        "buyer_id": str(user_id),
+        "artwork_ids": ",".join(str(i) for i in artwork_ids),
     })
 
+def _start_checkout(user_id, items, reserved_until, notes):
+    """Create one gateway order for `items` [(artwork_id, paise)] already held for the buyer, and record it."""
+    artwork_ids = [artwork_id for artwork_id, _ in items]
+    try:
+        order = get_razorpay_client().order.create({
+            "amount": sum(amount for _, amount in items),
+            "currency": "INR",
+            "payment_capture": 1,
+            "notes": notes,
+        })
+    except (requests.RequestException, razorpay.errors.BadRequestError,
+            razorpay.errors.GatewayError, razorpay.errors.ServerError) as e:
+        print(f"Razorpay order creation failed for artworks {artwork_ids}: {str(e)}")
+        reservations.release_many(artwork_ids, user_id)
+        return jsonify({"success": False, "error": "Payment gateway unavailable, please try again"}), 502
+
+    try:
+        row = Order(
+            razorpay_order_id=order["id"],
+            buyer_id=user_id,
+            artwork_id=artwork_ids[0] if len(artwork_ids) == 1 else None,
+            amount=order["amount"],
+            currency=order["currency"],
+        )
+        db.session.add(row)
+        db.session.flush()
+        db.session.add_all([OrderItem(order_id=row.id, artwork_id=i, amount=amount) for i, amount in items])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        reservations.release_many(artwork_ids, user_id)
+        print(f"Could not record order {order['id']} for artworks {artwork_ids}: {str(e)}")
+        return jsonify({"success": False, "error": "Could not record order, please try again"}), 500
+
     return jsonify({
         "success": True,
         "order_id": order["id"],
         "amount": order["amount"],
         "currency": order["currency"],
-        "key_id": os.environ.get("RAZORPAY_KEY_ID"),
+        "key_id": current_app.config.get("RAZORPAY_KEY_ID"),
+        "artwork_ids": artwork_ids,
+        "reserved_until": reserved_until.isoformat() + "Z",
     })
 
+def _order_artwork_ids(order_id, artwork_id=None):
+    ids = [i for (i,) in db.session.query(OrderItem.artwork_id).filter(OrderItem.order_id == order_id)]
+    return ids or ([artwork_id] if artwork_id else [])
 
+def _signature_valid(razorpay_order_id, razorpay_payment_id, razorpay_signature):
+    key_secret = current_app.config.get("RAZORPAY_KEY_SECRET")
+    if not key_secret:
+        raise Exception("Razorpay secret missing in env")
+    payload = f"{razorpay_order_id}|{razorpay_payment_id}"
+    expected_signature = hmac.new(
+        key_secret.encode(),
+        payload.encode(),
+        hashlib.sha256
+    ).hexdigest()
+    # compare_digest raises TypeError on non-ASCII str input.
+    return razorpay_signature.isascii() and hmac.compare_digest(expected_signature, razorpay_signature)
 
+def _already_paid(razorpay_payment_id):
+    return jsonify({"success": True, "message": "Payment already verified", "payment_id": razorpay_payment_id})
 
 @payments_bp.route("/api/verify-payment", methods=["POST"])
 def verify_payment():
-    user = get_current_user()
-    if not user:
+    identity = current_identity()
+    if not identity:
         return jsonify({"success": False, "error": "Not authenticated"}), 401
 
-    data = request.get_json() or {}
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
 
     razorpay_order_id = data.get("razorpay_order_id")
     razorpay_payment_id = data.get("razorpay_payment_id")
     razorpay_signature = data.get("razorpay_signature")
-    artwork_id = data.get("artwork_id")
 
-    if not razorpay_order_id or not razorpay_payment_id or not razorpay_signature or not artwork_id:
+    fields = (razorpay_order_id, razorpay_payment_id, razorpay_signature)
+    if not all(isinstance(f, str) and f for f in fields):
         return jsonify({"success": False, "error": "Missing payment verification fields"}), 400
 
-    artwork = Artwork.query.get(artwork_id)
-    if not artwork:
-        return jsonify({"success": False, "error": "Artwork not found"}), 404
+    order = Order.query.filter_by(razorpay_order_id=razorpay_order_id).first()
+    if not order or order.buyer_id != identity["id"]:
+        return jsonify({"success": False, "error": "Order not found"}), 404
 
-    if artwork.is_sold:
-        return jsonify({"success": False, "error": "Artwork already sold"}), 400
+    # Retries of an already-applied verification are answered from the row alone.
+    if order.status == "paid":
+        if order.razorpay_payment_id == razorpay_payment_id:
+            return _already_paid(razorpay_payment_id)
+        return jsonify({"success": False, "error": "Order already paid"}), 409
+    if order.status != "created":
+        return jsonify({"success": False, "error": "Order can no longer be completed"}), 409
 
-    key_secret = os.environ.get("RAZORPAY_KEY_SECRET")
-    if not key_secret:
-        return jsonify({"success": False, "error": "Razorpay secret missing in env"}), 500
+    try:
+        valid = _signature_valid(razorpay_order_id, razorpay_payment_id, razorpay_signature)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    if not valid:
+        return jsonify({"success": False, "error": "Payment verification failed"}), 400
 
-    payload = f"{razorpay_order_id}|{razorpay_payment_id}"
-    expected_signature = hmac.new(
-        key_secret.encode(),
-        payload.encode(),
-        hashlib.sha256
-    ).hexdigest()
+    outcome, artwork_ids, problems = settle_order(order.id, razorpay_payment_id)
+    if outcome == "already_paid":
+        return _already_paid(razorpay_payment_id)
+    if outcome == "closed":
+        return jsonify({"success": False, "error": "Order can no longer be completed"}), 409
+    if outcome == "lost":
+        return jsonify({
+            "success": False,
+            "error": "Artwork was sold to another buyer",
+            "items": {str(i): reason for i, reason in problems.items()},
+        }), 409
+    return jsonify({"success": True, "message": "Payment verified, artwork marked as sold", "artwork_ids": artwork_ids})
 
-    if expected_signature != razorpay_signature:
-        return jsonify({"success": False, "error": "Payment verification failed"}), 400
+def settle_order(order_id, razorpay_payment_id):
+    """
+    Apply a confirmed payment to an order; shared by verify-payment and the webhook consumer.
+
+    Returns (outcome, artwork_ids, problems) where outcome is "paid" (applied now),
+    "already_paid" (this payment was applied before), "closed" (order failed or
+    paid by another payment) or "lost" (an item went to another buyer; the order
+    is marked failed and `problems` gives a reason per item).
+    """
+    order = db.session.get(Order, order_id)
+    artwork_ids = _order_artwork_ids(order.id, order.artwork_id)
 
-    # ✅ Mark artwork sold
-    artwork.is_sold = True
+    # created -> paid happens once; a concurrent retry that loses just reports the outcome.
+    claimed = db.session.execute(
+        update(Order)
+        .where(Order.id == order.id, Order.status == "created")
+        .values(status="paid", razorpay_payment_id=razorpay_payment_id, paid_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        status, payment_id = db.session.query(Order.status, Order.razorpay_payment_id).filter(Order.id == order.id).one()
+        if status == "paid" and payment_id == razorpay_payment_id:
+            return "already_paid", artwork_ids, {}
+        return "closed", artwork_ids, {}
+
+    # ✅ Mark every artwork in the order sold in one UPDATE (only if this buyer
+    # still holds them, or nobody does); all or nothing.
+    if not reservations.mark_sold_many(artwork_ids, order.buyer_id):
+        db.session.rollback()
+        problems = reservations.unavailable(artwork_ids, order.buyer_id)
+        db.session.execute(
+            update(Order)
+            .where(Order.id == order.id, Order.status == "created")
+            .values(status="failed", razorpay_payment_id=razorpay_payment_id)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        print(f"Payment {razorpay_payment_id} for artworks {artwork_ids} arrived after they were sold or re-reserved")
+        return "lost", artwork_ids, problems
     db.session.commit()
 
-    return jsonify({"success": True, "message": "Payment verified, artwork marked as sold"})
+    for artwork_id in artwork_ids:
+        try:
+            recommendation_store.on_artwork_sold(artwork_id)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Recommendation update failed for artwork {artwork_id}: {str(e)}")
+    return "paid", artwork_ids, {}
+
+# ✅ 3) Purchase history
+@payments_bp.route("/api/orders", methods=["GET"])
+@query_budget(3)
+def list_orders():
+    """The buyer's orders, newest first; page with ?before=<next_before>&limit=N."""
+    identity = current_identity()
+    if not identity:
+        return jsonify({"success": False, "error": "Not authenticated"}), 401
+
+    try:
+        limit = min(max(int(request.args.get("limit", 20)), 1), 100)
+        before = request.args.get("before")
+        before = int(before) if before else None
+    except ValueError:
+        return jsonify({"success": False, "error": "limit and before must be integers"}), 400
+
+    query = (
+        db.session.query(
+            Order.id, Order.razorpay_order_id, Order.artwork_id, Order.amount, Order.currency,
+            Order.status, Order.created_at, Order.paid_at, Artwork.name, Artwork.artist,
+        )
+        .outerjoin(Artwork, Artwork.id == Order.artwork_id)
+        .filter(Order.buyer_id == identity["id"])
+    )
+    if before is not None:
+        query = query.filter(Order.id < before)
+    rows = query.order_by(Order.id.desc()).limit(limit + 1).all()
+    items = {}
+    for order_id, artwork_id in db.session.query(OrderItem.order_id, OrderItem.artwork_id).filter(
+        OrderItem.order_id.in_([r.id for r in rows[:limit]])
+    ):
+        items.setdefault(order_id, []).append(artwork_id)
+
+    return jsonify({
+        "success": True,
+        "orders": [
+            {
+                "id": r.id,
+                "order_id": r.razorpay_order_id,
+                "artwork_id": r.artwork_id,
+                "artwork_ids": items.get(r.id, [r.artwork_id] if r.artwork_id else []),
+                "artwork_name": r.name,
+                "artist": r.artist,
+                "amount": r.amount,
+                "currency": r.currency,
+                "status": r.status,
+                "created_at": r.created_at.isoformat() if r.created_at else None,
+                "paid_at": r.paid_at.isoformat() if r.paid_at else None,
+            }
+            for r in rows[:limit]
+        ],
+        "next_before": rows[limit - 1].id if len(rows) > limit else None,
+    })
+
+# ✅ 4) Gateway webhooks: verify, queue durably, answer at once
+@payments_bp.route("/api/razorpay/webhook", methods=["POST"])
+def razorpay_webhook():
+    secret = current_app.config.get("RAZORPAY_WEBHOOK_SECRET")
+    if not secret:
+        return jsonify({"success": False, "error": "Webhook secret not configured"}), 500
+
+    body = request.get_data()
+    signature = request.headers.get("X-Razorpay-Signature", "")
+    expected_signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    # compare_digest raises TypeError on non-ASCII str input.
+    if not signature.isascii() or not hmac.compare_digest(expected_signature, signature):
+        return jsonify({"success": False, "error": "Invalid signature"}), 400
+
+    # json.loads would also accept UTF-16/32 bytes; the queue stores UTF-8 text.
+    try:
+        payload = body.decode("utf-8")
+    except UnicodeDecodeError:
+        return jsonify({"success": False, "error": "Body must be UTF-8"}), 400
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid JSON"}), 400
+    if not isinstance(event, dict) or not isinstance(event.get("event", ""), str):
+        return jsonify({"success": False, "error": "Event must be a JSON object"}), 400
+
+    # Razorpay sends the same X-Razorpay-Event-Id on every redelivery.
+    event_id = request.headers.get("X-Razorpay-Event-Id") or hashlib.sha256(body).hexdigest()
+    queued = payment_events.enqueue(event_id, event.get("event"), payload)
+    return jsonify({"success": True, "status": "queued" if queued else "duplicate"})
@@ -10,7 +10,8 @@ from PIL import Image
 import requests
 
 from .models import Artwork
-from .extensions import db
+from .extensions import db, visual_index
+from . import recommendation_store
 from .artworks import create_glb_from_image
 from . import create_app
 
@@ -191,6 +192,8 @@ and artistic technique. Do not mention the price or commercial aspects."""
 
             db.session.add(artwork)
             db.session.commit()
+            visual_index.add_artwork(artwork.id, image_data)
+            recommendation_store.on_artwork_saved(artwork)
 
             print(f"✅ Successfully added: {metadata['name']} by {metadata['artist']}")
             return True
@@ -0,0 +1,161 @@
+"""
+Per-request timing breakdown and opt-in profiles.
+
+For every request this records, through SQLAlchemy engine events, how many SQL
+statements ran, their total time and the slowest one; functions decorated with
+`@timed("name")` (GLB generation, image decoding) add their own spans. The
+breakdown is sent back as a `Server-Timing` header, e.g.
+
+    Server-Timing: sql;dur=12.4;desc="7 queries", glb;dur=380.2, app;dur=401.0
+
+on every response when SERVER_TIMING_ENABLED is set (off by default, since it
+exposes query counts and internal span names), otherwise only on requests
+carrying `X-Profile: <PROFILE_TOKEN>`. Requests slower than PROFILE_SLOW_REQUEST_MS are logged with their slowest
+statement.
+
+A request can also be profiled with cProfile: a PROFILE_SAMPLE_RATE fraction
+of requests, or any request carrying `X-Profile: <PROFILE_TOKEN>`. The profile is
+written to PROFILE_DIR as `<time>-<endpoint>-<ms>ms.prof` (open it with
+`python -m pstats` or snakeviz) next to a `.txt` summary.
+"""
+
+import os
+import hmac
+import time
+import random
+import pstats
+import cProfile
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_listening = False
+
+
+class RequestTimings:
+    """What one request spent its time on."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.slowest_sql = (0.0, None)
+        self.spans = {}
+
+    def add_span(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self, total):
+        queries = "query" if self.sql_count == 1 else "queries"
+        parts = [f'sql;dur={self.sql_seconds * 1000:.1f};desc="{self.sql_count} {queries}"']
+        parts += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.spans.items()]
+        parts.append(f"app;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def _timings():
+    return g.get("_timings") if has_request_context() else None
+
+
+def timed(name):
+    """Decorator: add the call's duration to this request's `name` span (no-op outside requests)."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = _timings()
+            if timings is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.add_span(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _timings() is not None:
+        conn.info.setdefault("_query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = _timings()
+    started = conn.info.get("_query_started")
+    if timings is None or not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    timings.sql_count += 1
+    timings.sql_seconds += seconds
+    if seconds > timings.slowest_sql[0]:
+        timings.slowest_sql = (seconds, statement)
+
+
+def _start_request():
+    g._timings = RequestTimings()
+    config = current_app.config
+    token = config["PROFILE_TOKEN"]
+    g._profile_requested = bool(token) and hmac.compare_digest(
+        request.headers.get("X-Profile", "").encode(), token.encode()
+    )
+    wanted = g._profile_requested or (
+        config["PROFILE_SAMPLE_RATE"] and random.random() < config["PROFILE_SAMPLE_RATE"]
+    )
+    if wanted:
+        g._profiler = cProfile.Profile()
+        g._profiler.enable()
+
+
+def _finish_request(response):
+    timings = g.get("_timings")
+    if timings is None:
+        return response
+    total = time.perf_counter() - timings.started
+    profiler = g.pop("_profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        _dump_profile(profiler, timings, total)
+    if current_app.config["SERVER_TIMING_ENABLED"] or g.get("_profile_requested"):
+        response.headers.add("Server-Timing", timings.server_timing(total))
+    if total * 1000 >= current_app.config["PROFILE_SLOW_REQUEST_MS"]:
+        seconds, statement = timings.slowest_sql
+        print(f"Slow request {request.method} {request.path}: {total * 1000:.0f}ms, "
+              f"{timings.sql_count} queries in {timings.sql_seconds * 1000:.0f}ms"
+              + (f", slowest {seconds * 1000:.0f}ms: {' '.join(statement.split())[:200]}" if statement else ""))
+    return response
+
+
+def _dump_profile(profiler, timings, total):
+    directory = current_app.config["PROFILE_DIR"]
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    base = os.path.join(directory, f"{stamp}-{request.endpoint or 'unmatched'}-{total * 1000:.0f}ms-{os.getpid()}")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(base + ".prof")
+        with open(base + ".txt", "w") as f:
+            seconds, statement = timings.slowest_sql
+            f.write(f"{request.method} {request.full_path}\n")
+            f.write(f"total {total * 1000:.1f}ms; Server-Timing: {timings.server_timing(total)}\n")
+            if statement:
+                f.write(f"slowest SQL ({seconds * 1000:.1f}ms): {statement}\n")
+            f.write("\n")
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(30)
+    except OSError as e:
+        print(f"Writing profile {base} failed: {str(e)}")
+
+
+def init_app(app):
+    global _listening
+    app.config.setdefault("SERVER_TIMING_ENABLED", False)
+    app.config.setdefault("PROFILE_SLOW_REQUEST_MS", 1000)
+    app.config.setdefault("PROFILE_SAMPLE_RATE", 0.0)
+    app.config.setdefault("PROFILE_TOKEN", None)
+    app.config.setdefault("PROFILE_DIR", os.path.join(app.instance_path, "profiles"))
+    if not _listening:
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _listening = True
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
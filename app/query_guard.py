@@ -0,0 +1,130 @@
+"""
+Query budgets: catch N+1 queries and stray blob loads before they ship.
+
+Views declare how many SQL statements a request may issue with
+`@query_budget(n)`; views without one get QUERY_GUARD_DEFAULT_BUDGET. Only the
+blob-serving views (`@query_budget(n, blobs=True)`) may SELECT a LargeBinary
+column (`image_data`, `glb_data`), whether explicitly or through a lazy load of
+a deferred attribute. Code that has to read blobs on purpose inside another
+view, e.g. decoding images the visual index doesn't cover yet, wraps the read
+in `with allow_blobs():`.
+
+The guard is off unless QUERY_GUARD is set: "warn" prints each violation,
+"raise" fails the request with QueryGuardError (meant for TESTING runs, where
+the error reaches the test client; see benchmarks/query_budget_check.py).
+"""
+
+import re
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import LargeBinary, event
+from sqlalchemy.engine import Engine
+
+from .extensions import db
+
+_listening = False
+_blob_columns = None
+
+
+class QueryGuardError(AssertionError):
+    """A request went over its query budget or loaded a blob column it shouldn't."""
+
+
+def query_budget(max_queries, blobs=False):
+    """Decorator: allow the view at most `max_queries` statements (and blob SELECTs if `blobs`)."""
+    def decorator(func):
+        func.query_budget = max_queries
+        func.query_budget_blobs = blobs
+        return func
+    return decorator
+
+
+@contextmanager
+def allow_blobs():
+    """Let the enclosed code SELECT blob columns in any view."""
+    if not has_request_context():
+        yield
+        return
+    previous = g.get("_guard_allow_blobs", False)
+    g._guard_allow_blobs = True
+    try:
+        yield
+    finally:
+        g._guard_allow_blobs = previous
+
+
+def _blob_pattern():
+    global _blob_columns
+    if _blob_columns is None:
+        names = sorted({
+            column.name
+            for table in db.metadata.tables.values()
+            for column in table.columns
+            if isinstance(column.type, LargeBinary)
+        })
+        _blob_columns = re.compile(r"\b(" + "|".join(map(re.escape, names)) + r")\b") if names else False
+    return _blob_columns
+
+
+def _selected_blobs(statement):
+    # Only the select list counts: filtering on a blob column doesn't load it.
+    head = statement.lstrip()[:6].upper()
+    if head not in ("SELECT", "WITH"):
+        return None
+    pattern = _blob_pattern()
+    if not pattern:
+        return None
+    select_list = re.split(r"\bFROM\b", statement, maxsplit=1, flags=re.IGNORECASE)[0]
+    return pattern.search(select_list)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    guard = g.get("_guard")
+    if guard is None:
+        return
+    guard["count"] += 1
+    if not guard["blobs"] and not g.get("_guard_allow_blobs") and _selected_blobs(statement):
+        guard["blob_selects"].append(" ".join(statement.split())[:200])
+
+
+def _start_request():
+    view = current_app.view_functions.get(request.endpoint)
+    g._guard = {
+        "budget": getattr(view, "query_budget", current_app.config["QUERY_GUARD_DEFAULT_BUDGET"]),
+        "blobs": getattr(view, "query_budget_blobs", False),
+        "count": 0,
+        "blob_selects": [],
+    }
+
+
+def _check_request(response):
+    guard = g.pop("_guard", None)
+    if guard is None:
+        return response
+    problems = []
+    if guard["count"] > guard["budget"]:
+        problems.append(f"{guard['count']} queries (budget {guard['budget']})")
+    for statement in guard["blob_selects"]:
+        problems.append(f"blob column selected: {statement}")
+    if problems:
+        message = f"Query guard: {request.method} {request.path} [{request.endpoint}]: " + "; ".join(problems)
+        if current_app.config["QUERY_GUARD"] == "raise":
+            raise QueryGuardError(message)
+        print(message)
+    return response
+
+
+def init_app(app):
+    global _listening
+    app.config.setdefault("QUERY_GUARD", "off")
+    app.config.setdefault("QUERY_GUARD_DEFAULT_BUDGET", 20)
+    if app.config["QUERY_GUARD"] not in ("warn", "raise"):
+        return
+    if not _listening:
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        _listening = True
+    app.before_request(_start_request)
+    app.after_request(_check_request)
@@ -0,0 +1,217 @@
+"""
+Token-bucket rate limiting for expensive endpoints.
+
+Each limited route names a rule in `RATELIMITS`, e.g.
+
+    "login": {"ip": "20/minute"}
+    "make_glb": {"ip": "60/hour", "user": "30/hour"}
+
+"N/period" means a bucket of N tokens refilled continuously over the period, so
+short bursts of up to N pass and the sustained rate is N per period. Per-IP
+buckets key on the client address, per-user buckets on the session identity
+(never a database query). Behind a reverse proxy the client address comes from
+X-Forwarded-For, trusted for PROXY_FIX_X_FOR hops (see create_app). A request
+takes a token from each of its rule's buckets only if every one has a token to
+spare; otherwise it gets 429 with Retry-After and no bucket is charged.
+
+Buckets live in a dict of small lists in this process by default. With
+`RATELIMIT_STORAGE = "sqlite"` they are kept in a small SQLite file shared by
+all workers on the host instead. If that store fails, requests are allowed.
+"""
+
+import os
+import math
+import time
+import sqlite3
+import threading
+from functools import wraps
+
+from flask import jsonify, request, Response
+
+from .metrics import counter
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+rejected_total = counter("ratelimit_rejected_total", "Requests rejected by the rate limiter", ("rule",))
+
+
+def parse_limit(spec):
+    """'20/minute' -> (refill tokens per second, burst capacity)."""
+    count, _, period = spec.partition("/")
+    count = float(count)
+    seconds = PERIODS[period.strip().rstrip("s")]
+    return count / seconds, count
+
+
+class MemoryBuckets:
+    """Buckets for this process: key -> [tokens, updated_at, full_at]."""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now=None):
+        """Spend one token; returns 0.0 if allowed, else seconds until one is available."""
+        return self.take_all([(key, rate, burst)], now)
+
+    def take_all(self, limits, now=None):
+        """Spend one token from each (key, rate, burst) only if all have one; else the longest wait."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            levels = []
+            for key, rate, burst in limits:
+                bucket = self._buckets.get(key)
+                levels.append(burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * rate))
+            wait = max([(1.0 - t) / rate for t, (_, rate, _) in zip(levels, limits) if t < 1.0], default=0.0)
+            if wait:
+                return wait
+            for tokens, (key, rate, burst) in zip(levels, limits):
+                tokens -= 1.0
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    if len(self._buckets) >= self.max_entries:
+                        self._prune(now)
+                    self._buckets[key] = [tokens, now, now + (burst - tokens) / rate]
+                else:
+                    bucket[0], bucket[1], bucket[2] = tokens, now, now + (burst - tokens) / rate
+            return 0.0
+
+    def _prune(self, now):
+        # A bucket that has refilled completely is the same as no bucket.
+        for key in [k for k, b in self._buckets.items() if b[2] <= now]:
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBuckets:
+    """Buckets shared by every worker on the host through a small SQLite file."""
+
+    def __init__(self, path, prune_every=1000):
+        self.path = path
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._calls = 0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL)"
+            )
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def take(self, key, rate, burst, now=None):
+        return self.take_all([(key, rate, burst)], now)
+
+    def take_all(self, limits, now=None):
+        """Spend one token from each (key, rate, burst) only if all have one, in one transaction."""
+        # Wall clock, since monotonic clocks aren't comparable across processes.
+        now = time.time() if now is None else now
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels = []
+            for key, rate, burst in limits:
+                row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+                levels.append(burst if row is None else min(burst, row[0] + max(now - row[1], 0.0) * rate))
+            wait = max([(1.0 - t) / rate for t, (_, rate, _) in zip(levels, limits) if t < 1.0], default=0.0)
+            if wait:
+                conn.execute("COMMIT")
+                return wait
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)",
+                [(key, tokens - 1.0, now, now + (burst - tokens + 1.0) / rate)
+                 for tokens, (key, rate, burst) in zip(levels, limits)],
+            )
+            self._calls += 1
+            if self._calls % self.prune_every == 0:
+                conn.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+            conn.execute("COMMIT")
+            return 0.0
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class RateLimiter:
+    """Flask extension; decorate views with `limiter.limit("<rule name>")`."""
+
+    def __init__(self, app=None):
+        self.store = None
+        self.enabled = True
+        self.rules = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("RATELIMIT_ENABLED", True)
+        app.config.setdefault("RATELIMIT_STORAGE", "memory")
+        app.config.setdefault("RATELIMIT_SQLITE_PATH", os.path.join(app.instance_path, "ratelimit.sqlite"))
+        app.config.setdefault("RATELIMITS", {})
+        self.enabled = app.config["RATELIMIT_ENABLED"]
+        if app.config["RATELIMIT_STORAGE"] == "sqlite":
+            self.store = SQLiteBuckets(app.config["RATELIMIT_SQLITE_PATH"])
+        else:
+            self.store = MemoryBuckets()
+        # Parsed once here so the per-request path is a dict lookup.
+        self.rules = {
+            name: {scope: parse_limit(spec) for scope, spec in scopes.items()}
+            for name, scopes in app.config["RATELIMITS"].items()
+        }
+        app.extensions["rate_limiter"] = self
+
+    def check(self, rule):
+        """Seconds to wait before `rule` admits this request, or 0.0."""
+        limits = self.rules.get(rule)
+        if not self.enabled or not limits:
+            return 0.0
+        buckets = []
+        for scope, (rate, burst) in limits.items():
+            if scope == "ip":
+                who = request.remote_addr or "unknown"
+            else:
+                from .auth import current_identity
+                identity = current_identity()
+                if not identity:
+                    continue
+                who = identity["id"]
+            buckets.append((f"{rule}:{scope}:{who}", rate, burst))
+        if not buckets:
+            return 0.0
+        try:
+            return self.store.take_all(buckets)
+        except sqlite3.Error as e:
+            print(f"Rate limiter store error ({rule}): {e}")
+            return 0.0
+
+    def limit(self, rule, methods=None):
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if request.method != "OPTIONS" and (methods is None or request.method in methods):
+                    wait = self.check(rule)
+                    if wait > 0:
+                        rejected_total.inc(rule=rule)
+                        return self._too_many(wait)
+                return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _too_many(self, wait):
+        message = "Too many requests, please slow down."
+        if request.path.startswith("/api/") or request.accept_mimetypes.best == "application/json":
+            response = jsonify({"success": False, "error": message})
+        else:
+            response = Response(message, mimetype="text/plain")
+        response.status_code = 429
+        response.headers["Retry-After"] = str(max(1, math.ceil(wait)))
+        return response
@@ -0,0 +1,294 @@
+"""
+Materialized top-N recommendations.
+
+Scores only change when the catalog does, so each artwork's neighbours are kept
+in the `recommendation` table and patched when an artwork is added, edited,
+sold or deleted. The endpoint then serves them with one indexed read; a nightly
+job rebuilds everything to correct any drift. `Artwork.recommendations_computed_at`
+marks a list as computed, so an artwork with no neighbours is served its empty
+list rather than rescored on every request.
+"""
+
+import time
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, insert, update
+from sqlalchemy.orm import defer, load_only
+
+from .candidates import popular_artwork_ids
+from .extensions import db
+from .metrics import counter
+from .models import Artwork, Recommendation
+from .recommendations import BudgetExceeded, score_candidates, serialize_recommendation
+
+recommendation_tiers = counter(
+    "recommendation_tier_total", "Recommendation responses by the tier that answered", ["tier"]
+)
+
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _list_size():
+    return current_app.config.get("RECOMMENDATION_STORE_SIZE", 12)
+
+
+def _write_lists(lists):
+    """
+    Replace the stored lists, {artwork_id: [(score, neighbour_id)]}, with the best of
+    each, in three statements however many lists there are.
+    """
+    if not lists:
+        return
+    ids = list(lists)
+    Recommendation.query.filter(Recommendation.artwork_id.in_(ids)).delete(synchronize_session=False)
+    now = datetime.utcnow()
+    db.session.execute(
+        update(Artwork).where(Artwork.id.in_(ids)).values(recommendations_computed_at=now),
+        execution_options={"synchronize_session": False},
+    )
+    size = _list_size()
+    rows = [
+        {"artwork_id": artwork_id, "neighbour_id": c_id, "rank": rank, "score": score, "computed_at": now}
+        for artwork_id, scored in lists.items()
+        for rank, (score, c_id) in enumerate(sorted(scored, key=lambda x: x[0], reverse=True)[:size])
+    ]
+    if rows:
+        # One executemany; row-by-row ORM inserts cost a statement per neighbour.
+        db.session.execute(insert(Recommendation), rows)
+
+
+def _write_list(artwork_id, scored):
+    """Replace the stored list for `artwork_id` with the best of `scored`."""
+    _write_lists({artwork_id: scored})
+
+
+def _invalidate(artwork_ids):
+    """Forget these lists (two statements); each is recomputed on its next read."""
+    if not artwork_ids:
+        return
+    Recommendation.query.filter(Recommendation.artwork_id.in_(artwork_ids)).delete(synchronize_session=False)
+    db.session.execute(
+        update(Artwork).where(Artwork.id.in_(artwork_ids)).values(recommendations_computed_at=None),
+        execution_options={"synchronize_session": False},
+    )
+
+
+def refresh_list(artwork):
+    """Recompute one artwork's own list; returns the full [(score, candidate)] scoring."""
+    scored = score_candidates(artwork, top_n=_list_size())
+    _write_list(artwork.id, [(s, c.id) for s, c in scored])
+    return scored
+
+
+def _stored_lists(artwork_ids):
+    rows = (
+        Recommendation.query
+        .with_entities(Recommendation.artwork_id, Recommendation.neighbour_id, Recommendation.score)
+        .filter(Recommendation.artwork_id.in_(artwork_ids))
+        .all()
+    )
+    lists = {}
+    for artwork_id, neighbour_id, score in rows:
+        lists.setdefault(artwork_id, []).append((score, neighbour_id))
+    return lists
+
+
+def _patch_neighbours(artwork, scored):
+    """
+    Insert `artwork` into every stored list it now belongs to (scores are symmetric),
+    in a fixed number of statements: three reads, then one _write_lists.
+    """
+    size = _list_size()
+    candidate_ids = [c.id for _, c in scored]
+    if not candidate_ids:
+        return
+    thresholds = dict(
+        Recommendation.query
+        .with_entities(Recommendation.artwork_id, func.min(Recommendation.score))
+        .filter(Recommendation.artwork_id.in_(candidate_ids))
+        .group_by(Recommendation.artwork_id)
+        .having(func.count(Recommendation.id) >= size)
+        .all()
+    )
+    qualifying = {c.id: s for s, c in scored if s > thresholds.get(c.id, float("-inf"))}
+    if not qualifying:
+        return
+    # Computed lists only, including empty ones; the rest get scored on first read.
+    stored = _stored_lists(list(qualifying))
+    computed = set(stored) | {
+        a for (a,) in Artwork.query
+        .with_entities(Artwork.id)
+        .filter(Artwork.id.in_(list(qualifying)), Artwork.recommendations_computed_at.isnot(None))
+        .all()
+    }
+    patched = {}
+    for other_id in computed:
+        entries = [(s, n) for s, n in stored.get(other_id, []) if n != artwork.id]
+        entries.append((qualifying[other_id], artwork.id))
+        patched[other_id] = entries
+    _write_lists(patched)
+
+
+def _drop_neighbour(artwork_id):
+    """Remove `artwork_id` from other lists; returns the artworks whose lists it left."""
+    affected = [
+        a for (a,) in Recommendation.query
+        .with_entities(Recommendation.artwork_id)
+        .filter(Recommendation.neighbour_id == artwork_id)
+        .distinct()
+        .all()
+    ]
+    Recommendation.query.filter_by(neighbour_id=artwork_id).delete(synchronize_session=False)
+    return affected
+
+
+def _refill(artwork_ids):
+    if not artwork_ids:
+        return
+    others = (
+        Artwork.query
+        .options(defer(Artwork.image_data), defer(Artwork.glb_data))
+        .filter(Artwork.id.in_(artwork_ids))
+        .all()
+    )
+    for other in others:
+        refresh_list(other)
+
+
+# ---- catalog change hooks ----
+def on_artwork_saved(artwork):
+    """
+    New or edited artwork: score it once against the catalog and patch neighbours.
+    Lists the artwork drops out of are invalidated rather than rescored here, so a
+    save costs a bounded number of statements however large its neighbourhood.
+    """
+    affected = _drop_neighbour(artwork.id)
+    scored = refresh_list(artwork)
+    if not artwork.is_sold:
+        _patch_neighbours(artwork, scored)
+        stored = _stored_lists(affected)
+        affected = [a for a in affected if not any(n == artwork.id for _, n in stored.get(a, []))]
+    _invalidate(affected)
+    db.session.commit()
+
+
+def on_artwork_sold(artwork_id):
+    _refill(_drop_neighbour(artwork_id))
+    db.session.commit()
+
+
+def on_artwork_deleted(artwork_id):
+    """Call before deleting the artwork row; returns the lists to refill afterwards."""
+    Recommendation.query.filter_by(artwork_id=artwork_id).delete(synchronize_session=False)
+    return _drop_neighbour(artwork_id)
+
+
+def refill_lists(artwork_ids):
+    _refill(artwork_ids)
+    db.session.commit()
+
+
+def rebuild_all():
+    """Full recompute of every stored list (nightly job)."""
+    count = 0
+    for (artwork_id,) in Artwork.query.with_entities(Artwork.id).order_by(Artwork.id).all():
+        artwork = Artwork.query.options(defer(Artwork.image_data), defer(Artwork.glb_data)).get(artwork_id)
+        if artwork is None:
+            continue
+        refresh_list(artwork)
+        db.session.commit()
+        db.session.expunge_all()
+        count += 1
+    # lists of artworks that no longer exist
+    Recommendation.query.filter(~Recommendation.artwork_id.in_(
+        db.session.query(Artwork.id)
+    )).delete(synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+# ---- read path ----
+def stored_recommendations(artwork_id, top_n):
+    """Serve the stored list with a single indexed join; None if never computed."""
+    rows = (
+        db.session.query(Recommendation.score, Artwork)
+        .join(Artwork, Artwork.id == Recommendation.neighbour_id)
+        .options(load_only(Artwork.id, Artwork.name, Artwork.artist, Artwork.style, Artwork.medium))
+        .filter(Recommendation.artwork_id == artwork_id)
+        .order_by(Recommendation.rank)
+        .limit(top_n)
+        .all()
+    )
+    if not rows and db.session.query(Artwork.recommendations_computed_at).filter_by(id=artwork_id).scalar() is None:
+        return None
+    return [serialize_recommendation(art, score) for score, art in rows]
+
+
+def _popular_recommendations(artwork_id, top_n):
+    ids = popular_artwork_ids(top_n, exclude={artwork_id})
+    arts = {
+        a.id: a for a in Artwork.query
+        .options(load_only(Artwork.id, Artwork.name, Artwork.artist, Artwork.style, Artwork.medium))
+        .filter(Artwork.id.in_(ids))
+        .all()
+    }
+    return [serialize_recommendation(arts[i], 0.0) for i in ids if i in arts]
+
+
+def _refresh_in_background(artwork_id):
+    """Compute and store the full list off the request path after a degraded answer."""
+    app = current_app._get_current_object()
+    with _pending_lock:
+        if artwork_id in _pending:
+            return
+        _pending.add(artwork_id)
+
+    def work():
+        try:
+            with app.app_context():
+                artwork = Artwork.query.options(defer(Artwork.image_data), defer(Artwork.glb_data)).get(artwork_id)
+                if artwork is not None:
+                    refresh_list(artwork)
+                    db.session.commit()
+                db.session.remove()
+        except Exception as e:
+            print(f"Background recommendation refresh failed for artwork {artwork_id}: {str(e)}")
+        finally:
+            with _pending_lock:
+                _pending.discard(artwork_id)
+
+    threading.Thread(target=work, name=f"recommend-{artwork_id}", daemon=True).start()
+
+
+def get_recommendations(artwork, top_n, budget_ms=None):
+    """
+    Return (recommendations, tier). Tiers, fastest first: "materialized" (stored
+    list), "full" (computed now and stored), "metadata" (text/visual scoring ran
+    out of budget) and "popular" (even the metadata stage ran out of budget).
+    """
+    recs = stored_recommendations(artwork.id, top_n)
+    if recs is not None:
+        tier = "materialized"
+    else:
+        deadline = time.monotonic() + budget_ms / 1000.0 if budget_ms else None
+        try:
+            scored = score_candidates(artwork, top_n=_list_size(), deadline=deadline)
+            _write_list(artwork.id, [(s, c.id) for s, c in scored])
+            db.session.commit()
+            recs = stored_recommendations(artwork.id, top_n)
+            tier = "full"
+        except BudgetExceeded as e:
+            if e.metadata_scored is not None:
+                best = sorted(e.metadata_scored, key=lambda x: x[0], reverse=True)[:top_n]
+                recs = [serialize_recommendation(c, s) for s, c in best]
+                tier = "metadata"
+            else:
+                recs = _popular_recommendations(artwork.id, top_n)
+                tier = "popular"
+            _refresh_in_background(artwork.id)
+
+    recommendation_tiers.inc(tier=tier)
+    return recs, tier
@@ -1,23 +1,16 @@
-import io
 import re
-from PIL import Image
-from .models import Artwork
+import time
+import numpy as np
+from sqlalchemy.orm import defer
 
-def _image_histogram_from_bytes(b, size=(64, 64)):
-    try:
-        img = Image.open(io.BytesIO(b)).convert("RGB").resize(size)
-        return img.histogram()
-    except Exception:
-        return None
+from flask import current_app
 
-def _histogram_intersection(h1, h2):
-    if not h1 or not h2:
-        return 0.0
-    s1 = sum(h1)
-    if s1 == 0:
-        return 0.0
-    inter = sum(min(a, b) for a, b in zip(h1, h2))
-    return inter / s1
+from .ann_index import visual_feature_vector, histogram_similarity
+from .candidates import CATEGORICAL_WEIGHTS, candidate_ids
+from .embeddings import embedding_similarity
+from .extensions import db, visual_index, embedding_store
+from .models import Artwork
+from .query_guard import allow_blobs
 
 def _text_overlap_score(a_text, b_text):
     if not a_text or not b_text:
@@ -28,41 +21,238 @@ def _text_overlap_score(a_text, b_text):
         return 0.0
     return len(a_words & b_words) / len(a_words | b_words)
 
-def recommend_similar_artworks(artwork, top_n=5):
-    candidates = Artwork.query.filter(Artwork.id != artwork.id).all()
-    base_hist = _image_histogram_from_bytes(artwork.image_data)
+# Images decoded between deadline checks in _visual_vectors.
+DECODE_CHUNK = 16
+
+def _visual_vectors(artworks, deadline=None):
+    """
+    {artwork id: feature vector or None}; artworks the index doesn't cover yet have
+    their images read in one query and decoded, instead of one lazy load each.
+    With a `deadline`, decoding stops with BudgetExceeded once it passes (checked
+    before each chunk of DECODE_CHUNK images, so none are decoded past it).
+    """
+    vectors = {a.id: visual_index.vector_for(a.id) for a in artworks}
+    missing = [artwork_id for artwork_id, vec in vectors.items() if vec is None]
+    if missing:
+        if deadline is not None and time.monotonic() > deadline:
+            raise BudgetExceeded()
+        with allow_blobs():
+            rows = db.session.query(Artwork.id, Artwork.image_data).filter(Artwork.id.in_(missing)).all()
+        for i, (artwork_id, blob) in enumerate(rows):
+            if deadline is not None and i % DECODE_CHUNK == 0 and time.monotonic() > deadline:
+                raise BudgetExceeded()
+            vectors[artwork_id] = visual_feature_vector(blob) if blob else None
+    return vectors
+
+def _visual_vector(artwork):
+    return _visual_vectors([artwork])[artwork.id]
+
+class BudgetExceeded(Exception):
+    """Raised by score_candidates when its deadline passes; carries metadata-only scores if ready."""
+
+    def __init__(self, metadata_scored=None):
+        super().__init__("recommendation time budget exceeded")
+        self.metadata_scored = metadata_scored
+
+def _metadata_score(artwork, c):
+    score = 0.0
+    if artwork.artist and c.artist and artwork.artist == c.artist:
+        score += 3.0
+    if artwork.style and c.style and artwork.style == c.style:
+        score += 2.0
+    if artwork.medium and c.medium and artwork.medium == c.medium:
+        score += 1.5
+    if artwork.artwork_type and c.artwork_type and artwork.artwork_type == c.artwork_type:
+        score += 1.0
+    return score
+
+def score_candidates(artwork, top_n=5, deadline=None):
+    """
+    Score candidate artworks against `artwork`; returns an unsorted [(score, candidate)].
+
+    With a `deadline` (time.monotonic() value) this raises BudgetExceeded: without
+    partial results if it passed while fetching candidates, or with metadata-only
+    scores if it passes during image decoding or the text/visual stage. Candidate
+    images are only decoded while the deadline holds.
+    """
+    base_vec = _visual_vector(artwork)
+    base_emb = None
+    if current_app.config.get("RECOMMENDATION_VISUAL_SIGNAL") == "embedding":
+        base_emb = embedding_store.vector_for(artwork.id)
+
+    # Large catalogs: approximate visual neighbours plus categorical posting-list
+    # matches are scored instead of the whole catalog.
+    shortlist = visual_index.shortlist(base_vec, exclude=artwork.id)
+    if shortlist is not None and len(shortlist) < top_n:
+        shortlist = None
+    ids = candidate_ids(artwork, shortlist)
+
+    # Sold pieces can't be bought, so they are never recommended.
+    query = (
+        Artwork.query
+        .options(defer(Artwork.image_data), defer(Artwork.glb_data))
+        .filter(Artwork.id != artwork.id, Artwork.is_sold.isnot(True))
+    )
+    if ids is not None:
+        if not ids:
+            return []
+        query = query.filter(Artwork.id.in_(list(ids)))
+    candidates = query.all()
+    if deadline is not None and time.monotonic() > deadline:
+        raise BudgetExceeded()
+
+    metadata_scored = [(_metadata_score(artwork, c), c) for c in candidates]
+
+    # Candidates with neither an embedding nor a shortlist score need a histogram.
+    try:
+        c_vecs = _visual_vectors([
+            c for c in candidates
+            if (shortlist is None or c.id not in shortlist)
+            and (base_emb is None or embedding_store.vector_for(c.id) is None)
+        ], deadline)
+    except BudgetExceeded:
+        raise BudgetExceeded(metadata_scored)
 
     scored = []
-    for c in candidates:
-        score = 0.0
-
-        if artwork.artist and c.artist and artwork.artist == c.artist:
-            score += 3.0
-        if artwork.style and c.style and artwork.style == c.style:
-            score += 2.0
-        if artwork.medium and c.medium and artwork.medium == c.medium:
-            score += 1.5
-        if artwork.artwork_type and c.artwork_type and artwork.artwork_type == c.artwork_type:
-            score += 1.0
+    for i, (score, c) in enumerate(metadata_scored):
+        if deadline is not None and i % 16 == 0 and time.monotonic() > deadline:
+            raise BudgetExceeded(metadata_scored)
 
         score += _text_overlap_score(artwork.description, c.description) * 3.0
 
-        c_hist = _image_histogram_from_bytes(c.image_data)
-        hist_sim = _histogram_intersection(base_hist, c_hist)
+        c_emb = embedding_store.vector_for(c.id) if base_emb is not None else None
+        if c_emb is not None:
+            hist_sim = embedding_similarity(base_emb, c_emb)
+        elif shortlist is not None and c.id in shortlist:
+            hist_sim = shortlist[c.id]
+        else:
+            c_vec = c_vecs.get(c.id)
+            hist_sim = 0.0
+            if base_vec is not None and c_vec is not None:
+                hist_sim = float(histogram_similarity(base_vec, c_vec))
         score += hist_sim * 3.0
 
         scored.append((score, c))
 
+    return scored
+
+def serialize_recommendation(art, score):
+    return {
+        "id": art.id,
+        "name": art.name,
+        "artist": art.artist,
+        "style": art.style,
+        "medium": art.medium,
+        "score": round(score, 4)
+    }
+
+def recommend_similar_artworks(artwork, top_n=5):
+    scored = score_candidates(artwork, top_n=top_n)
     scored.sort(key=lambda x: x[0], reverse=True)
+    return [serialize_recommendation(art, s) for s, art in scored[:top_n]]
+
+def _seed_profile(seeds):
+    """
+    Combine several seed artworks into one query: the mean of their visual
+    vectors, each categorical value weighted by the share of seeds that have it,
+    and the union of their description words.
+    """
+    vectors = [v for v in _visual_vectors(seeds).values() if v is not None]
+    hist = np.mean(vectors, axis=0) if vectors else None
+
+    emb = None
+    if current_app.config.get("RECOMMENDATION_VISUAL_SIGNAL") == "embedding":
+        embs = [e for e in (embedding_store.vector_for(a.id) for a in seeds) if e is not None]
+        if embs:
+            emb = np.mean(embs, axis=0)
+            norm = np.linalg.norm(emb)
+            emb = emb / norm if norm > 0 else None
+
+    categorical = {}
+    for field, weight in CATEGORICAL_WEIGHTS:
+        values = {}
+        for a in seeds:
+            value = getattr(a, field)
+            if value:
+                values[value] = values.get(value, 0.0) + weight / len(seeds)
+        categorical[field] = values
+
+    words = set()
+    for a in seeds:
+        words |= set(re.findall(r"\w+", (a.description or "").lower()))
+    return hist, emb, categorical, words
+
+def recommend_for_seeds(seeds, top_n=5):
+    """
+    "More like these" for a set of seed artworks (e.g. a cart), scored in one
+    batched pass over the unsold catalog: one light-column query, then each term
+    (categorical, text, visual) as an array over all candidates at once.
+    With a single seed the scores match recommend_similar_artworks as long as it
+    scores the whole catalog too, i.e. for catalogs of at most
+    RECOMMENDATION_CANDIDATE_CAP + 1 artworks and no ANN shortlist. Beyond that
+    it only scores its shortlist and posting-list candidates, so its top N can
+    differ from this exhaustive pass.
+    """
+    if not seeds:
+        return []
+    hist, emb, categorical, words = _seed_profile(seeds)
+    seed_ids = [a.id for a in seeds]
+
+    rows = (
+        db.session.query(
+            Artwork.id, Artwork.name, Artwork.artist, Artwork.style,
+            Artwork.medium, Artwork.artwork_type, Artwork.description,
+        )
+        .filter(Artwork.id.notin_(seed_ids), Artwork.is_sold.isnot(True))
+        .all()
+    )
+    if not rows:
+        return []
+
+    columns = {name: np.array(values, dtype=object) for name, values in zip(rows[0]._fields, zip(*rows))}
+    ids = columns["id"].astype(np.int64)
+    scores = np.zeros(len(rows), dtype=np.float64)
+    # One vectorized comparison per distinct seed value (a handful), not a lookup per row.
+    for field, _ in CATEGORICAL_WEIGHTS:
+        for value, weight in categorical[field].items():
+            scores += (columns[field] == value) * weight
+
+    if words:
+        # Tokenizing stays per description; the Jaccard arithmetic runs over arrays.
+        token_sets = [set(re.findall(r"\w+", d.lower())) if d else set() for d in columns["description"]]
+        shared = np.fromiter((len(words & t) for t in token_sets), dtype=np.float64, count=len(rows))
+        sizes = np.fromiter(map(len, token_sets), dtype=np.float64, count=len(rows))
+        union = len(words) + sizes - shared
+        scores += np.divide(shared, union, out=np.zeros_like(shared), where=sizes > 0) * 3.0
+
+    visual = np.zeros(len(rows), dtype=np.float32)
+    if hist is not None:
+        visual = visual_index.similarities(hist, ids)
+        # Artworks added before the index was built: decode just those images.
+        index = visual_index.index
+        if index is None:
+            missing = ids
+        else:
+            missing = ids[~np.isin(ids, index.ids)]
+        if len(missing):
+            with allow_blobs():
+                blobs = dict(
+                    db.session.query(Artwork.id, Artwork.image_data)
+                    .filter(Artwork.id.in_(missing.tolist()))
+                    .all()
+                )
+            position = {int(artwork_id): i for i, artwork_id in enumerate(ids)}
+            for artwork_id, blob in blobs.items():
+                vec = visual_feature_vector(blob) if blob else None
+                if vec is not None:
+                    visual[position[artwork_id]] = histogram_similarity(hist, vec)
+    if emb is not None:
+        emb_sims = embedding_store.similarities(emb, ids)
+        embedded = ~np.isnan(emb_sims)
+        visual[embedded] = emb_sims[embedded]
+    scores += visual * 3.0
 
-    results = []
-    for s, art in scored[:top_n]:
-        results.append({
-            "id": art.id,
-            "name": art.name,
-            "artist": art.artist,
-            "style": art.style,
-            "medium": art.medium,
-            "score": round(s, 4)
-        })
-    return results
+    k = min(top_n, len(rows))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [serialize_recommendation(rows[i], float(scores[i])) for i in top]
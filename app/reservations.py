@@ -0,0 +1,112 @@
+"""
+Checkout holds on artworks.
+
+Every state change is one conditional UPDATE, so the check and the write happen
+atomically in the database and two workers can never both win:
+
+- `reserve` takes a short hold (`RESERVATION_TTL` seconds) on an unsold artwork
+  that nobody else holds; the same buyer may renew their own hold.
+  `reserve_many` does the same for a whole cart, all or nothing.
+- `mark_sold_many` sells artworks only to their holder, or to anyone once the
+  hold has lapsed without being taken over.
+- `expire_stale` (a background job) clears lapsed holds.
+"""
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_, update
+
+from .extensions import db
+from .models import Artwork
+
+
+def _available_to(user_id, now):
+    return or_(
+        Artwork.reserved_until.is_(None),
+        Artwork.reserved_until < now,
+        Artwork.reserved_by == user_id,
+    )
+
+
+def reserve_many(artwork_ids, user_id, ttl=None):
+    """
+    Hold every artwork in `artwork_ids` for `user_id` in one statement, all or
+    nothing; returns the holds' expiry, or None if any item is unavailable. Commits.
+    """
+    artwork_ids = list(artwork_ids)
+    now = datetime.utcnow()
+    until = now + timedelta(seconds=ttl or current_app.config["RESERVATION_TTL"])
+    result = db.session.execute(
+        update(Artwork)
+        .where(Artwork.id.in_(artwork_ids), Artwork.is_sold.isnot(True), _available_to(user_id, now))
+        .values(reserved_until=until, reserved_by=user_id)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(artwork_ids):
+        db.session.rollback()
+        return None
+    db.session.commit()
+    return until
+
+
+def reserve(artwork_id, user_id, ttl=None):
+    """Hold `artwork_id` for `user_id`; returns the hold's expiry, or None if unavailable. Commits."""
+    return reserve_many([artwork_id], user_id, ttl)
+
+
+def release_many(artwork_ids, user_id):
+    """Drop `user_id`'s holds (e.g. the gateway order could not be created). Commits."""
+    db.session.execute(
+        update(Artwork)
+        .where(Artwork.id.in_(list(artwork_ids)), Artwork.reserved_by == user_id, Artwork.is_sold.isnot(True))
+        .values(reserved_until=None, reserved_by=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def mark_sold_many(artwork_ids, user_id):
+    """Sell all of `artwork_ids` to `user_id` in one bulk UPDATE; True only if every one sold. Caller commits."""
+    artwork_ids = list(artwork_ids)
+    result = db.session.execute(
+        update(Artwork)
+        .where(Artwork.id.in_(artwork_ids), Artwork.is_sold.isnot(True), _available_to(user_id, datetime.utcnow()))
+        .values(is_sold=True, reserved_until=None, reserved_by=None)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == len(artwork_ids)
+
+
+def unavailable(artwork_ids, user_id):
+    """{artwork_id: reason} for items `user_id` can't buy right now ("not_found", "sold", "reserved", "no_price")."""
+    now = datetime.utcnow()
+    rows = {
+        r.id: r
+        for r in db.session.query(Artwork.id, Artwork.is_sold, Artwork.price, Artwork.reserved_by, Artwork.reserved_until)
+        .filter(Artwork.id.in_(list(artwork_ids)))
+    }
+    reasons = {}
+    for artwork_id in artwork_ids:
+        r = rows.get(artwork_id)
+        if r is None:
+            reasons[artwork_id] = "not_found"
+        elif r.is_sold:
+            reasons[artwork_id] = "sold"
+        elif r.reserved_until is not None and r.reserved_until >= now and r.reserved_by != user_id:
+            reasons[artwork_id] = "reserved"
+        elif r.price is None or r.price <= 0:
+            reasons[artwork_id] = "no_price"
+    return reasons
+
+
+def expire_stale():
+    """Clear holds whose TTL has passed (background job); returns how many."""
+    result = db.session.execute(
+        update(Artwork)
+        .where(and_(Artwork.reserved_until.isnot(None), Artwork.reserved_until < datetime.utcnow()))
+        .values(reserved_until=None, reserved_by=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
@@ -1,18 +1,41 @@
 import os
-from flask import Blueprint, send_file, send_from_directory, abort, Response, redirect, url_for
-from .auth import get_current_user, login_required
+from flask import Blueprint, abort, request, Response, redirect, url_for
+from .auth import current_identity, login_required
+from .compression import AssetDirectory, PrecompressedFile, precompress_directory
 from .config import basedir
+from .jobs import job_lock
 
 spa_bp = Blueprint("spa", __name__)
 
+def _spa_dist_path():
+    return os.path.join(basedir, "frontend", "dist")
+
 def _spa_index_path():
-    return os.path.join(basedir, "frontend", "dist", "index.html")
+    return os.path.join(_spa_dist_path(), "index.html")
+
+# The built index.html, served from memory (gzip/brotli variants, ETag, 304).
+spa_shell = PrecompressedFile(_spa_index_path(), "text/html")
+# Vite's bundles (dist/js, dist/css, dist/assets), indexed once with their .br/.gz siblings.
+spa_assets = AssetDirectory(_spa_dist_path())
+
+@spa_bp.record_once
+def _load_spa_shell(state):
+    config = state.app.config
+    spa_shell.check_interval = config["SPA_SHELL_CHECK_INTERVAL"]
+    spa_assets.rescan_interval = config["ASSETS_RESCAN_INTERVAL"]
+    if os.path.isdir(spa_assets.root) and config["ASSETS_PRECOMPRESS_ON_STARTUP"]:
+        # One worker compresses whatever this build is missing; the rest wait, then read its files.
+        try:
+            with job_lock(state.app, "precompress-assets"):
+                precompress_directory(spa_assets.root)
+        except OSError as e:
+            print(f"Precompressing {spa_assets.root} failed: {str(e)}")
+    spa_shell.load()
+    if os.path.isdir(spa_assets.root):
+        spa_assets.scan()
 
 def _serve_spa_if_built():
-    path = _spa_index_path()
-    if os.path.isfile(path):
-        return send_file(path)
-    return None
+    return spa_shell.response()
 
 def _frontend_build_required():
     return Response(
@@ -33,17 +56,16 @@ def home():
 
 @spa_bp.route("/start", methods=["GET"])
 def start():
-    user = get_current_user()
-    if user:
+    if current_identity():
         return redirect(url_for("spa.select_role"))
     return _serve_spa_if_built() or _frontend_build_required()
 
 @spa_bp.route("/assets/<path:path>")
+@spa_bp.route("/js/<path:path>", endpoint="serve_spa_js")
+@spa_bp.route("/css/<path:path>", endpoint="serve_spa_css")
 def serve_spa_assets(path):
-    dist_assets = os.path.join(basedir, "frontend", "dist", "assets")
-    if not os.path.isdir(dist_assets):
-        abort(404)
-    return send_from_directory(dist_assets, path)
+    directory = request.path.split("/", 2)[1]
+    return spa_assets.response(f"{directory}/{path}") or abort(404)
 
 @spa_bp.route("/select-role")
 @login_required
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Recall@k and latency of the LSH visual index against brute-force search.
+
+Generates clustered synthetic colour histograms (no database needed), so it can
+be run anywhere:
+
+    python benchmarks/ann_benchmark.py --sizes 1000 10000 100000 --k 10
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.ann_index import RandomProjectionLSH, histogram_similarity, FEATURE_DIM  # noqa: E402
+
+
+def synthetic_histograms(n, clusters=50, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.dirichlet(np.full(FEATURE_DIM, 0.3), size=clusters)
+    labels = rng.integers(0, clusters, size=n)
+    noise = rng.dirichlet(np.full(FEATURE_DIM, 0.3), size=n)
+    vectors = 0.8 * centers[labels] + 0.2 * noise
+    return (vectors / vectors.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def brute_force(vectors, query, k, exclude_row):
+    sims = histogram_similarity(query, vectors)
+    sims[exclude_row] = -1.0
+    top = np.argpartition(-sims, k)[:k]
+    return top[np.argsort(-sims[top])]
+
+
+def percentile(values, p):
+    return float(np.percentile(np.asarray(values) * 1000.0, p))
+
+
+def run(n, k, queries, tables, bits, probes):
+    vectors = synthetic_histograms(n)
+    ids = np.arange(n, dtype=np.int64)
+
+    t0 = time.perf_counter()
+    index = RandomProjectionLSH(num_tables=tables, num_bits=bits).fit(ids, vectors)
+    build_s = time.perf_counter() - t0
+
+    rng = np.random.default_rng(1)
+    rows = rng.choice(n, size=min(queries, n), replace=False)
+
+    recalls, ann_times, bf_times, shortlist_sizes = [], [], [], []
+    for row in rows:
+        q = vectors[row]
+
+        t0 = time.perf_counter()
+        exact = brute_force(vectors, q, k, row)
+        bf_times.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        approx = index.query(q, k=k, num_probes=probes, exclude=int(row))
+        ann_times.append(time.perf_counter() - t0)
+
+        shortlist_sizes.append(len(index.candidates(q, num_probes=probes)))
+        recalls.append(len({i for i, _ in approx} & set(exact.tolist())) / k)
+
+    print(
+        f"n={n:>7}  build={build_s:6.2f}s  recall@{k}={np.mean(recalls):.3f}  "
+        f"shortlist={np.mean(shortlist_sizes):8.0f}  "
+        f"ann p50/p95={percentile(ann_times, 50):7.2f}/{percentile(ann_times, 95):7.2f}ms  "
+        f"brute p50/p95={percentile(bf_times, 50):7.2f}/{percentile(bf_times, 95):7.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--tables", type=int, default=8)
+    parser.add_argument("--bits", type=int, default=12)
+    parser.add_argument("--probes", type=int, default=2)
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        run(n, args.k, args.queries, args.tables, args.bits, args.probes)
+
+
+if __name__ == "__main__":
+    main()
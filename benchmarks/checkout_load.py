@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Offline checkout load test against the Razorpay stub.
+
+Serves the app and `razorpay_stub.py` in-process on a scratch database, signs
+up a buyer, adds --orders priced artworks and calls /api/create-order for each
+from --concurrency client threads. Reports checkout p50/p99, throughput and
+status codes:
+
+    python benchmarks/checkout_load.py --orders 500 --concurrency 16 --latency-ms 80 --jitter-ms 40
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from PIL import Image
+from sqlalchemy import insert
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from razorpay_stub import create_stub_app, serve_in_thread  # noqa: E402
+
+
+def start_app(stub_url, workdir):
+    from app import create_app
+
+    return create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(workdir, "checkout.db"),
+        "ANN_INDEX_DIR": os.path.join(workdir, "ann_index"),
+        "EMBEDDINGS_DIR": os.path.join(workdir, "embeddings"),
+        "BACKGROUND_JOBS_ENABLED": False,
+        "RATELIMIT_ENABLED": False,
+        "RAZORPAY_BASE_URL": stub_url,
+        "RAZORPAY_KEY_ID": "rzp_test_stub",
+        "RAZORPAY_KEY_SECRET": "stub-secret",
+    })
+
+
+def add_artworks(app, n):
+    from app.extensions import db
+    from app.models import Artwork
+
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8), (120, 90, 60)).save(buf, "PNG")
+    with app.app_context():
+        start = (db.session.query(db.func.max(Artwork.id)).scalar() or 0) + 1
+        db.session.execute(insert(Artwork), [
+            {"name": f"Checkout {i}", "filename": f"checkout_{i}.png", "price": 1000 + i,
+             "image_data": buf.getvalue(), "is_sold": False}
+            for i in range(n)
+        ])
+        db.session.commit()
+        return list(range(start, start + n))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="stub gateway latency")
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub_url, stub_server = serve_in_thread(create_stub_app(args.latency_ms, args.jitter_ms, args.error_rate, seed=0))
+    app = start_app(stub_url, tempfile.mkdtemp(prefix="checkout-"))
+    base, app_server = serve_in_thread(app)
+    artwork_ids = add_artworks(app, args.orders)
+
+    buyer = requests.Session()
+    r = buyer.post(base + "/api/signup", json={"name": "Buyer", "email": "buyer@example.com", "password": "pw"})
+    if r.status_code != 200:
+        sys.exit(f"signup failed ({r.status_code}): {r.text[:200]}")
+    cookies = buyer.cookies.get_dict()
+
+    def checkout(artwork_id):
+        start = time.perf_counter()
+        resp = requests.post(base + "/api/create-order", json={"artwork_id": artwork_id}, cookies=cookies, timeout=60)
+        return resp.status_code, (time.perf_counter() - start) * 1000.0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(checkout, artwork_ids))
+    elapsed = time.perf_counter() - started
+
+    ok_ms = np.asarray([ms for code, ms in results if code == 200] or [0.0])
+    print(f"{args.orders} checkouts, concurrency {args.concurrency}, stub latency "
+          f"{args.latency_ms:.0f}±{args.jitter_ms:.0f}ms: {elapsed:.1f}s ({len(results) / elapsed:.1f} checkouts/sec)")
+    print(f"  status codes: {dict(sorted(Counter(code for code, _ in results).items()))}")
+    print(f"  create-order p50={np.percentile(ok_ms, 50):.1f}ms p99={np.percentile(ok_ms, 99):.1f}ms max={ok_ms.max():.1f}ms")
+
+    app_server.shutdown()
+    stub_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Per-route report of response compression.
+
+Builds a scratch catalog of --artworks artworks with realistic descriptions,
+then requests the catalog, a seller's list, recommendations and the admin pages
+--repeat times each with gzip, brotli (if installed) and no Accept-Encoding,
+and prints what the compression middleware recorded per route and encoding:
+bytes before/after, ratio, CPU per response, and compressed-body cache hits.
+Responses under COMPRESSION_MIN_SIZE are not compressed and don't appear.
+
+    python benchmarks/compression_report.py --artworks 500 --repeat 20
+"""
+
+import io
+import os
+import sys
+import random
+import argparse
+import tempfile
+from collections import defaultdict
+
+from PIL import Image
+from sqlalchemy import insert
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+WORDS = ("oil acrylic canvas portrait landscape abstract vivid muted texture layered brushwork light shadow "
+         "figure river mountain city night dawn bold gentle study series collection contemporary classical").split()
+
+
+def build_app(workdir):
+    from app import create_app
+
+    return create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(workdir, "compression.db"),
+        "ANN_INDEX_DIR": os.path.join(workdir, "ann_index"),
+        "EMBEDDINGS_DIR": os.path.join(workdir, "embeddings"),
+        "BACKGROUND_JOBS_ENABLED": False,
+        "RATELIMIT_ENABLED": False,
+        "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+    })
+
+
+def add_artworks(app, n, seller_email):
+    from app.extensions import db
+    from app.models import Artwork, User
+
+    rng = random.Random(0)
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8), (90, 60, 120)).save(buf, "PNG")
+    with app.app_context():
+        seller = User.query.filter_by(email=seller_email).one()
+        db.session.execute(insert(Artwork), [
+            {"name": f"Artwork {i}", "filename": f"art_{i}.png", "price": 1000 + i, "image_data": buf.getvalue(),
+             "description": " ".join(rng.choice(WORDS) for _ in range(60)), "artist": f"Artist {i % 40}",
+             "artwork_type": rng.choice(("painting", "print", "photo")), "style": rng.choice(("modern", "impressionist")),
+             "medium": rng.choice(("oil", "acrylic", "ink")), "is_sold": False, "user_id": seller.id}
+            for i in range(n)
+        ])
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--artworks", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    from app.compression import brotli, bytes_in_total, bytes_out_total, cpu_seconds_total, cache_hits_total
+
+    app = build_app(tempfile.mkdtemp(prefix="compression-"))
+    client = app.test_client()
+    r = client.post("/api/signup", json={"name": "Seller", "email": "seller@example.com", "password": "pw"})
+    if r.status_code != 200:
+        sys.exit(f"signup failed ({r.status_code}): {r.get_data(as_text=True)[:200]}")
+    add_artworks(app, args.artworks, "seller@example.com")
+
+    encodings = ["gzip", "identity"] + (["br"] if brotli is not None else [])
+    paths = ["/artworks", "/seller/artworks", "/api/artwork/1/recommendations", "/admin", "/database"]
+    for _ in range(args.repeat):
+        for path in paths:
+            for encoding in encodings:
+                client.get(path, headers={"Accept-Encoding": encoding})
+
+    rows = defaultdict(dict)
+    for metric in (bytes_in_total, bytes_out_total, cpu_seconds_total, cache_hits_total):
+        for labels, value in metric.samples():
+            rows[(labels["route"], labels["encoding"])][metric.name] = value
+    print(f"{args.artworks} artworks, {args.repeat} requests per route and encoding")
+    print(f"{'route':42} {'enc':5} {'bytes in':>11} {'bytes out':>11} {'ratio':>6} {'cpu/resp':>9} {'cache hits':>10}")
+    for (route, encoding), v in sorted(rows.items()):
+        raw, packed = v.get("compression_bytes_in_total", 0), v.get("compression_bytes_out_total", 0)
+        print(f"{route:42} {encoding:5} {raw:11,.0f} {packed:11,.0f} {raw / max(packed, 1):5.1f}x "
+              f"{v.get('compression_cpu_seconds_total', 0) / args.repeat * 1000:7.2f}ms {v.get('compression_cache_hits_total', 0):10.0f}")
+
+
+if __name__ == "__main__":
+    main()
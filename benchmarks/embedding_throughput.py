@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+CPU throughput (images/sec) of the embedding pipeline.
+
+Embeds synthetic JPEGs through the same DataLoader/model path used by
+`flask embed-artworks`, across batch sizes and loader/thread settings:
+
+    python benchmarks/embedding_throughput.py --images 256 --batch-sizes 16 32 64 --workers 0 2 4
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.embeddings import _preprocess, embed_dataset, load_model  # noqa: E402
+
+
+class InMemoryImages:
+    """Pre-encoded images held in memory, so only decoding and the model are timed."""
+
+    def __init__(self, ids, blobs):
+        self.ids = list(ids)
+        self.blobs = list(blobs)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        return self.ids[i], _preprocess(self.blobs[i])
+
+
+def synthetic_jpegs(n, size=(800, 600), seed=0):
+    rng = np.random.default_rng(seed)
+    blobs = []
+    for _ in range(n):
+        pixels = rng.integers(0, 255, size=(size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+        img = Image.fromarray(pixels).resize(size, Image.BILINEAR)
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=85)
+        blobs.append(buf.getvalue())
+    return blobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=256)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 32, 64])
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4])
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads (default: torch's choice)")
+    parser.add_argument("--weights", default=None, help="local ResNet-18 state_dict")
+    args = parser.parse_args()
+
+    blobs = synthetic_jpegs(args.images)
+    dataset = InMemoryImages(range(len(blobs)), blobs)
+    model = load_model(args.weights)
+
+    # warm-up so the first configuration doesn't pay for lazy initialisation
+    for _ in embed_dataset(model, InMemoryImages([0], blobs[:1]), batch_size=1, num_workers=0):
+        pass
+
+    for batch_size in args.batch_sizes:
+        for workers in args.workers:
+            start = time.perf_counter()
+            count = sum(len(ids) for ids, _ in embed_dataset(model, dataset, batch_size, workers, args.threads))
+            elapsed = time.perf_counter() - start
+            print(f"batch={batch_size:>3}  loader_workers={workers}  threads={args.threads or 'auto'}  "
+                  f"{count / elapsed:7.1f} images/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Concurrent-login load test.
+
+Signs up --users accounts, then fires --logins logins from --concurrency client
+threads while a probe polls a cheap endpoint (/health) to measure whether the
+server stays available for everything else. Reports login p50/p99, status
+codes (503s are shed load) and the probe's p50/p99/max latency.
+
+Against a running deployment (e.g. gunicorn with 2 workers):
+
+    python benchmarks/login_load.py --url http://127.0.0.1:8000 --concurrency 32
+
+Without --url the app is served in-process (threaded) on a scratch database;
+the hashing settings can then be varied:
+
+    python benchmarks/login_load.py --hash-workers 2 --max-pending 8 --method pbkdf2:sha256:260000
+"""
+
+import os
+import sys
+import time
+import uuid
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+
+import numpy as np
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def serve_in_process(args):
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    workdir = tempfile.mkdtemp(prefix="loginload-")
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(workdir, "load.db"),
+        "ANN_INDEX_DIR": os.path.join(workdir, "ann_index"),
+        "EMBEDDINGS_DIR": os.path.join(workdir, "embeddings"),
+        "BACKGROUND_JOBS_ENABLED": False,
+        "PASSWORD_HASH_METHOD": args.method,
+        "PASSWORD_HASH_WORKERS": args.hash_workers,
+        "PASSWORD_HASH_MAX_PENDING": args.max_pending,
+    })
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def post_with_retry(url, payload, attempts=20):
+    for _ in range(attempts):
+        r = requests.post(url, json=payload, timeout=30)
+        if r.status_code != 503:
+            return r
+        time.sleep(float(r.headers.get("Retry-After", 1)))
+    return r
+
+
+def percentiles(ms):
+    if not ms:
+        return "n/a"
+    a = np.asarray(ms)
+    return f"p50={np.percentile(a, 50):7.1f}ms p99={np.percentile(a, 99):7.1f}ms max={a.max():7.1f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base URL of a running server (default: serve in-process)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--probe-path", default="/health")
+    parser.add_argument("--probe-interval", type=float, default=0.02)
+    parser.add_argument("--method", default="pbkdf2:sha256:260000", help="in-process only")
+    parser.add_argument("--hash-workers", type=int, default=2, help="in-process only")
+    parser.add_argument("--max-pending", type=int, default=8, help="in-process only")
+    args = parser.parse_args()
+
+    server = None
+    base = args.url
+    if base is None:
+        base, server = serve_in_process(args)
+    base = base.rstrip("/")
+
+    run = uuid.uuid4().hex[:8]
+    users = [(f"load-{run}-{i}@example.com", f"pw-{i}-{run}") for i in range(args.users)]
+    for i, (email, password) in enumerate(users):
+        r = post_with_retry(base + "/api/signup", {"name": f"Load {i}", "email": email, "password": password})
+        if r.status_code != 200:
+            sys.exit(f"signup failed ({r.status_code}): {r.text[:200]}")
+
+    probe_ms, stop = [], threading.Event()
+
+    def probe():
+        with requests.Session() as s:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    s.get(base + args.probe_path, timeout=30)
+                except requests.RequestException:
+                    pass
+                probe_ms.append((time.perf_counter() - start) * 1000.0)
+                time.sleep(args.probe_interval)
+
+    def login(i):
+        email, password = users[i % len(users)]
+        start = time.perf_counter()
+        r = requests.post(base + "/api/login", json={"email": email, "password": password}, timeout=60)
+        return r.status_code, (time.perf_counter() - start) * 1000.0
+
+    probe_thread = threading.Thread(target=probe, daemon=True)
+    probe_thread.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(login, range(args.logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    probe_thread.join()
+
+    codes = Counter(code for code, _ in results)
+    ok_ms = [ms for code, ms in results if code == 200]
+    print(f"{args.logins} logins, concurrency {args.concurrency}, {elapsed:.1f}s "
+          f"({len(ok_ms) / elapsed:.1f} successful logins/sec)")
+    print(f"  status codes: {dict(sorted(codes.items()))}")
+    print(f"  login (200)   {percentiles(ok_ms)}")
+    print(f"  login (all)   {percentiles([ms for _, ms in results])}")
+    print(f"  {args.probe_path:<13} {percentiles(probe_ms)}  ({len(probe_ms)} probes)")
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
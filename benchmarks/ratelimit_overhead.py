@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Per-request cost of the rate limiter.
+
+Times `take()` on the in-process and SQLite bucket stores, over many distinct
+keys, and the full `limiter.check()` path inside a request context:
+
+    python benchmarks/ratelimit_overhead.py --calls 200000 --keys 10000
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.ratelimit import MemoryBuckets, SQLiteBuckets, parse_limit  # noqa: E402
+
+
+def per_call_us(fn, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--keys", type=int, default=10000)
+    args = parser.parse_args()
+
+    rate, burst = parse_limit("20/minute")
+    keys = [f"login:ip:10.0.{i // 256 % 256}.{i % 256}" for i in range(args.keys)]
+    workdir = tempfile.mkdtemp(prefix="ratelimit-")
+
+    memory = MemoryBuckets()
+    print(f"memory take  {per_call_us(lambda i: memory.take(keys[i % len(keys)], rate, burst), args.calls):8.2f} us/call")
+
+    sqlite_calls = min(args.calls, 20000)
+    shared = SQLiteBuckets(os.path.join(workdir, "buckets.sqlite"))
+    print(f"sqlite take  {per_call_us(lambda i: shared.take(keys[i % len(keys)], rate, burst), sqlite_calls):8.2f} us/call")
+
+    from app import create_app
+    from app.extensions import limiter
+
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(workdir, "app.db"),
+        "ANN_INDEX_DIR": os.path.join(workdir, "ann_index"),
+        "EMBEDDINGS_DIR": os.path.join(workdir, "embeddings"),
+        "BACKGROUND_JOBS_ENABLED": False,
+        "RATELIMITS": {"login": {"ip": "1000000/second"}},
+    })
+    with app.test_request_context("/api/login", method="POST", environ_base={"REMOTE_ADDR": "10.1.2.3"}):
+        print(f"check()      {per_call_us(lambda i: limiter.check('login'), args.calls):8.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Razorpay order API, for offline checkout testing.
+
+Implements POST /v1/orders and GET /v1/orders/<id> with Razorpay's response
+shape and error format, plus configurable latency and failure rate:
+
+    python benchmarks/razorpay_stub.py --port 9010 --latency-ms 80 --jitter-ms 40 --error-rate 0.01
+    RAZORPAY_BASE_URL=http://127.0.0.1:9010 RAZORPAY_KEY_ID=rzp_test_stub RAZORPAY_KEY_SECRET=stub ...
+
+Any key id/secret is accepted as long as Basic auth is sent.
+"""
+
+import os
+import time
+import uuid
+import random
+import logging
+import argparse
+import threading
+
+from flask import Flask, jsonify, request
+
+
+def _error(status, code, description):
+    return jsonify({"error": {"code": code, "description": description}}), status
+
+
+def create_stub_app(latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=None):
+    app = Flask("razorpay_stub")
+    rng = random.Random(seed)
+    orders = {}
+    lock = threading.Lock()
+    app.config["STUB_STATS"] = stats = {"orders": 0, "errors": 0}
+
+    @app.before_request
+    def simulate_gateway():
+        if not request.authorization:
+            return _error(401, "BAD_REQUEST_ERROR", "The api key provided is invalid")
+        delay = max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000.0
+        if delay:
+            time.sleep(delay)
+        if error_rate and rng.random() < error_rate:
+            stats["errors"] += 1
+            return _error(503, "SERVER_ERROR", "The server is temporarily unavailable")
+        return None
+
+    @app.route("/v1/orders", methods=["POST"])
+    def create_order():
+        data = request.get_json(silent=True) or {}
+        amount = data.get("amount")
+        if not isinstance(amount, int) or amount < 100:
+            return _error(400, "BAD_REQUEST_ERROR", "The amount must be atleast INR 1.00")
+        order = {
+            "id": "order_" + uuid.uuid4().hex[:14],
+            "entity": "order",
+            "amount": amount,
+            "amount_paid": 0,
+            "amount_due": amount,
+            "currency": data.get("currency", "INR"),
+            "receipt": data.get("receipt"),
+            "status": "created",
+            "attempts": 0,
+            "notes": data.get("notes") or [],
+            "created_at": int(time.time()),
+        }
+        with lock:
+            orders[order["id"]] = order
+            stats["orders"] += 1
+        return jsonify(order)
+
+    @app.route("/v1/orders/<order_id>", methods=["GET"])
+    def fetch_order(order_id):
+        order = orders.get(order_id)
+        if order is None:
+            return _error(400, "BAD_REQUEST_ERROR", "The id provided does not exist")
+        return jsonify(order)
+
+    return app
+
+
+def serve_in_thread(app, host="127.0.0.1", port=0):
+    """Start `app` on a threaded server in the background; returns (base_url, server)."""
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server(host, port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://{host}:{server.server_port}", server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 9010)))
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    app = create_stub_app(args.latency_ms, args.jitter_ms, args.error_rate)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
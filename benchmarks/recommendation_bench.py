@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Benchmark and quality harness for artwork recommendations.
+
+Builds synthetic catalogs (small generated images, metadata drawn from the
+ArtworkPopulator vocabularies) in a throwaway SQLite database and, for each
+recommendation engine, reports p50/p95 latency, peak Python memory and DB rows
+read per call. Every engine's rankings are compared with the reference
+implementation (the original brute-force scorer) so an optimization can't
+silently change results; the script exits non-zero when agreement drops below
+--min-agreement.
+
+    python benchmarks/recommendation_bench.py --sizes 100 1000 10000 100000
+    python benchmarks/recommendation_bench.py --sizes 1000 --engines current materialized
+"""
+
+import io
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+from sqlalchemy import event, insert
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import create_app  # noqa: E402
+from app.extensions import db, visual_index  # noqa: E402
+from app.models import Artwork  # noqa: E402
+from app.populate_artworks import ArtworkPopulator  # noqa: E402
+from app.recommendations import recommend_similar_artworks  # noqa: E402
+from app import recommendation_store  # noqa: E402
+
+
+# ---- reference implementation (the original scorer, kept verbatim in behaviour) ----
+def _reference_histogram(b, size=(64, 64)):
+    try:
+        img = Image.open(io.BytesIO(b)).convert("RGB").resize(size)
+        return img.histogram()
+    except Exception:
+        return None
+
+
+def _reference_intersection(h1, h2):
+    if not h1 or not h2:
+        return 0.0
+    s1 = sum(h1)
+    if s1 == 0:
+        return 0.0
+    return sum(min(a, b) for a, b in zip(h1, h2)) / s1
+
+
+def _reference_text(a_text, b_text):
+    if not a_text or not b_text:
+        return 0.0
+    a_words = set(re.findall(r"\w+", a_text.lower()))
+    b_words = set(re.findall(r"\w+", b_text.lower()))
+    if not a_words or not b_words:
+        return 0.0
+    return len(a_words & b_words) / len(a_words | b_words)
+
+
+def reference_recommend(artwork, top_n=5):
+    candidates = Artwork.query.filter(Artwork.id != artwork.id, Artwork.is_sold.isnot(True)).all()
+    base_hist = _reference_histogram(artwork.image_data)
+    scored = []
+    for c in candidates:
+        score = 0.0
+        if artwork.artist and c.artist and artwork.artist == c.artist:
+            score += 3.0
+        if artwork.style and c.style and artwork.style == c.style:
+            score += 2.0
+        if artwork.medium and c.medium and artwork.medium == c.medium:
+            score += 1.5
+        if artwork.artwork_type and c.artwork_type and artwork.artwork_type == c.artwork_type:
+            score += 1.0
+        score += _reference_text(artwork.description, c.description) * 3.0
+        score += _reference_intersection(base_hist, _reference_histogram(c.image_data)) * 3.0
+        scored.append((score, c))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [{"id": c.id, "score": round(s, 4)} for s, c in scored[:top_n]]
+
+
+ENGINES = {
+    "reference": reference_recommend,
+    "current": recommend_similar_artworks,
+    "materialized": lambda artwork, top_n: recommendation_store.get_recommendations(artwork, top_n)[0],
+}
+
+
+# ---- synthetic catalogs ----
+def _synthetic_image(rng, size=16):
+    base = rng.integers(0, 256, size=3)
+    gradient = np.linspace(0, rng.integers(20, 120), size)[:, None, None]
+    pixels = np.clip(base + gradient * rng.choice([-1, 1], size=3) + rng.normal(0, 12, (size, size, 3)), 0, 255)
+    buf = io.BytesIO()
+    Image.fromarray(pixels.astype(np.uint8)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def populate(n, seed=0, chunk=2000):
+    vocab = ArtworkPopulator()
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n):
+        meta = vocab.generate_artwork_metadata(f"synthetic_{i}.png")
+        meta["description"] = vocab.generate_fallback_description(
+            meta["name"], meta["artist"], meta["style"], meta["medium"], meta["artwork_type"]
+        )
+        meta.update(image_data=_synthetic_image(rng), filename=f"synthetic_{i}.png", is_sold=False)
+        rows.append(meta)
+        if len(rows) >= chunk:
+            db.session.execute(insert(Artwork), rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(Artwork), rows)
+    db.session.commit()
+
+
+# ---- instrumentation ----
+class RowCounter:
+    """Counts statements and rows returned through the ORM session."""
+
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+        event.listen(db.session, "do_orm_execute", self._on_execute)
+
+    def _on_execute(self, state):
+        if not state.is_select:
+            return None
+        frozen = state.invoke_statement().freeze()
+        self.statements += 1
+        self.rows += len(frozen.data)
+        return frozen()
+
+    def reset(self):
+        self.statements = self.rows = 0
+
+
+def _ranking(recs):
+    return [r["id"] for r in recs]
+
+
+def measure(engine, ids, top_n, counter):
+    latencies, rows, statements, rankings = [], [], [], {}
+    for artwork_id in ids:
+        db.session.expunge_all()
+        artwork = Artwork.query.get(artwork_id)
+        counter.reset()
+        start = time.perf_counter()
+        recs = engine(artwork, top_n=top_n)
+        latencies.append(time.perf_counter() - start)
+        rows.append(counter.rows)
+        statements.append(counter.statements)
+        rankings[artwork_id] = _ranking(recs)
+
+    peak = 0
+    for artwork_id in ids[:5]:
+        db.session.expunge_all()
+        artwork = Artwork.query.get(artwork_id)
+        tracemalloc.start()
+        engine(artwork, top_n=top_n)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    ms = np.asarray(latencies) * 1000.0
+    return {
+        "p50": float(np.percentile(ms, 50)),
+        "p95": float(np.percentile(ms, 95)),
+        "peak_mb": peak / 2 ** 20,
+        "rows": float(np.mean(rows)),
+        "statements": float(np.mean(statements)),
+        "rankings": rankings,
+    }
+
+
+def agreement(rankings, reference, top_n):
+    """Mean top-k overlap and the share of queries with an identical ordering."""
+    overlaps, exact = [], 0
+    for artwork_id, ref in reference.items():
+        got = rankings.get(artwork_id, [])
+        overlaps.append(len(set(got) & set(ref)) / max(len(ref), 1))
+        exact += got == ref
+    return float(np.mean(overlaps)), exact / max(len(reference), 1)
+
+
+def run_size(n, args):
+    workdir = tempfile.mkdtemp(prefix=f"recbench-{n}-")
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(workdir, "bench.db"),
+        "ANN_INDEX_DIR": os.path.join(workdir, "ann_index"),
+        "EMBEDDINGS_DIR": os.path.join(workdir, "embeddings"),
+        "BACKGROUND_JOBS_ENABLED": False,
+    })
+    with app.app_context():
+        t0 = time.perf_counter()
+        populate(n, seed=args.seed)
+        indexed = visual_index.rebuild()
+        print(f"\n== catalog {n} artworks (built in {time.perf_counter() - t0:.1f}s, {indexed} indexed) ==")
+
+        if "materialized" in args.engines:
+            t0 = time.perf_counter()
+            recommendation_store.rebuild_all()
+            print(f"   materialized rebuild: {time.perf_counter() - t0:.1f}s")
+
+        rng = random.Random(args.seed)
+        all_ids = [i for (i,) in db.session.query(Artwork.id).all()]
+        ids = rng.sample(all_ids, min(args.queries, len(all_ids)))
+        counter = RowCounter()
+
+        reference = None
+        if n <= args.reference_max_size:
+            reference = measure(reference_recommend, ids, args.top_n, counter)
+            print(f"   {'reference':<13} p50={reference['p50']:9.2f}ms p95={reference['p95']:9.2f}ms "
+                  f"peak={reference['peak_mb']:7.1f}MB rows={reference['rows']:9.0f} "
+                  f"queries={reference['statements']:5.1f}")
+
+        failed = False
+        for name in args.engines:
+            if name == "reference":
+                continue
+            result = measure(ENGINES[name], ids, args.top_n, counter)
+            line = (f"   {name:<13} p50={result['p50']:9.2f}ms p95={result['p95']:9.2f}ms "
+                    f"peak={result['peak_mb']:7.1f}MB rows={result['rows']:9.0f} "
+                    f"queries={result['statements']:5.1f}")
+            if reference is not None:
+                overlap, exact = agreement(result["rankings"], reference["rankings"], args.top_n)
+                line += f" top{args.top_n}-overlap={overlap:.3f} identical={exact:.2f}"
+                failed |= overlap < args.min_agreement
+            print(line)
+        return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--engines", nargs="+", default=["current"], choices=sorted(ENGINES))
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--top-n", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reference-max-size", type=int, default=10000,
+                        help="skip the (slow) reference comparison above this catalog size")
+    parser.add_argument("--min-agreement", type=float, default=0.9,
+                        help="minimum mean top-k overlap with the reference")
+    args = parser.parse_args()
+
+    ok = all([run_size(n, args) for n in args.sizes])
+    if not ok:
+        print("\n❌ ranking agreement with the reference dropped below --min-agreement")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Concurrency check for checkout reservations.
+
+Starts --workers app processes on one scratch SQLite database (like gunicorn
+workers) and the Razorpay stub, then for each of --rounds artworks:
+
+1. --buyers buyers fire /api/create-order at the same artwork at once, spread
+   over the workers: exactly one may get an order, the rest must get 409;
+2. the winner's verification is sent --buyers times at once (client retries
+   landing on different workers): all must succeed, exactly one may apply the
+   sale, and the artwork must end up sold;
+
+and finally checks that a hold which lapses (RESERVATION_TTL) can be taken
+over, after which the original holder can no longer buy the piece. Exits
+non-zero on any double sale.
+
+    python benchmarks/reservation_race.py --workers 4 --buyers 32 --rounds 10
+"""
+
+import io
+import os
+import sys
+import hmac
+import time
+import socket
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+from sqlalchemy import insert
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from razorpay_stub import create_stub_app, serve_in_thread  # noqa: E402
+
+KEY_SECRET = "stub-secret"
+
+
+def app_config(workdir, stub_url, ttl):
+    return {
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(workdir, "race.db"),
+        "ANN_INDEX_DIR": os.path.join(workdir, "ann_index"),
+        "EMBEDDINGS_DIR": os.path.join(workdir, "embeddings"),
+        "BACKGROUND_JOBS_ENABLED": False,
+        "RATELIMIT_ENABLED": False,
+        "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+        "RAZORPAY_BASE_URL": stub_url,
+        "RAZORPAY_KEY_ID": "rzp_test_stub",
+        "RAZORPAY_KEY_SECRET": KEY_SECRET,
+        "RESERVATION_TTL": ttl,
+    }
+
+
+def serve_worker(config, port):
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    make_server("127.0.0.1", port, create_app(config), threaded=True).serve_forever()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url + "/health", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    sys.exit(f"worker at {url} did not start")
+
+
+def add_artworks(app, n):
+    from app.extensions import db
+    from app.models import Artwork
+
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8), (40, 80, 120)).save(buf, "PNG")
+    with app.app_context():
+        start = (db.session.query(db.func.max(Artwork.id)).scalar() or 0) + 1
+        db.session.execute(insert(Artwork), [
+            {"name": f"Race {i}", "filename": f"race_{i}.png", "price": 2500, "image_data": buf.getvalue(),
+             "is_sold": False}
+            for i in range(n)
+        ])
+        db.session.commit()
+        return list(range(start, start + n))
+
+
+def artwork_state(app, artwork_id):
+    from app.extensions import db
+    from app.models import Artwork
+
+    with app.app_context():
+        row = db.session.query(Artwork.is_sold, Artwork.reserved_by).filter(Artwork.id == artwork_id).one()
+        db.session.remove()
+        return row
+
+
+def signature(order_id, payment_id):
+    return hmac.new(KEY_SECRET.encode(), f"{order_id}|{payment_id}".encode(), hashlib.sha256).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--buyers", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--ttl", type=int, default=2, help="RESERVATION_TTL for the run (seconds)")
+    args = parser.parse_args()
+
+    from app import create_app
+
+    workdir = tempfile.mkdtemp(prefix="race-")
+    stub_url, stub_server = serve_in_thread(create_stub_app(latency_ms=20, jitter_ms=10, seed=0))
+    config = app_config(workdir, stub_url, args.ttl)
+    app = create_app(config)  # creates the schema before the workers start
+    artwork_ids = add_artworks(app, args.rounds + 1)
+
+    ctx = multiprocessing.get_context("fork")
+    ports = [free_port() for _ in range(args.workers)]
+    procs = [ctx.Process(target=serve_worker, args=(config, port), daemon=True) for port in ports]
+    for p in procs:
+        p.start()
+    urls = [f"http://127.0.0.1:{port}" for port in ports]
+    for url in urls:
+        wait_ready(url)
+
+    buyers = []
+    for i in range(args.buyers):
+        s = requests.Session()
+        r = s.post(urls[i % len(urls)] + "/api/signup",
+                   json={"name": f"Buyer {i}", "email": f"buyer{i}@example.com", "password": "pw"})
+        if r.status_code != 200:
+            sys.exit(f"signup failed ({r.status_code}): {r.text[:200]}")
+        buyers.append(s)
+
+    def at_once(fn):
+        barrier = threading.Barrier(len(buyers))
+
+        def run(i):
+            barrier.wait()
+            return fn(i)
+
+        with ThreadPoolExecutor(max_workers=len(buyers)) as pool:
+            return list(pool.map(run, range(len(buyers))))
+
+    failures = 0
+    for artwork_id in artwork_ids[:-1]:
+        orders = at_once(lambda i: buyers[i].post(urls[i % len(urls)] + "/api/create-order",
+                                                  json={"artwork_id": artwork_id}, timeout=60))
+        created = Counter(r.status_code for r in orders)
+        winners = [i for i, r in enumerate(orders) if r.status_code == 200]
+        if len(winners) != 1:
+            failures += 1
+            print(f"artwork {artwork_id}: create-order {dict(created)}  DOUBLE RESERVATION")
+            continue
+        winner = winners[0]
+        order_id = orders[winner].json()["order_id"]
+        payment_id = f"pay_race{artwork_id}"
+
+        def verify(i):
+            return buyers[winner].post(urls[i % len(urls)] + "/api/verify-payment", json={
+                "razorpay_order_id": order_id,
+                "razorpay_payment_id": payment_id,
+                "razorpay_signature": signature(order_id, payment_id),
+            }, timeout=60)
+
+        replies = at_once(verify)
+        verified = Counter(r.status_code for r in replies)
+        applied = sum(r.status_code == 200 and "already" not in r.json().get("message", "") for r in replies)
+        is_sold, reserved_by = artwork_state(app, artwork_id)
+        ok = verified[200] == len(replies) and applied == 1 and is_sold and reserved_by is None
+        failures += not ok
+        print(f"artwork {artwork_id}: create-order {dict(created)}  verify {dict(verified)} applied={applied}  "
+              f"sold={bool(is_sold)}  {'OK' if ok else 'FAILED'}")
+
+    # A lapsed hold can be taken over, and the first buyer can then no longer buy.
+    artwork_id = artwork_ids[-1]
+    first = buyers[0].post(urls[0] + "/api/create-order", json={"artwork_id": artwork_id}).json()
+    blocked = buyers[1].post(urls[-1] + "/api/create-order", json={"artwork_id": artwork_id}).status_code
+    time.sleep(args.ttl + 0.5)
+    second = buyers[1].post(urls[-1] + "/api/create-order", json={"artwork_id": artwork_id}).json()
+    late = buyers[0].post(urls[0] + "/api/verify-payment", json={
+        "razorpay_order_id": first["order_id"], "razorpay_payment_id": "pay_late",
+        "razorpay_signature": signature(first["order_id"], "pay_late"), "artwork_id": artwork_id,
+    }).status_code
+    on_time = buyers[1].post(urls[-1] + "/api/verify-payment", json={
+        "razorpay_order_id": second["order_id"], "razorpay_payment_id": "pay_on_time",
+        "razorpay_signature": signature(second["order_id"], "pay_on_time"), "artwork_id": artwork_id,
+    }).status_code
+    ok = blocked == 409 and second.get("success") and late == 409 and on_time == 200
+    failures += not ok
+    print(f"lapsed hold: blocked={blocked} takeover={second.get('success')} late_verify={late} "
+          f"holder_verify={on_time}  {'OK' if ok else 'FAILED'}")
+
+    for p in procs:
+        p.terminate()
+    stub_server.shutdown()
+    if failures:
+        print(f"\n❌ {failures} reservation check(s) failed")
+        sys.exit(1)
+    print("\n✅ no artwork was sold twice")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Do slow GLB downloads starve the rest of the site?
+
+Runs gunicorn on a scratch database twice: once with the old profile (2 sync
+workers) and once with gunicorn.conf.py (threaded workers). In each run,
+--slow-clients clients download a --glb-mb MB GLB at --rate-kb KB/s, like
+phones on a poor connection, while a probe fetches /artworks every 200 ms for
+--duration seconds. Reports the probe's p50/p99 and how many requests timed out:
+
+    python benchmarks/slow_downloads.py --slow-clients 8 --duration 15
+"""
+
+import os
+import sys
+import time
+import socket
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import numpy as np
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+
+def serve_app():
+    """Gunicorn app factory for the scratch database (`slow_downloads:serve_app()`)."""
+    from app import create_app
+
+    workdir = os.environ["SLOW_DOWNLOADS_DIR"]
+    return create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(workdir, "downloads.db"),
+        "ANN_INDEX_DIR": os.path.join(workdir, "ann_index"),
+        "EMBEDDINGS_DIR": os.path.join(workdir, "embeddings"),
+        "BACKGROUND_JOBS_ENABLED": False,
+        "RATELIMIT_ENABLED": False,
+    })
+
+
+def seed(workdir, artworks, glb_mb):
+    import io
+    from PIL import Image
+    from sqlalchemy import insert
+    from app.extensions import db
+    from app.models import Artwork
+
+    os.environ["SLOW_DOWNLOADS_DIR"] = workdir
+    app = serve_app()
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8), (30, 60, 90)).save(buf, "PNG")
+    glb = os.urandom(int(glb_mb * 1024 * 1024))
+    with app.app_context():
+        db.session.execute(insert(Artwork), [
+            {"name": f"Slow {i}", "filename": f"slow_{i}.png", "price": 1000, "image_data": buf.getvalue(),
+             "glb_data": glb, "description": "A sculpture " * 20, "is_sold": False}
+            for i in range(artworks)
+        ])
+        db.session.commit()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(port, workdir, extra):
+    cmd = [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+           "--bind", f"127.0.0.1:{port}", "--pythonpath", f"{ROOT},{os.path.dirname(__file__)}",
+           "--log-level", "warning", *extra, "slow_downloads:serve_app()"]
+    proc = subprocess.Popen(cmd, env=dict(os.environ, SLOW_DOWNLOADS_DIR=workdir), cwd=ROOT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/health", timeout=1)
+            return proc
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    sys.exit("gunicorn did not start")
+
+
+def slow_download(port, path, rate, stop):
+    # A small receive window makes the server block on send, as it would for a phone.
+    s = socket.socket()
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
+    s.connect(("127.0.0.1", port))
+    s.sendall(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode())
+    received = 0
+    try:
+        while not stop.is_set():
+            data = s.recv(4096)
+            if not data:
+                break
+            received += len(data)
+            time.sleep(len(data) / rate)
+    except OSError:
+        pass  # the server was stopped mid-download
+    finally:
+        s.close()
+    return received
+
+
+def run_profile(name, port, workdir, extra, args):
+    proc = start_gunicorn(port, workdir, extra)
+    stop = threading.Event()
+    downloads = [
+        threading.Thread(target=slow_download, args=(port, f"/artwork/{i % args.artworks + 1}/glb",
+                                                     args.rate_kb * 1024, stop), daemon=True)
+        for i in range(args.slow_clients)
+    ]
+    for t in downloads:
+        t.start()
+    time.sleep(1.0)  # let the downloads occupy the workers
+
+    latencies, timeouts = [], 0
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            r = requests.get(f"http://127.0.0.1:{port}/artworks", timeout=args.probe_timeout)
+            r.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000.0)
+        except requests.RequestException:
+            timeouts += 1
+        time.sleep(0.2)
+
+    stop.set()
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+    summary = "no successful requests"
+    if latencies:
+        ms = np.asarray(latencies)
+        summary = f"p50={np.percentile(ms, 50):8.1f}ms p99={np.percentile(ms, 99):8.1f}ms"
+    print(f"{name:30} /artworks ok={len(latencies):3d} timed out={timeouts:3d}  {summary}")
+    return timeouts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slow-clients", type=int, default=8)
+    parser.add_argument("--artworks", type=int, default=4)
+    parser.add_argument("--glb-mb", type=float, default=8.0)
+    parser.add_argument("--rate-kb", type=float, default=64.0, help="download speed of each slow client")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--probe-timeout", type=float, default=5.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="slow-downloads-")
+    seed(workdir, args.artworks, args.glb_mb)
+    print(f"{args.slow_clients} clients downloading {args.glb_mb:.0f} MB GLBs at {args.rate_kb:.0f} KB/s")
+    run_profile("sync, 2 workers", free_port(), workdir, ["--worker-class", "sync", "--workers", "2", "--threads", "1"], args)
+    failed = run_profile("gunicorn.conf.py (gthread)", free_port(), workdir, [], args)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Mixed read/write load on SQLite, before and after the production profile.
+
+For each profile, library defaults (rollback journal, synchronous=FULL, no
+mmap, SQLITE_TUNED=False) and then the tuned one (WAL, synchronous=NORMAL,
+busy timeout, mmap, larger cache), this creates a scratch database with
+--catalog artworks and starts --workers app processes on it. For --seconds,
+--readers clients then poll /artworks and artwork details while --writers
+clients upload new artworks through /make-glb. It reports the readers'
+p50/p99/max, the failed reads and writes (e.g. "database is locked"), and the
+WAL size at the end:
+
+    python benchmarks/sqlite_contention.py --workers 4 --readers 16 --writers 4 --seconds 20
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from collections import Counter
+
+import numpy as np
+import requests
+from PIL import Image
+from sqlalchemy import insert
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from reservation_race import free_port, serve_worker, wait_ready  # noqa: E402
+from write_load import percentile  # noqa: E402
+
+
+def app_config(workdir, tuned):
+    return {
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(workdir, "contention.db"),
+        "ANN_INDEX_DIR": os.path.join(workdir, "ann_index"),
+        "EMBEDDINGS_DIR": os.path.join(workdir, "embeddings"),
+        "METRICS_DIR": os.path.join(workdir, "metrics"),
+        "BACKGROUND_JOBS_ENABLED": tuned,  # the tuned profile includes the checkpoint job
+        "SQLITE_CHECKPOINT_INTERVAL": 5,
+        "RATELIMIT_ENABLED": False,
+        "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+        "PROFILE_SLOW_REQUEST_MS": 60000,
+        "SQLITE_TUNED": tuned,
+    }
+
+
+def add_artworks(app, n):
+    from app.extensions import db
+    from app.models import Artwork
+
+    styles = ["Abstract", "Realism", "Impressionism", "Cubism"]
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 64), (90, 60, 140)).save(buf, "PNG")
+    with app.app_context():
+        ids = list(db.session.scalars(insert(Artwork).returning(Artwork.id), [
+            {"name": f"Catalog {i}", "filename": f"catalog_{i}.png", "price": 900 + i, "artist": f"Artist {i % 9}",
+             "style": styles[i % 4], "description": f"catalog piece {i} " * 8, "image_data": buf.getvalue(),
+             "is_sold": False}
+            for i in range(n)
+        ]))
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+    return ids
+
+
+def upload_image(i, size):
+    buf = io.BytesIO()
+    rng = np.random.default_rng(i)
+    Image.fromarray(rng.integers(0, 255, (size, size, 3), dtype=np.uint8)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def run(tuned, args):
+    from app import create_app
+
+    workdir = tempfile.mkdtemp(prefix="contention-")
+    config = app_config(workdir, tuned)
+    app = create_app(config)
+    artwork_ids = add_artworks(app, args.catalog)
+
+    ctx = multiprocessing.get_context("fork")
+    ports = [free_port() for _ in range(args.workers)]
+    procs = [ctx.Process(target=serve_worker, args=(config, port), daemon=True) for port in ports]
+    for p in procs:
+        p.start()
+    urls = [f"http://127.0.0.1:{port}" for port in ports]
+    for url in urls:
+        wait_ready(url)
+
+    seller = requests.Session()
+    r = seller.post(urls[0] + "/api/signup", json={"name": "Seller", "email": "seller@example.com", "password": "pw"})
+    if r.status_code != 200:
+        sys.exit(f"signup failed ({r.status_code}): {r.text[:200]}")
+    cookies = seller.cookies.get_dict()
+    images = [upload_image(i, args.image_size) for i in range(8)]
+
+    reads, writes = [], []
+    deadline = time.monotonic() + args.seconds
+
+    def reader(n):
+        rng = random.Random(n)
+        while time.monotonic() < deadline:
+            url = urls[rng.randrange(len(urls))]
+            path = "/artworks" if rng.random() < 0.5 else f"/api/artwork/{rng.choice(artwork_ids)}"
+            started = time.perf_counter()
+            try:
+                status = requests.get(url + path, timeout=60).status_code
+            except requests.RequestException:
+                status = "error"
+            reads.append((status, (time.perf_counter() - started) * 1000.0))
+
+    def writer(n):
+        i = 0
+        while time.monotonic() < deadline:
+            url = urls[(n + i) % len(urls)]
+            try:
+                r = requests.post(url + "/make-glb", cookies=cookies, timeout=120, data={
+                    "name": f"Upload {n}-{i}", "artist": f"Artist {n}", "style": "Abstract", "price": "1200",
+                }, files={"image": (f"upload_{n}_{i}.png", images[(n + i) % len(images)], "image/png")})
+                writes.append((r.status_code, r.text[:160] if r.status_code != 200 else ""))
+            except requests.RequestException as e:
+                writes.append(("error", str(e)[:160]))
+            i += 1
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(args.writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for p in procs:
+        p.terminate()
+
+    wal = os.path.join(workdir, "contention.db-wal")
+    ok = [ms for status, ms in reads if status == 200]
+    name = "tuned (WAL)" if tuned else "defaults"
+    print(f"\n{name}: {len(reads)} reads, {len(writes)} uploads in {args.seconds}s")
+    print(f"  reads   statuses={dict(Counter(s for s, _ in reads))}  p50={percentile(ok, 50):.0f}ms "
+          f"p99={percentile(ok, 99):.0f}ms max={max(ok, default=float('nan')):.0f}ms")
+    print(f"  uploads statuses={dict(Counter(s for s, _ in writes))}")
+    for error, count in Counter(e for s, e in writes if s != 200).most_common(2):
+        print(f"    {count} x {error}")
+    wal_size = os.path.getsize(wal) if os.path.exists(wal) else 0
+    print(f"  WAL at end: {wal_size / 1e6:.1f} MB")
+    return {
+        "name": name, "reads": len(reads), "p50": percentile(ok, 50), "p99": percentile(ok, 99),
+        "read_failures": len(reads) - len(ok), "uploads": sum(s == 200 for s, _ in writes),
+        "upload_failures": sum(s != 200 for s, _ in writes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--catalog", type=int, default=300, help="artworks in the database before the run")
+    parser.add_argument("--image-size", type=int, default=384, help="uploaded image edge in pixels")
+    args = parser.parse_args()
+
+    results = [run(False, args), run(True, args)]
+    print(f"\n{'profile':14} {'reads':>7} {'p50':>8} {'p99':>8} {'failed':>7} {'uploads':>8} {'failed':>7}")
+    for r in results:
+        print(f"{r['name']:14} {r['reads']:7d} {r['p50']:6.0f}ms {r['p99']:6.0f}ms {r['read_failures']:7d} "
+              f"{r['uploads']:8d} {r['upload_failures']:7d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Replay signed Razorpay webhook events against the app.
+
+Offline (default): serves the app and `razorpay_stub.py` in-process on a
+scratch database, checks out --orders artworks without ever calling
+/api/verify-payment (the buyer "closed the tab"), then fires a burst of
+payment.captured and order.paid events for every order, each delivered
+--duplicates times, from --concurrency threads. It then drains the queue with
+the background consumer and checks that every order is paid, every artwork is
+sold, and each event was applied once. Reports webhook p50/p99 and how long the
+consumer took:
+
+    python benchmarks/webhook_replayer.py --orders 200 --duplicates 3 --concurrency 16
+
+--record FILE also writes the generated events as JSON lines
+({"event_id": ..., "body": {...}}) which can later be replayed at a running
+server (whose queue its own consumer drains):
+
+    python benchmarks/webhook_replayer.py --file events.jsonl --url http://127.0.0.1:5000 --secret whsec
+"""
+
+import io
+import os
+import sys
+import hmac
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from PIL import Image
+from sqlalchemy import insert
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from razorpay_stub import create_stub_app, serve_in_thread  # noqa: E402
+
+WEBHOOK_SECRET = "whsec-replayer"
+
+
+def start_app(stub_url, workdir):
+    from app import create_app
+
+    return create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(workdir, "webhooks.db"),
+        "ANN_INDEX_DIR": os.path.join(workdir, "ann_index"),
+        "EMBEDDINGS_DIR": os.path.join(workdir, "embeddings"),
+        "BACKGROUND_JOBS_ENABLED": False,
+        "RATELIMIT_ENABLED": False,
+        "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+        "RAZORPAY_BASE_URL": stub_url,
+        "RAZORPAY_KEY_ID": "rzp_test_stub",
+        "RAZORPAY_KEY_SECRET": "stub-secret",
+        "RAZORPAY_WEBHOOK_SECRET": WEBHOOK_SECRET,
+    })
+
+
+def add_artworks(app, n):
+    from app.extensions import db
+    from app.models import Artwork
+
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8), (60, 120, 90)).save(buf, "PNG")
+    with app.app_context():
+        start = (db.session.query(db.func.max(Artwork.id)).scalar() or 0) + 1
+        db.session.execute(insert(Artwork), [
+            {"name": f"Webhook {i}", "filename": f"webhook_{i}.png", "price": 1500 + i,
+             "image_data": buf.getvalue(), "is_sold": False}
+            for i in range(n)
+        ])
+        db.session.commit()
+        return list(range(start, start + n))
+
+
+def payment_events(order_id, payment_id, amount):
+    """payment.captured and order.paid for one order, shaped like Razorpay's webhook bodies."""
+    now = int(time.time())
+    payment = {"id": payment_id, "entity": "payment", "amount": amount, "currency": "INR",
+               "status": "captured", "order_id": order_id, "captured": True, "created_at": now}
+    order = {"id": order_id, "entity": "order", "amount": amount, "amount_paid": amount, "amount_due": 0,
+             "currency": "INR", "status": "paid", "created_at": now}
+    return [
+        {"event_id": f"evt_{payment_id}_captured",
+         "body": {"entity": "event", "account_id": "acc_replayer", "event": "payment.captured",
+                  "contains": ["payment"], "payload": {"payment": {"entity": payment}}, "created_at": now}},
+        {"event_id": f"evt_{payment_id}_paid",
+         "body": {"entity": "event", "account_id": "acc_replayer", "event": "order.paid",
+                  "contains": ["payment", "order"],
+                  "payload": {"payment": {"entity": payment}, "order": {"entity": order}}, "created_at": now}},
+    ]
+
+
+def deliver(url, secret, events, concurrency):
+    """POST each event signed like Razorpay; returns [(status, queue status, ms)]."""
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def post(event):
+        body = json.dumps(event["body"], separators=(",", ":")).encode()
+        headers = {
+            "Content-Type": "application/json",
+            "X-Razorpay-Signature": hmac.new(secret.encode(), body, hashlib.sha256).hexdigest(),
+        }
+        if event.get("event_id"):
+            headers["X-Razorpay-Event-Id"] = event["event_id"]
+        start = time.perf_counter()
+        resp = session.post(url + "/api/razorpay/webhook", data=body, headers=headers, timeout=30)
+        ms = (time.perf_counter() - start) * 1000.0
+        queued = resp.json().get("status") if resp.headers.get("Content-Type", "").startswith("application/json") else None
+        return resp.status_code, queued, ms
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(post, events))
+
+
+def report(results, elapsed):
+    ms = np.asarray([m for _, _, m in results] or [0.0])
+    print(f"{len(results)} deliveries in {elapsed:.2f}s ({len(results) / elapsed:.0f}/sec)")
+    print(f"  status codes: {dict(sorted(Counter(code for code, _, _ in results).items()))}  "
+          f"queue: {dict(Counter(q for _, q, _ in results))}")
+    print(f"  webhook p50={np.percentile(ms, 50):.1f}ms p99={np.percentile(ms, 99):.1f}ms max={ms.max():.1f}ms")
+
+
+def replay_file(args):
+    with open(args.file) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    # Raw webhook bodies are accepted too; their event id then falls back to the body hash.
+    events = [e if "body" in e else {"body": e} for e in events] * args.duplicates
+    started = time.perf_counter()
+    results = deliver(args.url.rstrip("/"), args.secret, events, args.concurrency)
+    report(results, time.perf_counter() - started)
+
+
+def run_offline(args):
+    from app.extensions import db
+    from app.models import Artwork, Order, PaymentEvent
+    from app.payment_events import apply_payment_events
+
+    stub_url, stub_server = serve_in_thread(create_stub_app(seed=0))
+    app = start_app(stub_url, tempfile.mkdtemp(prefix="webhooks-"))
+    base, app_server = serve_in_thread(app)
+    artwork_ids = add_artworks(app, args.orders)
+
+    buyer = requests.Session()
+    r = buyer.post(base + "/api/signup", json={"name": "Buyer", "email": "buyer@example.com", "password": "pw"})
+    if r.status_code != 200:
+        sys.exit(f"signup failed ({r.status_code}): {r.text[:200]}")
+    orders = []
+    for artwork_id in artwork_ids:
+        r = buyer.post(base + "/api/create-order", json={"artwork_id": artwork_id})
+        if r.status_code != 200:
+            sys.exit(f"create-order failed ({r.status_code}): {r.text[:200]}")
+        orders.append(r.json())
+
+    events = [e for o in orders for e in payment_events(o["order_id"], "pay_" + o["order_id"][6:], o["amount"])]
+    # A bad signature must be refused before anything is queued.
+    forged = deliver(base, "not-the-secret", events[:1], 1)[0][0]
+    if args.record:
+        with open(args.record, "w") as f:
+            f.writelines(json.dumps(e) + "\n" for e in events)
+        print(f"recorded {len(events)} events to {args.record}")
+
+    burst = events * args.duplicates
+    started = time.perf_counter()
+    results = deliver(base, WEBHOOK_SECRET, burst, args.concurrency)
+    report(results, time.perf_counter() - started)
+
+    with app.app_context():
+        started = time.perf_counter()
+        applied = apply_payment_events()
+        elapsed = time.perf_counter() - started
+        print(f"consumer applied {applied} queued events in {elapsed * 1000:.0f}ms")
+        applied_again = apply_payment_events()
+        order_status = Counter(s for (s,) in db.session.query(Order.status))
+        sold = db.session.query(Artwork.id).filter(Artwork.id.in_(artwork_ids), Artwork.is_sold.is_(True)).count()
+        outcomes = Counter(o for (o,) in db.session.query(PaymentEvent.outcome))
+        queued = db.session.query(PaymentEvent.id).count()
+
+    print(f"  orders: {dict(order_status)}  artworks sold: {sold}/{len(artwork_ids)}  event outcomes: {dict(outcomes)}")
+    checks = {
+        "forged event refused": forged == 400,
+        "every delivery acknowledged": all(code == 200 for code, _, _ in results),
+        "duplicates queued once": queued == len(events),
+        "every order paid": order_status == Counter({"paid": len(orders)}),
+        "every artwork sold": sold == len(artwork_ids),
+        "every event applied": outcomes["paid"] + outcomes["already_paid"] == len(events),
+        "nothing left to apply": applied_again == 0,
+    }
+    app_server.shutdown()
+    stub_server.shutdown()
+    failed = [name for name, ok in checks.items() if not ok]
+    if failed:
+        print(f"\n❌ failed: {', '.join(failed)}")
+        sys.exit(1)
+    print("\n✅ every order settled from webhooks alone")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=100)
+    parser.add_argument("--duplicates", type=int, default=3, help="times each event is delivered")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--record", help="write the generated events to this JSON lines file")
+    parser.add_argument("--file", help="replay events from this JSON lines file instead")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="server to replay --file against")
+    parser.add_argument("--secret", default=os.environ.get("RAZORPAY_WEBHOOK_SECRET", ""))
+    args = parser.parse_args()
+
+    if args.file:
+        replay_file(args)
+    else:
+        run_offline(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -113,24 +113,35 @@ export default function Buyer() {
   const handleCheckout = async () => {
     try {
       if (cart.length === 0) { alert('Cart is empty!'); return; }
-      const artwork = cart[0];
-      if (!artwork.price) { alert('This artwork has no price, cannot checkout.'); return; }
+      const unpriced = cart.find((item) => !item.price);
+      if (unpriced) { alert(`"${unpriced.name}" has no price, cannot checkout.`); return; }
+      const artworkIds = cart.map((item) => item.id);
 
-      const res = await fetch(`${API_BASE}/api/create-order`, {
+      const res = await fetch(`${API_BASE}/api/create-cart-order`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         credentials: 'include',
-        body: JSON.stringify({ artwork_id: artwork.id }),
+        body: JSON.stringify({ artwork_ids: artworkIds }),
       });
       const orderData = await res.json().catch(() => ({}));
-      if (!res.ok || !orderData.success) { alert(orderData.error || 'Failed to create order'); return; }
+      if (!res.ok || !orderData.success) {
+        const unavailable = Object.keys(orderData.items || {}).map(Number);
+        if (unavailable.length) {
+          const names = cart.filter((item) => unavailable.includes(item.id)).map((item) => item.name);
+          alert(`${orderData.error}: ${names.join(', ')}`);
+          setCart((prev) => prev.filter((item) => !unavailable.includes(item.id)));
+        } else {
+          alert(orderData.error || 'Failed to create order');
+        }
+        return;
+      }
 
       const options = {
         key: orderData.key_id,
         amount: orderData.amount,
         currency: orderData.currency,
         name: 'ArtVerse',
-        description: `Payment for ${artwork.name}`,
+        description: cart.length === 1 ? `Payment for ${cart[0].name}` : `Payment for ${cart.length} artworks`,
         order_id: orderData.order_id,
         handler: async function (response) {
           try {
@@ -142,7 +153,6 @@ export default function Buyer() {
                 razorpay_order_id: response.razorpay_order_id,
                 razorpay_payment_id: response.razorpay_payment_id,
                 razorpay_signature: response.razorpay_signature,
-                artwork_id: artwork.id,
               }),
             });
             const verifyData = await verifyRes.json().catch(() => ({}));
@@ -151,7 +161,7 @@ export default function Buyer() {
               return;
             }
             alert('✅ Payment successful! Artwork marked as SOLD.');
-            setCart((prev) => prev.filter((i) => i.id !== artwork.id));
+            setCart((prev) => prev.filter((i) => !artworkIds.includes(i.id)));
             setShowCart(false);
             loadArtworks();
           } catch (err) {
@@ -0,0 +1,41 @@
+"""
+Gunicorn serving profile: threaded (gthread) workers.
+
+Sync workers serve one connection at a time, so a couple of slow mobile
+clients downloading GLBs could occupy every worker and stall the whole site. A
+gthread worker runs GUNICORN_THREADS requests concurrently, so a slow download
+ties up a single thread. The app is thread-safe under it: Flask-SQLAlchemy
+scopes sessions to the request's app context, blob routes hand their database
+connection back before the download starts (see artworks._send_blob), and the
+background jobs and hashing pool are started per worker process.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Each worker has its own database pool of DB_POOL_SIZE connections plus
+DB_MAX_OVERFLOW (10 + 5 = 15 by default, see app/config.py). Keep
+GUNICORN_THREADS plus the background jobs within that: the default 12 threads
+leave 3 for the jobs. A server database must allow WEB_CONCURRENCY times the
+pool (30 connections for the default 2 workers).
+
+Don't enable preload_app: the background job threads must be started in each
+worker, not in the master before forking.
+"""
+
+import os
+import shutil
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 7861)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 12))
+# Heartbeats come from the worker's main loop, so a long download doesn't trip this.
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    # Each worker shares its metrics through METRICS_DIR (see app/metrics.py);
+    # snapshots left by a previous run would otherwise count as dead workers' totals.
+    directory = os.environ.get("METRICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "metrics"))
+    shutil.rmtree(directory, ignore_errors=True)